@@ -0,0 +1,347 @@
+"""Return, risk and margin metrics computed locally, for any number of tickers at once.
+
+    dates, symbols, closes = close_matrix(histories)       # {symbol: PriceHistory}
+    prices = price_metrics(dates, symbols, closes, benchmark="^GSPC")
+    margins = margin_metrics(statements)                   # {symbol: income statement dict}
+
+Every ticker is a column of one (dates x tickers) close matrix, so CAGR,
+volatility, drawdown, beta and rolling returns are each a handful of NumPy
+reductions over axis 0 rather than a loop over tickers; margins work the
+same way on a (tickers x line items x years) array. The markdown helpers
+turn the results into the compact tables the section prompts get, so GPT
+quotes the figures instead of doing the arithmetic itself.
+
+    python analytics.py tickers.txt --out metrics.csv    # a coverage universe
+    python analytics.py --synthetic 500                   # timing without Yahoo
+"""
+import argparse
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from prompt_builder import format_compact_number
+
+TRADING_DAYS = 252
+MIN_RETURNS = 20  # Fewer daily returns than this give no volatility or beta
+
+# column: (label, kind); kinds decide formatting
+PRICE_COLUMNS = {
+    "return_3m": ("3M Return", "percent"),
+    "return_1y": ("1Y Return", "percent"),
+    "cagr_3y": ("3Y CAGR", "percent"),
+    "cagr_5y": ("5Y CAGR", "percent"),
+    "volatility": ("Volatility (1Y, ann.)", "percent"),
+    "max_drawdown": ("Max Drawdown", "percent"),
+    "beta": ("Beta (1Y)", "plain"),
+    "rolling_1y_median": ("Median Rolling 1Y", "percent"),
+    "rolling_1y_worst": ("Worst Rolling 1Y", "percent"),
+}
+# Income statement rows used for margins, in the order of the line-item axis
+STATEMENT_ROWS = ["Total Revenue", "Gross Profit", "Operating Income", "Net Income"]
+MARGIN_COLUMNS = {
+    "revenue_cagr": ("Revenue CAGR", "percent"),
+    "gross_margin": ("Gross Margin", "percent"),
+    "gross_margin_change": ("Gross Margin Chg", "points"),
+    "operating_margin": ("Op. Margin", "percent"),
+    "operating_margin_change": ("Op. Margin Chg", "points"),
+    "net_margin": ("Net Margin", "percent"),
+    "net_margin_change": ("Net Margin Chg", "points"),
+}
+
+
+def close_matrix(histories: Dict[str, object]):
+    """`(dates, symbols, closes)` with every ticker's closes on one shared date axis.
+
+    `histories` maps symbols to price_store.PriceHistory (anything with
+    `dates` and `close`). A ticker with no bar on a date (a holiday on its
+    exchange, or before it listed) carries its last close forward; before its
+    first bar it is NaN.
+    """
+    symbols = [symbol for symbol, history in histories.items() if len(history.dates)]
+    if not symbols:
+        return np.empty(0, dtype="datetime64[ns]"), [], np.empty((0, 0))
+    all_dates = np.concatenate([histories[symbol].dates for symbol in symbols])
+    all_closes = np.concatenate([np.asarray(histories[symbol].close, dtype=float) for symbol in symbols])
+    columns = np.repeat(np.arange(len(symbols)), [len(histories[symbol].dates) for symbol in symbols])
+    dates = np.unique(all_dates)
+    closes = np.full((len(dates), len(symbols)), np.nan)
+    closes[np.searchsorted(dates, all_dates), columns] = all_closes
+
+    # Forward fill: index of the last valid row at or above each cell, per column
+    rows = np.where(~np.isnan(closes), np.arange(len(dates))[:, None], 0)
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    return dates, symbols, closes[rows, np.arange(len(symbols))]
+
+
+def _row_at(dates: np.ndarray, offset: pd.DateOffset) -> Optional[int]:
+    """Row of the first date on or after `offset` before the last date; None if history is shorter."""
+    target = np.datetime64(pd.Timestamp(dates[-1]) - offset, "ns")
+    if target < dates[0]:
+        return None
+    return int(np.searchsorted(dates, target, side="left"))
+
+
+def _since(closes: np.ndarray, row: Optional[int]) -> np.ndarray:
+    """Growth factor from `row` to the last row, per ticker."""
+    if row is None:
+        return np.full(closes.shape[1], np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return closes[-1] / closes[row]
+
+
+def _beta(returns: np.ndarray, market: np.ndarray) -> np.ndarray:
+    """Beta of each column of `returns` against `market`, over the rows where both exist."""
+    valid = ~np.isnan(returns) & ~np.isnan(market)[:, None]
+    counts = valid.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        r = np.where(valid, returns, 0.0)
+        m = np.where(valid, market[:, None], 0.0)
+        r_mean, m_mean = r.sum(axis=0) / counts, m.sum(axis=0) / counts
+        covariance = (np.where(valid, (r - r_mean) * (m - m_mean), 0.0)).sum(axis=0)
+        variance = (np.where(valid, (m - m_mean) ** 2, 0.0)).sum(axis=0)
+        beta = covariance / variance
+    return np.where(counts >= MIN_RETURNS, beta, np.nan)
+
+
+def price_metrics(dates: np.ndarray, symbols: List[str], closes: np.ndarray,
+                  benchmark: Optional[str] = None, window_years: int = 0) -> pd.DataFrame:
+    """One row per ticker, one column per PRICE_COLUMNS entry, from a close_matrix.
+
+    Trailing returns and CAGRs run to the last shared date; volatility and
+    beta use the last year of daily log returns (beta against the
+    `benchmark` column, if it is one of `symbols`); drawdown and rolling
+    1-year returns use the last `window_years` (the whole matrix if 0).
+    A 5Y CAGR needs a bar from at least five years before the last date,
+    so load a longer history than the window rather than exactly 5y.
+    """
+    if closes.size == 0:
+        return pd.DataFrame(columns=list(PRICE_COLUMNS))
+    metrics = {
+        "return_3m": _since(closes, _row_at(dates, pd.DateOffset(months=3))) - 1,
+        "return_1y": _since(closes, _row_at(dates, pd.DateOffset(years=1))) - 1,
+        "cagr_3y": _since(closes, _row_at(dates, pd.DateOffset(years=3))) ** (1 / 3) - 1,
+        "cagr_5y": _since(closes, _row_at(dates, pd.DateOffset(years=5))) ** (1 / 5) - 1,
+    }
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        log_returns = np.diff(np.log(closes), axis=0)
+    last_year = log_returns[_row_at(dates, pd.DateOffset(years=1)) or 0:]
+    enough = (~np.isnan(last_year)).sum(axis=0) >= MIN_RETURNS
+    metrics["volatility"] = np.full(len(symbols), np.nan)
+    metrics["volatility"][enough] = np.nanstd(last_year[:, enough], axis=0, ddof=1) * np.sqrt(TRADING_DAYS)
+
+    if window_years:
+        closes = closes[_row_at(dates, pd.DateOffset(years=window_years)) or 0:]
+
+    # fmin/fmax skip NaN, so tickers that listed later need no special case
+    with np.errstate(invalid="ignore"):
+        drawdowns = closes / np.fmax.accumulate(closes, axis=0) - 1
+    metrics["max_drawdown"] = np.fmin.reduce(drawdowns, axis=0)
+
+    if benchmark in symbols:
+        metrics["beta"] = _beta(last_year, last_year[:, symbols.index(benchmark)])
+    else:
+        metrics["beta"] = np.full(len(symbols), np.nan)
+
+    # Every 1-year holding period in the window, not just the latest one
+    metrics["rolling_1y_median"] = np.full(len(symbols), np.nan)
+    metrics["rolling_1y_worst"] = np.full(len(symbols), np.nan)
+    if len(closes) > TRADING_DAYS:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            rolling = closes[TRADING_DAYS:] / closes[:-TRADING_DAYS] - 1
+        has = ~np.isnan(rolling).all(axis=0)
+        metrics["rolling_1y_median"][has] = np.nanmedian(rolling[:, has], axis=0)
+        metrics["rolling_1y_worst"] = np.fmin.reduce(rolling, axis=0)
+    return pd.DataFrame(metrics, index=symbols)[list(PRICE_COLUMNS)]
+
+
+def statement_dict(income_stmt: pd.DataFrame) -> dict:
+    """The STATEMENT_ROWS of a yfinance `Ticker.income_stmt`, oldest year first, as plain JSON."""
+    if income_stmt is None or income_stmt.empty:
+        return {"years": [], "rows": {}}
+    ordered = income_stmt.sort_index(axis=1)
+    return {
+        "years": [str(pd.Timestamp(column).year) for column in ordered.columns],
+        "rows": {row: [None if pd.isna(value) else float(value) for value in ordered.loc[row]]
+                 for row in STATEMENT_ROWS if row in ordered.index},
+    }
+
+
+def statement_array(statements: Dict[str, dict]):
+    """`(symbols, years, values)`; values is (tickers x STATEMENT_ROWS x years), aligned on the latest year."""
+    symbols = list(statements)
+    depth = max((len(statement["years"]) for statement in statements.values()), default=0)
+    values = np.full((len(symbols), len(STATEMENT_ROWS), depth), np.nan)
+    years = [None] * depth
+    for position, symbol in enumerate(symbols):
+        statement = statements[symbol]
+        count = len(statement["years"])
+        for row, name in enumerate(STATEMENT_ROWS):
+            series = statement["rows"].get(name)
+            if series:
+                values[position, row, depth - count:] = np.array(series, dtype=float)
+        if position == 0:
+            years[depth - count:] = statement["years"]
+    return symbols, years, values
+
+
+def _first_last(values: np.ndarray, ratio: bool = False):
+    """Along the last axis: `(latest, latest - first)` or, with `ratio`, `(latest / first, years apart)`.
+
+    First and latest are the first and last non-NaN entries; NaN where
+    there are fewer than two.
+    """
+    valid = ~np.isnan(values)
+    positions = np.arange(values.shape[-1])
+    last = np.where(valid, positions, -1).max(axis=-1)
+    first = np.where(valid, positions, values.shape[-1]).min(axis=-1)
+    latest = np.take_along_axis(values, np.clip(last, 0, None)[..., None], axis=-1)[..., 0]
+    earliest = np.take_along_axis(values, np.clip(first, 0, values.shape[-1] - 1)[..., None], axis=-1)[..., 0]
+    if ratio:
+        return latest / earliest, last - first
+    return latest, np.where(last > first, latest - earliest, np.nan)
+
+
+def margin_metrics(statements: Dict[str, dict]) -> pd.DataFrame:
+    """Latest margins, their change since the first reported year (in points) and revenue CAGR."""
+    symbols, _, values = statement_array(statements)
+    if values.size == 0:
+        return pd.DataFrame(columns=list(MARGIN_COLUMNS))
+    revenue = values[:, 0, :]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        margins = values[:, 1:, :] / revenue[:, None, :]  # (tickers x [gross, operating, net] x years)
+        margins = np.where(revenue[:, None, :] > 0, margins, np.nan)
+
+    latest, change = _first_last(margins)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        growth, spans = _first_last(np.where(revenue > 0, revenue, np.nan), ratio=True)
+        cagr = growth ** (1 / np.where(spans > 0, spans, np.nan)) - 1
+    return pd.DataFrame({
+        "revenue_cagr": cagr,
+        "gross_margin": latest[:, 0], "gross_margin_change": change[:, 0],
+        "operating_margin": latest[:, 1], "operating_margin_change": change[:, 1],
+        "net_margin": latest[:, 2], "net_margin_change": change[:, 2],
+    }, index=symbols)[list(MARGIN_COLUMNS)]
+
+
+def _format(value: float, kind: str) -> str:
+    if pd.isna(value):
+        return "n/a"
+    if kind == "percent":
+        return f"{value * 100:.1f}%"
+    if kind == "points":
+        return f"{value * 100:+.1f} pts"
+    if kind == "amount":
+        return f"${format_compact_number(value)}"
+    return f"{value:.2f}"
+
+
+def _table(frame: pd.DataFrame, columns: dict, subject: str, benchmark: Optional[str] = None) -> str:
+    """Subject row, peer median row and benchmark row of `frame` as a markdown table."""
+    keys = [key for key in columns if key in frame.columns and frame[key].notna().any()]
+    if subject not in frame.index or not keys:
+        return ""
+    rows = [(f"**{subject}**", frame.loc[subject, keys])]
+    peers = frame.drop(index=[symbol for symbol in (subject, benchmark) if symbol in frame.index])
+    if len(peers):
+        rows.append((f"Peer median ({len(peers)})", peers[keys].median(skipna=True)))
+    if benchmark is not None and benchmark in frame.index:
+        rows.append((f"{benchmark} (index)", frame.loc[benchmark, keys]))
+    lines = [
+        "| | " + " | ".join(columns[key][0] for key in keys) + " |",
+        "|---|" + "---:|" * len(keys),
+    ]
+    for label, values in rows:
+        lines.append(f"| {label} | " + " | ".join(_format(values[key], columns[key][1]) for key in keys) + " |")
+    return "\n".join(lines)
+
+
+def price_markdown(metrics: pd.DataFrame, subject: str, benchmark: Optional[str] = None,
+                   columns: List[str] = None) -> str:
+    """Price metrics for the company, its peers' median and the index, as a markdown table."""
+    selected = {key: PRICE_COLUMNS[key] for key in (columns or PRICE_COLUMNS)}
+    return _table(metrics, selected, subject, benchmark)
+
+
+def margin_markdown(statements: Dict[str, dict], subject: str) -> str:
+    """The company's revenue and margins per fiscal year, then a trend row against peers."""
+    statement = statements.get(subject)
+    if not statement or not statement["years"] or "Total Revenue" not in statement["rows"]:
+        return ""
+    _, years, values = statement_array({subject: statement})
+    revenue = values[0, 0]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        margins = np.where(revenue > 0, values[0, 1:] / revenue, np.nan)
+    lines = [
+        "| Fiscal Year | Revenue | Gross Margin | Op. Margin | Net Margin |",
+        "|---|---:|---:|---:|---:|",
+    ]
+    for column, year in enumerate(years):
+        if np.isnan(revenue[column]):
+            continue
+        cells = [_format(revenue[column], "amount")] + [_format(value, "percent") for value in margins[:, column]]
+        lines.append(f"| FY{year} | " + " | ".join(cells) + " |")
+    trend = _table(margin_metrics(statements), MARGIN_COLUMNS, subject)
+    return "\n".join(lines) + ("\n\n" + trend if trend else "")
+
+
+def synthetic_histories(tickers: int, years: int = 5, seed: int = 0) -> dict:
+    """Random-walk PriceHistory-like objects for `tickers` symbols plus "^INDEX", for timing."""
+    from price_store import PriceHistory
+
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(end=pd.Timestamp.today().normalize(), periods=years * TRADING_DAYS).to_numpy()
+    market = rng.normal(0.0003, 0.01, len(dates))
+    histories = {"^INDEX": PriceHistory("^INDEX", dates, *[100 * np.exp(np.cumsum(market))] * 4,
+                                        np.ones(len(dates)))}
+    betas = rng.uniform(0.5, 1.8, tickers)
+    noise = rng.normal(0, 0.015, (len(dates), tickers))
+    closes = 50 * np.exp(np.cumsum(market[:, None] * betas + noise, axis=0))
+    for column in range(tickers):
+        symbol = f"T{column:04d}"
+        histories[symbol] = PriceHistory(symbol, dates, *[closes[:, column]] * 4, np.ones(len(dates)))
+    return histories
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Price metrics for a coverage universe")
+    parser.add_argument("ticker_file", nargs="?", help="Text file with one ticker per line")
+    parser.add_argument("--period", default="10y", help="History to load; a 5Y CAGR needs more than 5y")
+    parser.add_argument("--window", type=int, default=5, help="Years of drawdown and rolling returns")
+    parser.add_argument("--benchmark", default="^GSPC")
+    parser.add_argument("--out", help="CSV to write the metrics to")
+    parser.add_argument("--synthetic", type=int, metavar="N", help="Time N random tickers instead")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        histories, benchmark = synthetic_histories(args.synthetic), "^INDEX"
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+
+        from ticker_session import TickerData
+
+        with open(args.ticker_file, encoding="utf-8") as f:
+            tickers = [line.strip().upper() for line in f if line.strip() and not line.startswith("#")]
+        benchmark = args.benchmark
+        start_time = time.time()
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            loaded = pool.map(lambda symbol: (symbol, TickerData(symbol).history(args.period)),
+                              [benchmark] + tickers)
+            histories = dict(loaded)
+        print(f"[INFO] Loaded {len(histories)} price histories in {time.time() - start_time:.1f} seconds.")
+
+    start_time = time.time()
+    dates, symbols, closes = close_matrix(histories)
+    metrics = price_metrics(dates, symbols, closes, benchmark, args.window)
+    print(f"[INFO] Metrics for {len(symbols)} tickers x {len(dates)} days computed "
+          f"in {time.time() - start_time:.3f} seconds.")
+    if args.out:
+        metrics.to_csv(args.out)
+    else:
+        print(metrics.describe().T.to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,14 @@
 import io
 import streamlit as st
-import openai
-import pandas as pd
-from xhtml2pdf import pisa
 
 st.title("Parsed GPT Table to PDF")
 
 if st.button("Generate Table"):
+    # Imported on the first click, so the page itself draws without them
+    import openai
+    from xhtml2pdf import pisa
+    from md_tables import extract_tables
+
     # System prompt for a simple Markdown table
     system_prompt = (
         "You are ChatGPT. Generate a Markdown table with random data. "
@@ -25,30 +27,12 @@ if st.button("Generate Table"):
     # Show raw markdown in the app
     st.markdown(table_markdown)
 
-    # Parse GPT’s table lines
-    lines = table_markdown.split("\n")
-
-    # First line is the header
-    header_line = lines[0]
-    # Remainder after the separator
-    data_lines = lines[2:]
-
-    # Extract header columns
-    headers = [col.strip() for col in header_line.split("|") if col.strip()]
-
-    # Build rows for DataFrame
-    rows = []
-    for line in data_lines:
-        line = line.strip()
-        if not line or line.startswith("|-"):
-            # Skip empty lines or the separator row
-            continue
-        # Split row by "|"
-        columns = [col.strip() for col in line.split("|") if col.strip()]
-        rows.append(columns)
-
-    # Create DataFrame
-    df = pd.DataFrame(rows, columns=headers)
+    # Parse GPT's table (alignment rows, escaped pipes and numbers handled)
+    tables = extract_tables(table_markdown)
+    if not tables:
+        st.error("GPT did not return a Markdown table.")
+        st.stop()
+    df = tables[0]
 
     # Convert DataFrame to HTML
     df_html = df.to_html(index=False, border=0)
@@ -0,0 +1,128 @@
+"""Generate memos for a coverage list without the Streamlit UI.
+
+    python batch.py coverage.csv --out memos/ --concurrency 2
+
+The CSV needs `company` and `ticker` columns and may have `details` and
+`peers` (space or comma separated tickers) columns. Each memo is written to `<out>/<TICKER>.pdf` and recorded in
+`<out>/manifest.jsonl`; rerunning the same command skips tickers that are
+already in the manifest, so an interrupted run picks up where it stopped.
+"""
+import argparse
+import csv
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from http_pool import describe, pool_metrics
+from pipeline import generate_memo, parse_peer_symbols
+from rate_limit import all_metrics
+
+MANIFEST_NAME = "manifest.jsonl"
+
+
+def read_coverage(csv_path: str) -> list:
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        rows = []
+        for row in csv.DictReader(f):
+            ticker = (row.get("ticker") or "").strip().upper()
+            company = (row.get("company") or "").strip()
+            if ticker and company:
+                rows.append({"company": company, "ticker": ticker, "details": (row.get("details") or "").strip(),
+                             "peers": parse_peer_symbols(row.get("peers") or "", ticker)})
+    return rows
+
+
+def read_finished(out_dir: str) -> set:
+    """Tickers with a manifest entry whose PDF is still on disk."""
+    manifest_path = os.path.join(out_dir, MANIFEST_NAME)
+    finished = set()
+    if not os.path.exists(manifest_path):
+        return finished
+    with open(manifest_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Half-written line from a killed run
+            if os.path.exists(os.path.join(out_dir, entry["pdf"])):
+                finished.add(entry["ticker"])
+    return finished
+
+
+def run_batch(rows: list, out_dir: str, concurrency: int = 2, use_cache: bool = True) -> dict:
+    os.makedirs(out_dir, exist_ok=True)
+    finished = read_finished(out_dir)
+    todo = [row for row in rows if row["ticker"] not in finished]
+    print(f"[INFO] {len(rows)} tickers, {len(rows) - len(todo)} already done, {len(todo)} to generate.")
+
+    manifest_lock = threading.Lock()
+    manifest_path = os.path.join(out_dir, MANIFEST_NAME)
+
+    def generate_one(row: dict) -> dict:
+        start_time = time.time()
+        _, pdf_data = generate_memo(row["company"], row["ticker"], row["details"], use_cache=use_cache,
+                                    peer_symbols=row.get("peers"))
+        pdf_name = f"{row['ticker']}.pdf"
+        tmp_path = os.path.join(out_dir, pdf_name + ".part")
+        with open(tmp_path, "wb") as f:
+            f.write(pdf_data)
+        os.replace(tmp_path, os.path.join(out_dir, pdf_name))  # Never leave a truncated PDF behind
+        entry = {
+            "ticker": row["ticker"],
+            "company": row["company"],
+            "pdf": pdf_name,
+            "bytes": len(pdf_data),
+            "seconds": round(time.time() - start_time, 2),
+            "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        with manifest_lock, open(manifest_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+        return entry
+
+    start_time = time.time()
+    done, failed = 0, []
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="memo") as pool:
+        futures = {pool.submit(generate_one, row): row["ticker"] for row in todo}
+        for future in as_completed(futures):
+            ticker = futures[future]
+            try:
+                entry = future.result()
+            except Exception as e:
+                failed.append(ticker)
+                print(f"[ERROR] {ticker}: {e}")
+                continue
+            done += 1
+            minutes = (time.time() - start_time) / 60
+            print(f"[INFO] {ticker} done in {entry['seconds']:.1f}s "
+                  f"({done}/{len(todo)}, {done / minutes:.2f} memos/minute).")
+
+    elapsed = time.time() - start_time
+    rate = done / (elapsed / 60) if elapsed > 0 else 0.0
+    print(f"[INFO] Generated {done} memos in {elapsed:.1f}s ({rate:.2f} memos/minute); {len(failed)} failed.")
+    for limiter in all_metrics():
+        print(f"[INFO] {limiter['name']} limiter: {limiter['acquired']} requests, "
+              f"avg wait {limiter['avg_wait']:.2f}s, max wait {limiter['max_wait']:.2f}s, "
+              f"{limiter['throttled']} throttled.")
+    for pool in pool_metrics():
+        if pool["requests"]:
+            print(f"[INFO] {describe(pool)}")
+    return {"generated": done, "failed": failed, "seconds": elapsed, "memos_per_minute": rate}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("csv_path", help="CSV with company, ticker and optional details and peers columns")
+    parser.add_argument("--out", default="memos", help="Output directory for PDFs and the manifest")
+    parser.add_argument("--concurrency", type=int, default=2, help="Tickers generated at the same time")
+    parser.add_argument("--bypass-cache", action="store_true", help="Always call GPT")
+    args = parser.parse_args()
+
+    summary = run_batch(read_coverage(args.csv_path), args.out,
+                        concurrency=args.concurrency, use_cache=not args.bypass_cache)
+    raise SystemExit(1 if summary["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
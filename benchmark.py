@@ -0,0 +1,622 @@
+"""Offline end-to-end benchmark for memo generation.
+
+Replays recorded OpenAI responses and Yahoo Finance payloads with simulated
+latency, so runs are repeatable and need no network or API key.
+
+    python benchmark.py synthesize                  # deterministic fixture, no network
+    python benchmark.py record coverage.csv         # live run, saves what OpenAI/Yahoo returned
+    python benchmark.py run --pipelines dummy,yahoo --sizes 1,2 --concurrency 1,4 \\
+        --save-baseline main
+    python benchmark.py run --compare main          # same matrix, deltas against the baseline
+    python benchmark.py startup                     # cold first paint and rerun time of each page
+
+"dummy" is the headless pipeline behind dummy.py (and batch.py); "yahoo" runs
+the yahoo.py page through Streamlit's AppTest. Each scenario reports
+p50/p95 end-to-end latency, mean time per traced stage, peak RSS of this
+process and of the PDF workers, and PDF size. Caches are pointed at a
+throwaway directory and forced cold, so every memo pays for every stage.
+
+`startup` runs each page script in a fresh interpreter and times the page
+code alone (AppTest's own polling is left out): the first run, which pays
+for every import, and the reruns after it. It also lists which heavy
+modules had been imported by the end of the first run.
+"""
+import argparse
+import contextlib
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from fake_openai import completion_response, stream_chunks
+from workers import current_rss_bytes
+
+BENCHMARK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks")
+FIXTURE_DIR = os.path.join(BENCHMARK_DIR, "fixtures")
+BASELINE_DIR = os.path.join(BENCHMARK_DIR, "baselines")
+SYNTHETIC_FIXTURE = os.path.join(FIXTURE_DIR, "synthetic.json")
+YAHOO_PAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "yahoo.py")
+RSS_SAMPLE_INTERVAL = 0.05
+
+SECTION_PATTERN = re.compile(r"\*\*Section (\d+)\*\*")
+
+
+class Fixture:
+    """Recorded `Ticker.info`, `Ticker.history`, `Ticker.income_stmt` and completion texts.
+
+    Completions are matched by ticker and section number rather than by the
+    exact prompt, so fixtures keep working when prompt wording changes.
+    """
+
+    def __init__(self, data: dict = None):
+        data = data or {}
+        self.tickers = data.get("tickers", {})
+        self.completions = data.get("completions", [])
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str) -> "Fixture":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "tickers": self.tickers, "completions": self.completions},
+                      f, indent=1, default=str)
+
+    def _entry(self, ticker_symbol: str) -> dict:
+        return self.tickers.setdefault(ticker_symbol.upper(), {"company": ticker_symbol.upper(),
+                                                               "info": {}, "history": {}})
+
+    def add_info(self, ticker_symbol: str, info: dict) -> None:
+        with self._lock:
+            self._entry(ticker_symbol)["info"] = json.loads(json.dumps(info, default=str))
+
+    def add_history(self, ticker_symbol: str, period: str, df: pd.DataFrame) -> None:
+        index = df.index
+        record = {
+            "tz": str(index.tz) if getattr(index, "tz", None) is not None else None,
+            "index": [ts.isoformat() for ts in index],
+            "columns": {column: df[column].astype(float).tolist() for column in df.columns},
+        }
+        with self._lock:
+            self._entry(ticker_symbol)["history"][period] = record
+
+    def add_statement(self, ticker_symbol: str, income_stmt: pd.DataFrame) -> None:
+        from analytics import statement_dict
+
+        with self._lock:
+            self._entry(ticker_symbol)["statement"] = statement_dict(income_stmt)
+
+    def add_completion(self, user_prompt: str, text: str) -> None:
+        with self._lock:
+            self.completions.append({"ticker": self.ticker_in(user_prompt),
+                                     "section": section_number(user_prompt), "text": text})
+
+    def ticker_in(self, prompt: str):
+        for ticker_symbol in self.tickers:
+            if re.search(rf"\b{re.escape(ticker_symbol)}\b", prompt):
+                return ticker_symbol
+        return None
+
+    def info(self, ticker_symbol: str) -> dict:
+        return dict(self.tickers.get(ticker_symbol.upper(), {}).get("info", {}))
+
+    def history(self, ticker_symbol: str, period: str) -> pd.DataFrame:
+        recorded = self.tickers.get(ticker_symbol.upper(), {}).get("history", {})
+        if not recorded:
+            return pd.DataFrame(columns=["Open", "High", "Low", "Close", "Volume"])
+        # Fall back to the longest recorded period
+        record = recorded.get(period) or max(recorded.values(), key=lambda item: len(item["index"]))
+        index = pd.to_datetime(record["index"], utc=record["tz"] is not None)
+        if record["tz"] is not None:
+            index = index.tz_convert(record["tz"])
+        return pd.DataFrame(record["columns"], index=pd.DatetimeIndex(index, name="Date"))
+
+    def statement(self, ticker_symbol: str) -> pd.DataFrame:
+        """The recorded income statement rows, shaped like `Ticker.income_stmt`."""
+        recorded = self.tickers.get(ticker_symbol.upper(), {}).get("statement") or {"years": [], "rows": {}}
+        columns = [pd.Timestamp(f"{year}-12-31") for year in recorded["years"]]
+        return pd.DataFrame.from_dict(recorded["rows"], orient="index", columns=columns)
+
+    def completion_text(self, user_prompt: str) -> str:
+        ticker_symbol = self.ticker_in(user_prompt)
+        section = section_number(user_prompt)
+        candidates = [item for item in self.completions if item["section"] == section]
+        matching = [item for item in candidates if item["ticker"] == ticker_symbol]
+        if matching or candidates:
+            return (matching or candidates)[0]["text"]
+        # A whole-memo prompt (yahoo.py) without a recording: stitch the sections together
+        sections = [item for item in self.completions if item["ticker"] == ticker_symbol] or self.completions
+        return "\n\n".join(item["text"] for item in sorted(sections, key=lambda item: item["section"]))
+
+
+def section_number(prompt: str) -> int:
+    """1-5 for a dummy.py section prompt, 0 for a whole memo."""
+    match = SECTION_PATTERN.search(prompt)
+    return int(match.group(1)) if match else 0
+
+
+class ReplayChatCompletion:
+    """`openai.ChatCompletion` serving fixture texts at a simulated speed."""
+
+    fixture = Fixture()
+    ttft = 0.5              # Seconds before the first token
+    tokens_per_sec = 200.0  # Simulated generation speed (one word counts as one token)
+    scale = 1               # Each answer is the recorded text repeated this many times
+
+    @classmethod
+    def create(cls, model=None, messages=None, temperature=None, max_tokens=None, stream=False, **kwargs):
+        user_prompt = messages[-1]["content"] if messages else ""
+        text = "\n\n".join([cls.fixture.completion_text(user_prompt)] * max(1, cls.scale))
+        per_token = 1.0 / cls.tokens_per_sec
+        if stream:
+            return stream_chunks(model, text, cls.ttft, per_token)
+        time.sleep(cls.ttft + len(text.split()) * per_token)
+        return completion_response(model, text, messages)
+
+
+class ReplayTicker:
+    """`yf.Ticker` answering from the fixture after a simulated round trip."""
+
+    fixture = Fixture()
+    latency = 0.3
+
+    def __init__(self, ticker, session=None, **kwargs):
+        self.ticker = ticker.upper()
+
+    @property
+    def info(self) -> dict:
+        time.sleep(self.latency)
+        return self.fixture.info(self.ticker)
+
+    def history(self, period: str = "1mo", **kwargs) -> pd.DataFrame:
+        time.sleep(self.latency)
+        return self.fixture.history(self.ticker, period)
+
+    @property
+    def income_stmt(self) -> pd.DataFrame:
+        time.sleep(self.latency)
+        return self.fixture.statement(self.ticker)
+
+
+@contextlib.contextmanager
+def replay(fixture: Fixture, ttft: float, tokens_per_sec: float, yahoo_latency: float, scale: int = 1):
+    """Route OpenAI and Yahoo Finance to the fixture for the duration of the block."""
+    import openai
+    import yfinance as yf
+
+    ReplayChatCompletion.fixture = ReplayTicker.fixture = fixture
+    ReplayChatCompletion.ttft = ttft
+    ReplayChatCompletion.tokens_per_sec = tokens_per_sec
+    ReplayChatCompletion.scale = scale
+    ReplayTicker.latency = yahoo_latency
+    original_completion, original_ticker = openai.ChatCompletion, yf.Ticker
+    openai.ChatCompletion, yf.Ticker = ReplayChatCompletion, ReplayTicker
+    try:
+        yield
+    finally:
+        openai.ChatCompletion, yf.Ticker = original_completion, original_ticker
+
+
+@contextlib.contextmanager
+def recording(fixture: Fixture):
+    """Pass OpenAI and Yahoo Finance calls through while saving what they return."""
+    import openai
+    import yfinance as yf
+
+    original_completion, original_ticker = openai.ChatCompletion, yf.Ticker
+
+    def create(**kwargs):
+        user_prompt = kwargs["messages"][-1]["content"]
+        response = original_completion.create(**kwargs)
+        if not kwargs.get("stream"):
+            fixture.add_completion(user_prompt, response["choices"][0]["message"]["content"])
+            return response
+
+        def chunks():
+            parts = []
+            for chunk in response:
+                parts.append(chunk["choices"][0].get("delta", {}).get("content") or "")
+                yield chunk
+            fixture.add_completion(user_prompt, "".join(parts))
+        return chunks()
+
+    class RecordingChatCompletion:
+        pass
+
+    RecordingChatCompletion.create = staticmethod(create)
+
+    class RecordingTicker(original_ticker):
+        @property
+        def info(self):
+            info = super().info
+            fixture.add_info(self.ticker, info)
+            return info
+
+        def history(self, period="1mo", **kwargs):
+            df = super().history(period=period, **kwargs)
+            if kwargs.get("start") is None:  # Incremental price store updates are not a period
+                fixture.add_history(self.ticker, period, df)
+            return df
+
+        @property
+        def income_stmt(self):
+            income_stmt = super().income_stmt
+            fixture.add_statement(self.ticker, income_stmt)
+            return income_stmt
+
+    openai.ChatCompletion, yf.Ticker = RecordingChatCompletion, RecordingTicker
+    try:
+        yield
+    finally:
+        openai.ChatCompletion, yf.Ticker = original_completion, original_ticker
+
+
+def synthesize_fixture(tickers=("AAPL", "MSFT", "NVDA"), seed: int = 0) -> Fixture:
+    """Deterministic fixture with plausible fundamentals, a year of prices and five sections."""
+    rng = np.random.default_rng(seed)
+    companies = {"AAPL": "Apple Inc.", "MSFT": "Microsoft Corporation", "NVDA": "NVIDIA Corporation"}
+    fixture = Fixture()
+    dates = pd.bdate_range(end="2025-02-14", periods=252, tz="America/New_York")
+    for ticker_symbol in tickers:
+        revenue = float(rng.uniform(5e10, 4e11))
+        fixture._entry(ticker_symbol)["company"] = companies.get(ticker_symbol, f"{ticker_symbol} Inc.")
+        fixture.add_info(ticker_symbol, {
+            "longBusinessSummary": f"{companies.get(ticker_symbol, ticker_symbol)} designs, builds and sells "
+                                   "hardware, software and services to consumers and enterprises worldwide.",
+            "marketCap": float(rng.uniform(1e12, 3.5e12)), "enterpriseValue": float(rng.uniform(1e12, 3.5e12)),
+            "trailingPE": float(rng.uniform(20, 60)), "forwardPE": float(rng.uniform(18, 45)),
+            "profitMargins": float(rng.uniform(0.1, 0.5)), "grossMargins": float(rng.uniform(0.4, 0.75)),
+            "operatingMargins": float(rng.uniform(0.2, 0.6)), "revenueGrowth": float(rng.uniform(0.02, 0.9)),
+            "totalRevenue": revenue, "ebitda": revenue * 0.4, "freeCashflow": revenue * 0.25,
+            "beta": float(rng.uniform(0.8, 1.8)), "heldPercentInsiders": float(rng.uniform(0.001, 0.05)),
+            "heldPercentInstitutions": float(rng.uniform(0.55, 0.75)), "dividendYield": 0.45,
+            "recommendationKey": "buy", "numberOfAnalystOpinions": 40, "sector": "Technology",
+            "industry": "Consumer Electronics", "city": "Cupertino", "country": "United States",
+            "companyOfficers": [{"name": "Jane Doe", "title": "CEO"}, {"name": "John Roe", "title": "CFO"}],
+        })
+        closes = 150 * np.exp(np.cumsum(rng.normal(0.0008, 0.018, len(dates))))
+        fixture.add_history(ticker_symbol, "1y", pd.DataFrame({
+            "Open": closes * 0.995, "High": closes * 1.01, "Low": closes * 0.99,
+            "Close": closes, "Volume": rng.integers(2e7, 9e7, len(dates)).astype(float),
+        }, index=dates))
+        revenues = revenue * np.cumprod(rng.uniform(0.95, 1.15, 4))
+        fixture.add_statement(ticker_symbol, pd.DataFrame(
+            [revenues, revenues * rng.uniform(0.4, 0.7), revenues * rng.uniform(0.2, 0.35),
+             revenues * rng.uniform(0.1, 0.3)],
+            index=["Total Revenue", "Gross Profit", "Operating Income", "Net Income"],
+            columns=[pd.Timestamp(f"{year}-09-30") for year in range(2021, 2025)],
+        ))
+
+    paragraph = (
+        "Revenue expanded on the back of services attach rates and pricing power, while operating "
+        "leverage lifted margins across segments. Management reallocated capital toward higher-return "
+        "platforms, and free cash flow covered buybacks and the dividend with room to spare. "
+    )
+    for section in range(1, 6):
+        lines = [f"## Section {section}", ""]
+        for heading in range(1, 5):
+            lines += [f"### {section}.{heading} Analysis", "", paragraph * 3, "",
+                      "- **Growth:** double-digit services expansion", "- **Margins:** ~46% gross margin",
+                      "- **Capital returns:** $90B buyback authorization", ""]
+        lines += ["| Metric | FY2023 | FY2024 |", "|---|---:|---:|",
+                  "| Revenue | $383.3B | $391.0B |", "| EBITDA | $125.8B | $134.7B |",
+                  "| Net margin | 25.3% | 24.0% |", ""]
+        if section == 1:
+            lines += ["| Shareholder | Stake (%) | Notes |", "|---|---|---|",
+                      "| Institutional Holders | ~61.2% | Index and active funds |",
+                      "| Inside Holdings | ~0.1% | Executive & Board Holdings |",
+                      "| Retail and Others | ~38.7% | Public float |", ""]
+        text = "\n".join(lines)
+        for ticker_symbol in tickers:
+            fixture.completions.append({"ticker": ticker_symbol, "section": section, "text": text})
+    return fixture
+
+
+def isolate_state(directory: str) -> None:
+    """Point every cache at `directory` and force them cold. Call before importing the pipeline."""
+    os.environ["LLM_CACHE_PATH"] = os.path.join(directory, "llm_cache.sqlite3")
+    os.environ["MARKET_CACHE_PATH"] = os.path.join(directory, "market_data.sqlite3")
+    os.environ["MARKET_CACHE_FRESH_SECONDS"] = "0"
+    os.environ["MARKET_CACHE_MAX_STALE_SECONDS"] = "0"
+    os.environ["CHART_CACHE_DIR"] = ""
+    os.environ["RATE_LIMIT_STATE_PATH"] = os.path.join(directory, "rate_limits.sqlite3")
+    os.environ["MEMO_TRACE_PATH"] = os.path.join(directory, "traces.jsonl")
+    os.environ["JOB_STORE_PATH"] = os.path.join(directory, "jobs.sqlite3")
+    os.environ["PRICE_STORE_DIR"] = os.path.join(directory, "prices")
+    os.environ["PRICE_STORE_FRESH_SECONDS"] = "0"
+
+
+def run_dummy_memo(company_name: str, ticker_symbol: str) -> None:
+    from pipeline import generate_memo
+
+    generate_memo(company_name, ticker_symbol, use_cache=False)
+
+
+def run_yahoo_memo(company_name: str, ticker_symbol: str) -> None:
+    from streamlit.testing.v1 import AppTest
+
+    from jobs import DONE, get_job_queue
+
+    page = AppTest.from_file(YAHOO_PAGE, default_timeout=600)
+    page.run()
+    page.text_input[0].input(company_name)
+    page.text_input[1].input(ticker_symbol)
+    page.checkbox[1].check()  # Bypass the GPT cache
+    page.button[0].click().run()
+    if page.exception:
+        raise RuntimeError(page.exception[0].message)
+    # The page runs generation as a job and shows a failure with st.error instead of raising
+    if page.error:
+        raise RuntimeError(page.error[0].value)
+    job = get_job_queue().get(page.session_state["job_id"])
+    if job.status != DONE:
+        raise RuntimeError(f"Yahoo memo job {job.job_id} {job.status}.")
+
+
+PIPELINES = {"dummy": run_dummy_memo, "yahoo": run_yahoo_memo}
+
+
+def run_scenario(pipeline: str, fixture: Fixture, concurrency: int, runs: int) -> dict:
+    """Generate `runs` memos, `concurrency` at a time, and summarize their traces."""
+    from charts import get_chart_service
+    from tracing import TRACE_PATH, load_traces
+
+    get_chart_service().clear()  # Every scenario renders its charts cold
+    tickers = list(fixture.tickers)
+    tag = f"bench-{time.time_ns()}"
+    jobs = []
+    for run in range(runs):
+        ticker_symbol = tickers[run % len(tickers)]
+        jobs.append((f"{fixture.tickers[ticker_symbol]['company']} ({tag}-{run})", ticker_symbol))
+
+    peak_rss = [current_rss_bytes()]
+    done = threading.Event()
+
+    def sample_rss():
+        while not done.wait(RSS_SAMPLE_INTERVAL):
+            peak_rss[0] = max(peak_rss[0], current_rss_bytes())
+
+    def timed(job):
+        start_time = time.perf_counter()
+        PIPELINES[pipeline](*job)
+        return time.perf_counter() - start_time
+
+    sampler = threading.Thread(target=sample_rss, daemon=True)
+    sampler.start()
+    latencies, failed = [], 0
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="bench") as pool:
+            for future in [pool.submit(timed, job) for job in jobs]:
+                try:
+                    latencies.append(future.result())
+                except Exception as e:
+                    failed += 1
+                    print(f"[ERROR] {pipeline} memo failed: {e}")
+    finally:
+        done.set()
+        sampler.join()
+
+    traces = [trace for trace in load_traces(TRACE_PATH) if tag in str(trace["attrs"].get("company", ""))]
+    stages = {}
+    for trace in traces:
+        for stage, seconds in trace["stages"].items():
+            stages.setdefault(stage, []).append(seconds)
+    pdf_spans = [span for trace in traces for span in trace["spans"] if span["name"] == "pdf"]
+    pdf_bytes = [span["attrs"].get("bytes", 0) for span in pdf_spans]
+    worker_rss = [span["attrs"].get("peak_rss_mb", 0.0) for span in pdf_spans]
+    return {
+        "runs": runs,
+        "failed": failed,
+        "p50": float(np.percentile(latencies, 50)) if latencies else None,
+        "p95": float(np.percentile(latencies, 95)) if latencies else None,
+        "mean": float(np.mean(latencies)) if latencies else None,
+        "stages": {stage: float(np.mean(values)) for stage, values in sorted(stages.items())},
+        "peak_rss_mb": peak_rss[0] / (1024 * 1024),
+        "pdf_worker_rss_mb": max(worker_rss, default=0.0),
+        "pdf_kb": float(np.mean(pdf_bytes)) / 1024 if pdf_bytes else 0.0,
+    }
+
+
+def scenario_key(scenario: dict) -> str:
+    return f"{scenario['pipeline']}/x{scenario['size']}/c{scenario['concurrency']}"
+
+
+def print_scenario(scenario: dict) -> None:
+    if scenario["p50"] is None:
+        print(f"[ERROR] {scenario_key(scenario)}: all {scenario['runs']} memos failed.")
+        return
+    stages = ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in scenario["stages"].items())
+    print(f"[INFO] {scenario_key(scenario)}: p50 {scenario['p50']:.2f}s, p95 {scenario['p95']:.2f}s "
+          f"over {scenario['runs'] - scenario['failed']} memos; peak RSS {scenario['peak_rss_mb']:.0f} MB "
+          f"(PDF worker {scenario['pdf_worker_rss_mb']:.0f} MB), PDF {scenario['pdf_kb']:.0f} KB.")
+    print(f"       stages: {stages}")
+
+
+def compare(results: dict, baseline: dict) -> None:
+    previous = {scenario_key(scenario): scenario for scenario in baseline["scenarios"]}
+    for scenario in results["scenarios"]:
+        old = previous.get(scenario_key(scenario))
+        if old is None or old["p50"] is None or scenario["p50"] is None:
+            continue
+        changes = ", ".join(
+            f"{metric} {scenario[metric]:.2f}s vs {old[metric]:.2f}s ({(scenario[metric] / old[metric] - 1) * 100:+.0f}%)"
+            for metric in ("p50", "p95") if old[metric]
+        )
+        print(f"[INFO] {scenario_key(scenario)}: {changes}")
+
+
+def run_benchmarks(args) -> dict:
+    isolate_state(tempfile.mkdtemp(prefix="memo-bench-"))
+    os.chdir(os.path.dirname(YAHOO_PAGE))  # The pages load their logo relative to the repo
+    if not os.path.exists(args.fixture):
+        if args.fixture != SYNTHETIC_FIXTURE:
+            raise SystemExit(f"[ERROR] Fixture {args.fixture} not found; record one first.")
+        synthesize_fixture().save(SYNTHETIC_FIXTURE)
+        print(f"[INFO] Wrote synthetic fixture to {SYNTHETIC_FIXTURE}.")
+    fixture = Fixture.load(args.fixture)
+
+    scenarios = []
+    for pipeline in args.pipelines.split(","):
+        for size in [int(value) for value in args.sizes.split(",")]:
+            with replay(fixture, args.ttft, args.tokens_per_sec, args.yahoo_latency, scale=size):
+                for concurrency in [int(value) for value in args.concurrency.split(",")]:
+                    if pipeline == "yahoo" and concurrency > 1:
+                        # AppTest drives a process-global Streamlit runtime, one page at a time
+                        print(f"[WARN] Skipping yahoo at concurrency {concurrency}: pages run one at a time.")
+                        continue
+                    scenario = {"pipeline": pipeline, "size": size, "concurrency": concurrency}
+                    scenario.update(run_scenario(pipeline, fixture, concurrency, args.runs))
+                    print_scenario(scenario)
+                    scenarios.append(scenario)
+    return {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "fixture": os.path.basename(args.fixture),
+        "settings": {"ttft": args.ttft, "tokens_per_sec": args.tokens_per_sec,
+                     "yahoo_latency": args.yahoo_latency, "runs": args.runs},
+        "scenarios": scenarios,
+    }
+
+
+def record(args) -> None:
+    from batch import read_coverage
+    from pipeline import generate_memo
+
+    rows = read_coverage(args.csv_path)
+    fixture = Fixture()
+    for row in rows:
+        fixture._entry(row["ticker"])["company"] = row["company"]
+    with recording(fixture):
+        for row in rows:
+            generate_memo(row["company"], row["ticker"], row["details"], use_cache=False)
+            print(f"[INFO] Recorded {row['ticker']}.")
+    fixture.save(args.out)
+    print(f"[INFO] Saved {len(fixture.completions)} completions for {len(rows)} tickers to {args.out}.")
+
+
+PAGES = ["dummy.py", "yahoo.py", "app.py"]
+# Modules the form itself never needs; the startup report lists which ones a page still imports
+HEAVY_MODULES = ["pandas", "matplotlib", "yfinance", "openai", "requests", "markdown2", "xhtml2pdf"]
+
+# Runs in a fresh interpreter per page, so the first run pays every import like a new server would
+STARTUP_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+from streamlit.runtime.scriptrunner import script_runner
+from streamlit.testing.v1 import AppTest
+streamlit_s = time.perf_counter() - start
+
+runs = []  # Seconds inside the page script, without AppTest's polling around it
+original = script_runner.exec_func_with_error_handling
+def timed(func, ctx):
+    start = time.perf_counter()
+    try:
+        return original(func, ctx)
+    finally:
+        runs.append(time.perf_counter() - start)
+script_runner.exec_func_with_error_handling = timed
+
+page = AppTest.from_file(sys.argv[1], default_timeout=60)
+page.run()
+heavy = [name for name in json.loads(sys.argv[3]) if name in sys.modules]
+for _ in range(int(sys.argv[2])):
+    page.run()
+print(json.dumps({"streamlit_s": streamlit_s, "first_paint_s": runs[0], "reruns": runs[1:],
+                  "heavy": heavy, "errors": [error.message for error in page.exception]}))
+"""
+
+
+def measure_startup(page: str, reruns: int) -> dict:
+    """Cold first run and warm reruns of one page, in its own interpreter."""
+    completed = subprocess.run(
+        [sys.executable, "-c", STARTUP_PROBE, page, str(reruns), json.dumps(HEAVY_MODULES)],
+        capture_output=True, text=True, cwd=os.path.dirname(YAHOO_PAGE), timeout=300,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"{page} failed to start: {completed.stderr.strip()[-500:]}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def run_startup(args) -> dict:
+    """Time to first paint and per-rerun time of each page, medians over `args.samples` processes."""
+    isolate_state(tempfile.mkdtemp(prefix="memo-startup-"))  # Inherited by the probe processes
+    results = {}
+    for page in args.pages.split(","):
+        samples = [measure_startup(page, args.reruns) for _ in range(args.samples)]
+        result = {
+            "streamlit_s": float(np.median([sample["streamlit_s"] for sample in samples])),
+            "first_paint_s": float(np.median([sample["first_paint_s"] for sample in samples])),
+            "rerun_s": float(np.median([rerun for sample in samples for rerun in sample["reruns"]])),
+            "heavy": samples[-1]["heavy"],
+        }
+        results[page] = result
+        for error in samples[-1]["errors"]:
+            print(f"[WARN] {page}: {error}")
+        print(f"[INFO] {page}: first paint {result['first_paint_s'] * 1000:.0f} ms "
+              f"(plus {result['streamlit_s'] * 1000:.0f} ms importing Streamlit), "
+              f"rerun {result['rerun_s'] * 1000:.2f} ms; "
+              f"heavy imports: {', '.join(result['heavy']) or 'none'}.")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    synthesize = commands.add_parser("synthesize", help="Write a deterministic fixture (no network)")
+    synthesize.add_argument("--out", default=SYNTHETIC_FIXTURE)
+
+    recorder = commands.add_parser("record", help="Generate memos live and save the responses")
+    recorder.add_argument("csv_path", help="CSV with company, ticker and optional details columns")
+    recorder.add_argument("--out", default=os.path.join(FIXTURE_DIR, "recorded.json"))
+
+    runner = commands.add_parser("run", help="Replay a fixture and report latency")
+    runner.add_argument("--fixture", default=SYNTHETIC_FIXTURE)
+    runner.add_argument("--pipelines", default="dummy,yahoo", help="Comma-separated: dummy, yahoo")
+    runner.add_argument("--sizes", default="1", help="Comma-separated answer length multipliers")
+    runner.add_argument("--concurrency", default="1,4", help="Comma-separated memos in flight")
+    runner.add_argument("--runs", type=int, default=5, help="Memos per scenario")
+    runner.add_argument("--ttft", type=float, default=0.5, help="Simulated seconds to first token")
+    runner.add_argument("--tokens-per-sec", type=float, default=200.0, help="Simulated generation speed")
+    runner.add_argument("--yahoo-latency", type=float, default=0.3, help="Simulated seconds per Yahoo call")
+    runner.add_argument("--save-baseline", metavar="NAME", help="Save results as benchmarks/baselines/NAME.json")
+    runner.add_argument("--compare", metavar="NAME", help="Compare against benchmarks/baselines/NAME.json")
+
+    startup = commands.add_parser("startup", help="Time each page's first paint and reruns")
+    startup.add_argument("--pages", default=",".join(PAGES), help="Comma-separated page scripts")
+    startup.add_argument("--samples", type=int, default=3, help="Fresh processes per page")
+    startup.add_argument("--reruns", type=int, default=10, help="Reruns timed per process")
+    args = parser.parse_args()
+
+    if args.command == "synthesize":
+        synthesize_fixture().save(args.out)
+        print(f"[INFO] Wrote synthetic fixture to {args.out}.")
+    elif args.command == "record":
+        record(args)
+    elif args.command == "startup":
+        run_startup(args)
+    else:
+        results = run_benchmarks(args)
+        if args.compare:
+            with open(os.path.join(BASELINE_DIR, f"{args.compare}.json"), encoding="utf-8") as f:
+                compare(results, json.load(f))
+        if args.save_baseline:
+            os.makedirs(BASELINE_DIR, exist_ok=True)
+            path = os.path.join(BASELINE_DIR, f"{args.save_baseline}.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=1)
+            print(f"[INFO] Saved baseline to {path}.")
+
+
+if __name__ == "__main__":
+    main()
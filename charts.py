@@ -0,0 +1,294 @@
+"""Chart rendering off the request thread, with cached output.
+
+Charts are drawn with the object-oriented `Figure` API (no pyplot global
+state) in a small process pool, so concurrent sessions neither block on
+nor corrupt each other's figures. Encoded images are cached in memory and
+under .cache/charts, keyed by chart kind, ticker, period, format and a
+hash of the plotted data, so re-rendering the same chart is free.
+
+Memo HTML does not carry the images. `image_html` publishes an image under
+a content-addressed `chart:<sha256>.<fmt>` URL (identical images share one
+URL and one stored copy); the PDF worker resolves those URLs through a
+WeasyPrint url_fetcher (see pdf_service.py), and the page inlines them only
+when it draws them (`inline_images`).
+"""
+import base64
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+import numpy as np
+
+from workers import start_process_pool
+
+# Worker processes for rendering; 0 renders on the calling thread instead
+CHART_PROCESSES = int(os.getenv("CHART_PROCESSES", "2"))
+CHART_FORMAT = os.getenv("CHART_FORMAT", "png")  # "png" or "svg"
+CHART_CACHE_DIR = os.getenv("CHART_CACHE_DIR", os.path.join(".cache", "charts"))
+MEMORY_CACHE_ENTRIES = 128
+CHART_DPI = int(os.getenv("CHART_DPI", "100"))
+# Quantize PNG charts to this many colors (e.g. 64); 0 keeps full color.
+# Flat-colored charts usually lose nothing visible and shrink by half or more
+CHART_COLORS = int(os.getenv("CHART_COLORS", "0"))
+
+MIME_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
+RESOURCE_URL = re.compile(r"chart:([0-9a-f]{32})\.(png|svg)")
+
+
+def _warm_worker() -> None:
+    """Import matplotlib when a worker starts instead of on its first chart."""
+    import matplotlib.figure  # noqa: F401
+
+
+def _variant(fmt: str) -> str:
+    """Encoding settings that change the image bytes, for the cache keys."""
+    if fmt != "png":
+        return fmt
+    return f"png-{CHART_DPI}dpi" + (f"-{CHART_COLORS}c" if CHART_COLORS else "")
+
+
+def _quantize(png: bytes, colors: int) -> bytes:
+    from PIL import Image  # Installed with matplotlib
+
+    with Image.open(BytesIO(png)) as image:
+        # Fast octree is the quantizer that keeps the alpha channel
+        palette = image.quantize(colors=colors, method=Image.Quantize.FASTOCTREE)
+        buf = BytesIO()
+        palette.save(buf, format="PNG", optimize=True)
+    return buf.getvalue() if buf.tell() < len(png) else png
+
+
+def _encode(fig, fmt: str) -> bytes:
+    buf = BytesIO()
+    fig.savefig(buf, format=fmt, dpi=CHART_DPI, bbox_inches="tight")
+    if fmt == "png" and CHART_COLORS:
+        return _quantize(buf.getvalue(), CHART_COLORS)
+    return buf.getvalue()
+
+
+def render_price_chart(ticker_symbol: str, period: str, dates, closes, fmt: str = "png") -> bytes:
+    from matplotlib.figure import Figure  # Only workers draw, so the page process never loads matplotlib
+
+    fig = Figure(figsize=(8, 4))
+    ax = fig.subplots()
+    ax.plot(dates, closes, label="Close Price")
+    ax.set_title(f"{ticker_symbol} Stock Price ({period})")
+    ax.set_xlabel("Date")
+    ax.set_ylabel("Price")
+    ax.legend()
+    ax.grid(True)
+    fig.autofmt_xdate()
+    return _encode(fig, fmt)
+
+
+def render_ownership_pie(labels, values, fmt: str = "png") -> bytes:
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(6, 6))
+    ax = fig.subplots()
+    ax.pie(values, labels=labels, autopct="%1.1f%%", startangle=140)
+    ax.set_title("Ownership Structure")
+    return _encode(fig, fmt)
+
+
+def data_hash(*arrays) -> str:
+    digest = hashlib.sha256()
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(str(array.dtype).encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()[:16]
+
+
+def image_html(image: bytes, fmt: str, alt: str) -> str:
+    """An <img> pointing at the published image rather than embedding it."""
+    url = get_chart_service().publish(image, fmt)
+    return f'<img src="{url}" alt="{alt}" style="max-width:100%;">'
+
+
+def inline_images(html: str) -> str:
+    """`html` with its chart: URLs turned into data: URIs, for a browser to show."""
+    service = get_chart_service()
+
+    def data_uri(match) -> str:
+        image = service.resolve(match.group(0))
+        if image is None:
+            return match.group(0)  # Gone from both caches; the browser shows the alt text
+        return f"data:{MIME_TYPES[match.group(2)]};base64,{base64.b64encode(image).decode('utf-8')}"
+
+    return RESOURCE_URL.sub(data_uri, html)
+
+
+class ChartService:
+    def __init__(self, processes: int = CHART_PROCESSES, cache_dir: str = CHART_CACHE_DIR):
+        self.processes = processes
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> bytes, least recently used first
+        self._inflight = {}           # key -> Future, so identical requests render once
+        self._pool = None
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None and self.processes > 0:
+                self._pool = start_process_pool(self.processes, _warm_worker)
+            return self._pool
+
+    def _discard_pool(self, pool) -> None:
+        """Drop a broken pool so the next submit starts fresh workers."""
+        with self._lock:
+            if self._pool is pool:  # Another render may have replaced it already
+                self._pool = None
+        pool.shutdown(wait=False)
+
+    def _cached(self, key: str, fmt: str):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+        path = os.path.join(self.cache_dir, f"{key}.{fmt}") if self.cache_dir else None
+        if path and os.path.exists(path):
+            with open(path, "rb") as f:
+                image = f.read()
+            self._remember(key, image)
+            return image
+        return None
+
+    def _remember(self, key: str, image: bytes) -> None:
+        with self._lock:
+            self._memory[key] = image
+            self._memory.move_to_end(key)
+            while len(self._memory) > MEMORY_CACHE_ENTRIES:
+                self._memory.popitem(last=False)
+
+    def _store(self, key: str, fmt: str, image: bytes) -> None:
+        self._remember(key, image)
+        if self.cache_dir:
+            path = os.path.join(self.cache_dir, f"{key}.{fmt}")
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+            with open(tmp_path, "wb") as f:
+                f.write(image)
+            os.replace(tmp_path, path)
+
+    def submit(self, key: str, fmt: str, render, *args) -> Future:
+        """Future of the encoded image for `key`, rendering `render(*args)` only on a miss."""
+        image = self._cached(key, fmt)
+        if image is not None:
+            self.hits += 1
+            future = Future()
+            future.set_result(image)
+            return future
+
+        with self._lock:
+            if key in self._inflight:
+                return self._inflight[key]
+            self.misses += 1
+            future = Future()
+            self._inflight[key] = future
+
+        def finish(render_future: Future):
+            try:
+                image = render_future.result()
+                self._store(key, fmt, image)
+                future.set_result(image)
+            except BrokenProcessPool:
+                self._discard_pool(pool)  # Rebuilt on the next submit; render this one here
+                try:
+                    image = render(*args)
+                    self._store(key, fmt, image)
+                    future.set_result(image)
+                except Exception as e:
+                    future.set_exception(e)
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._inflight.pop(key, None)
+
+        pool = self._get_pool()
+        if pool is None:
+            render_future = Future()
+            try:
+                render_future.set_result(render(*args))
+            except Exception as e:
+                render_future.set_exception(e)
+            finish(render_future)
+        else:
+            try:
+                pool.submit(render, *args).add_done_callback(finish)
+            except BrokenProcessPool as e:  # Broke before this submit; finish renders it here
+                render_future = Future()
+                render_future.set_exception(e)
+                finish(render_future)
+        return future
+
+    def publish(self, image: bytes, fmt: str) -> str:
+        """Store `image` under its content hash and return its chart: URL."""
+        digest = hashlib.sha256(image).hexdigest()[:32]
+        key = f"image-{digest}"
+        if self._cached(key, fmt) is None:
+            self._store(key, fmt, image)
+        return f"chart:{digest}.{fmt}"
+
+    def resolve(self, url: str):
+        """Bytes of a published image, or None when it has dropped out of both caches."""
+        match = RESOURCE_URL.fullmatch(url)
+        if match is None:
+            return None
+        return self._cached(f"image-{match.group(1)}", match.group(2))
+
+    def resources(self, html: str) -> dict:
+        """`{url: bytes}` for each distinct chart: URL in `html` that can still be resolved."""
+        found = {}
+        for match in RESOURCE_URL.finditer(html):
+            url = match.group(0)
+            if url not in found:
+                found[url] = self.resolve(url)
+        missing = [url for url, image in found.items() if image is None]
+        if missing:
+            print(f"[WARN] {len(missing)} chart image(s) no longer cached: {', '.join(missing)}")
+        return {url: image for url, image in found.items() if image is not None}
+
+    def clear(self) -> None:
+        """Forget images held in memory (the disk cache is left alone)."""
+        with self._lock:
+            self._memory.clear()
+
+    def price_chart(self, ticker_symbol: str, period: str, history, fmt: str = CHART_FORMAT) -> Future:
+        """Chart of a price_store.PriceHistory (or a yfinance history DataFrame)."""
+        if hasattr(history, "close"):
+            dates, closes = history.dates, history.close  # Views into the price store, not copies
+        else:
+            index = history.index
+            if getattr(index, "tz", None) is not None:
+                index = index.tz_localize(None)  # Keep exchange-local dates, drop the tz object
+            dates = index.to_numpy(dtype="datetime64[ns]")
+            closes = history["Close"].to_numpy(dtype=float)
+        key = f"price-{ticker_symbol.upper()}-{period}-{_variant(fmt)}-{data_hash(dates, closes)}"
+        return self.submit(key, fmt, render_price_chart, ticker_symbol, period, dates, closes, fmt)
+
+    def ownership_pie(self, labels, values, fmt: str = CHART_FORMAT) -> Future:
+        key = f"ownership-{_variant(fmt)}-{data_hash(np.array(labels, dtype=str), np.array(values, dtype=float))}"
+        return self.submit(key, fmt, render_ownership_pie, list(labels), list(values), fmt)
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_chart_service() -> ChartService:
+    """Process-wide chart service, shared by every Streamlit session."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = ChartService()
+        return _service
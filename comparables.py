@@ -0,0 +1,100 @@
+"""Peer comparables computed from Yahoo Finance data.
+
+`comparables_frame` turns the company's and its peers' `financial_data`
+dicts into one DataFrame and derives every multiple for all rows at once
+(EV/EBITDA is a column division, not a loop). `percentile_ranks` places
+the company against its peers for every metric in one NumPy broadcast, and
+`comparables_markdown` renders the ready-made table that goes into Section 2.
+"""
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+from prompt_builder import format_compact_number
+
+# column: (label, kind); kinds decide formatting
+COLUMNS = {
+    "marketCap": ("Market Cap", "amount"),
+    "ev_ebitda": ("EV/EBITDA", "multiple"),
+    "trailingPE": ("P/E", "multiple"),
+    "forwardPE": ("Fwd P/E", "multiple"),
+    "priceToSalesTrailing12Months": ("P/S", "multiple"),
+    "grossMargins": ("Gross Margin", "percent"),
+    "operatingMargins": ("Op. Margin", "percent"),
+    "profitMargins": ("Net Margin", "percent"),
+    "revenueGrowth": ("Revenue Growth", "percent"),
+}
+SOURCE_KEYS = ["marketCap", "enterpriseValue", "ebitda", "trailingPE", "forwardPE",
+               "priceToSalesTrailing12Months", "grossMargins", "operatingMargins", "profitMargins",
+               "revenueGrowth"]
+
+
+def comparables_frame(ticker_symbol: str, financial_data: Dict, peer_data: Dict[str, Dict]) -> pd.DataFrame:
+    """One row per company (the subject first), one numeric column per COLUMNS entry."""
+    rows = {ticker_symbol: financial_data, **{symbol: data for symbol, data in peer_data.items()
+                                              if symbol != ticker_symbol}}
+    raw = pd.DataFrame.from_dict(
+        {symbol: {key: (data or {}).get(key) for key in SOURCE_KEYS} for symbol, data in rows.items()},
+        orient="index",
+    ).apply(pd.to_numeric, errors="coerce")
+    ebitda = raw["ebitda"].where(raw["ebitda"] > 0)  # EV/EBITDA means nothing for negative EBITDA
+    raw["ev_ebitda"] = raw["enterpriseValue"] / ebitda
+    # Negative P/E is reported by some tickers; it is not a multiple anyone compares
+    for key in ("trailingPE", "forwardPE"):
+        raw[key] = raw[key].where(raw[key] > 0)
+    return raw[list(COLUMNS)]
+
+
+def percentile_ranks(frame: pd.DataFrame, ticker_symbol: str) -> pd.Series:
+    """Share of peers (0-100) below the company on each metric; NaN without peer data."""
+    values = frame.to_numpy(dtype=float)
+    subject = frame.index.get_loc(ticker_symbol)
+    target = values[subject]
+    peers = np.delete(values, subject, axis=0)
+    valid = ~np.isnan(peers)
+    below = ((peers < target) & valid).sum(axis=0) + 0.5 * ((peers == target) & valid).sum(axis=0)
+    counts = valid.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ranks = np.where((counts > 0) & ~np.isnan(target), 100.0 * below / counts, np.nan)
+    return pd.Series(ranks, index=frame.columns)
+
+
+def _format(value: float, kind: str) -> str:
+    if pd.isna(value):
+        return "n/a"
+    if kind == "amount":
+        return f"${format_compact_number(value)}"
+    if kind == "percent":
+        return f"{value * 100:.1f}%"
+    return f"{value:.1f}x"
+
+
+def _ordinal(rank: float) -> str:
+    """33 -> "33rd"; 11, 12 and 13 take "th"."""
+    number = int(round(rank))
+    suffix = "th" if number % 100 in (11, 12, 13) else {1: "st", 2: "nd", 3: "rd"}.get(number % 10, "th")
+    return f"{number}{suffix}"
+
+
+def comparables_markdown(ticker_symbol: str, financial_data: Dict, peer_data: Dict[str, Dict]) -> str:
+    """Markdown table of the company, its peers, the peer median and the company's percentile."""
+    frame = comparables_frame(ticker_symbol, financial_data, peer_data)
+    if len(frame) < 2:
+        return ""
+    ranks = percentile_ranks(frame, ticker_symbol)
+    medians = frame.drop(index=ticker_symbol).median(skipna=True)
+    kinds = [kind for _, kind in COLUMNS.values()]
+
+    lines = [
+        "| Company | " + " | ".join(label for label, _ in COLUMNS.values()) + " |",
+        "|---|" + "---:|" * len(COLUMNS),
+    ]
+    for symbol, row in frame.iterrows():
+        cells = [_format(value, kind) for value, kind in zip(row.to_numpy(), kinds)]
+        name = f"**{symbol}**" if symbol == ticker_symbol else symbol
+        lines.append(f"| {name} | " + " | ".join(cells) + " |")
+    lines.append("| Peer median | " + " | ".join(_format(value, kind) for value, kind in zip(medians, kinds)) + " |")
+    lines.append(f"| {ticker_symbol} percentile vs peers | "
+                 + " | ".join("n/a" if pd.isna(rank) else _ordinal(rank) for rank in ranks) + " |")
+    return "\n".join(lines)
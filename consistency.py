@@ -0,0 +1,257 @@
+"""Local numeric consistency check for generated memos.
+
+`check_memo(sections, financial_data)` pulls numeric claims (market cap,
+P/E, margins, revenue, ownership percentages, ...) out of each section,
+normalises their units to Yahoo's scale (`$2.9T` -> 2.9e12, `23.4%` ->
+0.234), and flags
+
+- "data" findings: a claim that disagrees with `financial_data`, and
+- "conflict" findings: two sections stating different values for a metric
+  Yahoo has no value for (otherwise the "data" finding already says which is wrong).
+
+It is regex plus NumPy and runs in milliseconds, so it replaces a
+whole-memo GPT review; only the flagged passages are worth sending to GPT
+(see `review_prompt`). Forward-looking and comparative sentences
+("projected", "industry average", "vs.") are skipped, and so are table
+rows with several numbers (usually one per year).
+"""
+import re
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from md_tables import parse_cells
+from prompt_builder import format_value
+
+AMOUNT, PERCENT, PERCENT_POINT, MULTIPLE, PLAIN = "amount", "percent", "percent_point", "multiple", "plain"
+
+# name: (financial_data key, how the memo names it, kind). More specific names
+# come first so "forward P/E" is not read as "P/E".
+METRICS = {
+    "market_cap": ("marketCap", r"market\s+cap(?:itali[sz]ation)?", AMOUNT),
+    "enterprise_value": ("enterpriseValue", r"enterprise\s+value", AMOUNT),
+    "revenue_growth": ("revenueGrowth", r"revenue\s+growth", PERCENT),
+    "earnings_growth": ("earningsGrowth", r"earnings\s+growth", PERCENT),
+    "revenue": ("totalRevenue", r"(?:total\s+|annual\s+)?revenues?", AMOUNT),
+    "ebitda": ("ebitda", r"\bEBITDA\b(?!\s+margin)", AMOUNT),
+    "net_income": ("netIncomeToCommon", r"net\s+income", AMOUNT),
+    "free_cash_flow": ("freeCashflow", r"free\s+cash\s+flow|\bFCF\b", AMOUNT),
+    "operating_cash_flow": ("operatingCashflow", r"operating\s+cash\s+flow", AMOUNT),
+    "forward_pe": ("forwardPE", r"forward\s+(?:P/E|price[-\s]to[-\s]earnings)(?:\s+ratio)?", MULTIPLE),
+    "trailing_pe": ("trailingPE", r"(?:trailing\s+)?(?:P/E|price[-\s]to[-\s]earnings)(?:\s+ratio)?", MULTIPLE),
+    "price_to_sales": ("priceToSalesTrailing12Months", r"(?:P/S|price[-\s]to[-\s]sales)(?:\s+ratio)?", MULTIPLE),
+    "gross_margin": ("grossMargins", r"gross\s+margins?", PERCENT),
+    "operating_margin": ("operatingMargins", r"operating\s+margins?", PERCENT),
+    "profit_margin": ("profitMargins", r"(?:net\s+profit|net|profit)\s+margins?", PERCENT),
+    "insider_ownership": ("heldPercentInsiders", r"\binsiders?\b", PERCENT),
+    "institutional_ownership": ("heldPercentInstitutions", r"\binstitution(?:al|s)\b", PERCENT),
+    "dividend_yield": ("dividendYield", r"dividend\s+yield", PERCENT_POINT),
+    "payout_ratio": ("payoutRatio", r"payout\s+ratio", PERCENT),
+    "beta": ("beta", r"\bbeta\b", PLAIN),
+}
+METRIC_NAMES = list(METRICS)
+METRIC_REGEX = re.compile(
+    "|".join(f"(?P<m{index}>{METRICS[name][1]})" for index, name in enumerate(METRIC_NAMES)),
+    re.IGNORECASE,
+)
+
+# A number with its currency, scale word and unit, anywhere in a sentence
+NUMBER_IN_TEXT = re.compile(
+    r"(?<![\w.,$€£])(?:[~≈]\s*)?\(?-?[$€£]?\s?\d[\d,]*(?:\.\d+)?"
+    r"(?:\s*(?:trillion|billion|million|thousand|tn|bn|mm|[kmbt])(?![a-z]))?"
+    r"(?:\s*(?:%|x(?![a-z])|percent\b))?\)?",
+    re.IGNORECASE,
+)
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n")
+SKIP_CONTEXT = re.compile(
+    r"\b(?:project(?:ed|ions?|s)?|forecasts?|expect(?:ed|s)?|targets?|estimate[sd]?|guidance|"
+    r"by\s+20\d\d|could|would|scenario|peers?|industry|average|median|vs\.?|versus|compared|S&P)\b",
+    re.IGNORECASE,
+)
+CLAIM_WINDOW = 80  # Characters after a metric name in which its number must appear
+
+# (relative, absolute) tolerance per kind, in financial_data units
+TOLERANCES = {
+    AMOUNT: (0.05, 0.0),
+    PERCENT: (0.05, 0.01),
+    PERCENT_POINT: (0.05, 0.1),
+    MULTIPLE: (0.05, 0.5),
+    PLAIN: (0.05, 0.05),
+}
+MAX_REVIEW_PASSAGES = 8
+
+
+@dataclass
+class Claim:
+    section: int
+    metric: str
+    value: float  # On financial_data's scale
+    text: str  # The number as written
+    passage: str
+
+
+@dataclass
+class Finding:
+    kind: str  # "data" or "conflict"
+    metric: str
+    section: int
+    passage: str
+    claimed: float
+    expected: float  # Source value, or the other section's claim for conflicts
+    other_section: Optional[int] = None
+    other_passage: Optional[str] = None
+
+    @property
+    def message(self) -> str:
+        key = METRICS[self.metric][0]
+        name = self.metric.replace("_", " ")
+        claimed, expected = format_value(key, self.claimed), format_value(key, self.expected)
+        if self.kind == "data":
+            return f"Section {self.section + 1} gives {name} as {claimed}; Yahoo Finance has {expected}."
+        return (f"Section {self.section + 1} gives {name} as {claimed}; "
+                f"section {self.other_section + 1} says {expected}.")
+
+
+@dataclass
+class ConsistencyReport:
+    claims: List[Claim] = field(default_factory=list)
+    findings: List[Finding] = field(default_factory=list)
+    seconds: float = 0.0
+
+    def flagged_passages(self) -> list:
+        """`(section, passage)` pairs behind the findings, in order and without repeats."""
+        passages = []
+        for finding in self.findings:
+            for item in ((finding.section, finding.passage), (finding.other_section, finding.other_passage)):
+                if item[1] is not None and item not in passages:
+                    passages.append(item)
+        return passages
+
+    def to_dict(self) -> dict:
+        return {
+            "claims": len(self.claims),
+            "seconds": round(self.seconds, 4),
+            "findings": [{**asdict(finding), "message": finding.message} for finding in self.findings],
+        }
+
+
+def _passages(section_markdown: str):
+    start = 0
+    for match in SENTENCE_END.finditer(section_markdown):
+        yield section_markdown[start:match.start()]
+        start = match.end()
+    yield section_markdown[start:]
+
+
+def _candidates(section: int, passage: str):
+    """`(section, metric, number text, passage)` for every metric name followed by a number."""
+    if SKIP_CONTEXT.search(passage):
+        return []
+    numbers = list(NUMBER_IN_TEXT.finditer(passage))
+    if not numbers:
+        return []
+    if passage.lstrip().startswith("|") and len(numbers) > 1:
+        return []  # Table row with one value per period
+    mentions = list(METRIC_REGEX.finditer(passage))
+    found = []
+    for position, mention in enumerate(mentions):
+        end = min(mention.end() + CLAIM_WINDOW,
+                  mentions[position + 1].start() if position + 1 < len(mentions) else len(passage))
+        number = next((item for item in numbers if mention.end() <= item.start() < end), None)
+        if number is not None:
+            metric = METRIC_NAMES[int(mention.lastgroup[1:])]
+            found.append((section, metric, number.group().strip(), passage.strip()))
+    return found
+
+
+def extract_claims(sections: List[str]) -> List[Claim]:
+    """Numeric claims in every section, normalised to financial_data's units."""
+    candidates = [candidate for index, section_markdown in enumerate(sections)
+                  for passage in _passages(section_markdown)
+                  for candidate in _candidates(index, passage)]
+    if not candidates:
+        return []
+    texts = [text.lower().replace("percent", "%").replace(" ", "") for _, _, text, _ in candidates]
+    values, units = parse_cells(texts)  # One vectorized pass over every number
+    kinds = np.array([METRICS[metric][2] for _, metric, _, _ in candidates])
+    has_scale = np.array([bool(re.search(r"\d\s*[a-z]", text)) for text in texts])
+    is_percent = units == "%"
+    no_unit = np.array([unit is None for unit in units])
+    is_year = no_unit & (values >= 1900) & (values <= 2100) & (values == np.round(values))
+
+    # Which numbers can be read as the metric, and the factor to financial_data's scale
+    usable = np.select(
+        [kinds == AMOUNT, kinds == PERCENT, kinds == PERCENT_POINT, kinds == MULTIPLE, kinds == PLAIN],
+        [(~is_percent & (units != "x") & (has_scale | (np.abs(values) >= 1e6))),
+         is_percent, is_percent, (no_unit | (units == "x")) & ~is_year, no_unit & ~is_year],
+        default=False,
+    ) & ~np.isnan(values)
+    scale = np.where(kinds == PERCENT, 0.01, 1.0)
+    values = values * scale
+    return [Claim(section, metric, float(value), text, passage)
+            for (section, metric, text, passage), value, ok in zip(candidates, values, usable) if ok]
+
+
+def _tolerance(metric: str, reference: np.ndarray) -> np.ndarray:
+    relative, absolute = TOLERANCES[METRICS[metric][2]]
+    return np.maximum(absolute, relative * np.abs(reference))
+
+
+def check_memo(sections: List[str], financial_data: Dict) -> ConsistencyReport:
+    """Claims in `sections` checked against `financial_data` and against each other."""
+    start_time = time.perf_counter()
+    claims = extract_claims(sections)
+    findings = []
+    for metric in METRIC_NAMES:
+        metric_claims = [claim for claim in claims if claim.metric == metric]
+        if not metric_claims:
+            continue
+        values = np.array([claim.value for claim in metric_claims])
+        section_ids = np.array([claim.section for claim in metric_claims])
+
+        expected = financial_data.get(METRICS[metric][0])
+        if isinstance(expected, (int, float)) and not isinstance(expected, bool) and np.isfinite(expected):
+            wrong = np.abs(values - expected) > _tolerance(metric, np.full(len(values), float(expected)))
+            findings.extend(Finding("data", metric, claim.section, claim.passage, claim.value, float(expected))
+                            for claim, flag in zip(metric_claims, wrong) if flag)
+            continue
+
+        # Every pair of claims from different sections, at once
+        reference = (np.abs(values[:, None]) + np.abs(values[None, :])) / 2
+        disagree = (np.abs(values[:, None] - values[None, :]) > _tolerance(metric, reference))
+        disagree &= section_ids[:, None] < section_ids[None, :]
+        reported = set()
+        for first, second in zip(*np.nonzero(disagree)):
+            pair = (section_ids[first], section_ids[second])
+            if pair in reported:
+                continue  # One conflict per metric and pair of sections
+            reported.add(pair)
+            claim, other = metric_claims[first], metric_claims[second]
+            findings.append(Finding("conflict", metric, claim.section, claim.passage, claim.value,
+                                    other.value, other.section, other.passage))
+    return ConsistencyReport(claims, findings, time.perf_counter() - start_time)
+
+
+def review_prompt(report: ConsistencyReport, financial_data: Dict) -> str:
+    """A short GPT prompt covering only the flagged passages."""
+    keys = []
+    for finding in report.findings:
+        key = METRICS[finding.metric][0]
+        if key not in keys:
+            keys.append(key)
+    source = "\n".join(f"- {key}: {format_value(key, financial_data.get(key))}"
+                       for key in keys if format_value(key, financial_data.get(key)) is not None)
+    passages = "\n".join(f"{number}. (Section {section + 1}) {passage}"
+                         for number, (section, passage)
+                         in enumerate(report.flagged_passages()[:MAX_REVIEW_PASSAGES], start=1))
+    issues = "\n".join(f"- {finding.message}" for finding in report.findings)
+    return (
+        "An automated check flagged these figures in an investment memorandum.\n\n"
+        f"Yahoo Finance data:\n{source or '- (none)'}\n\n"
+        f"Issues:\n{issues}\n\n"
+        f"Passages:\n{passages}\n\n"
+        "For each numbered passage, reply with the number and either OK (if the figure is "
+        "justified, e.g. a different period) or a corrected version of the passage. Be brief."
+    )
@@ -0,0 +1,228 @@
+"""Uploaded documents as a local BM25 index, so prompts get only the relevant excerpts.
+
+    index = get_document_index("10-K.pdf", data)   # Extract, chunk, index (cached by file hash)
+    excerpts = select_excerpts([index], "risk factors litigation regulation", budget_tokens=600)
+
+Text is split into overlapping word windows within each page, and the
+BM25 weight of every (term, chunk) pair is computed once at build time
+into CSR-style NumPy arrays (term pointers, chunk ids, weights). A query
+is then one `np.bincount` over the postings of its terms. Indexes are kept
+in memory and in DOCUMENT_INDEX_DIR, keyed by the SHA-256 of the file, so
+re-uploading a file or rerunning the page never re-indexes it.
+"""
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+
+from prompt_builder import count_tokens
+
+DOCUMENT_INDEX_DIR = os.getenv("DOCUMENT_INDEX_DIR", os.path.join(".cache", "documents"))
+MEMORY_ENTRIES = 16
+CHUNK_WORDS = 180
+CHUNK_OVERLAP = 30
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+TOKEN = re.compile(r"[a-z][a-z0-9]+|\d+(?:\.\d+)?")
+STOPWORDS = {
+    "the", "and", "for", "that", "with", "this", "are", "was", "were", "has", "have", "had", "its",
+    "our", "from", "which", "will", "been", "not", "but", "they", "their", "these", "those", "such",
+    "any", "all", "may", "can", "also", "into", "than", "other", "more", "each", "or", "an", "as",
+    "at", "be", "by", "in", "is", "it", "of", "on", "to", "we", "us", "if", "so", "no",
+}
+SUPPORTED_TYPES = ["pdf", "txt", "md", "html", "htm"]
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in TOKEN.findall(text.lower()) if token not in STOPWORDS]
+
+
+def extract_pages(name: str, data: bytes) -> List[str]:
+    """Plain text per page (one "page" for formats without pages)."""
+    extension = os.path.splitext(name)[1].lower().lstrip(".")
+    if extension == "pdf":
+        from pypdf import PdfReader
+
+        return [page.extract_text() or "" for page in PdfReader(io.BytesIO(data)).pages]
+    text = data.decode("utf-8", errors="replace")
+    if extension in ("html", "htm"):
+        from bs4 import BeautifulSoup
+
+        text = BeautifulSoup(text, "html.parser").get_text(" ")
+    return text.split("\f")  # Form feeds separate pages in text exports
+
+
+def chunk_pages(pages: List[str], words: int = CHUNK_WORDS, overlap: int = CHUNK_OVERLAP):
+    """`(texts, page_numbers)` of overlapping word windows; a chunk never spans two pages."""
+    texts, page_numbers = [], []
+    step = max(1, words - overlap)
+    for page_number, page in enumerate(pages, start=1):
+        page_words = page.split()
+        for start in range(0, max(1, len(page_words) - overlap), step):
+            window = page_words[start:start + words]
+            if window:
+                texts.append(" ".join(window))
+                page_numbers.append(page_number)
+    return texts, page_numbers
+
+
+class DocumentIndex:
+    def __init__(self, file_hash: str, name: str, texts: List[str], pages: np.ndarray, tokens: np.ndarray,
+                 vocabulary: List[str], term_ptr: np.ndarray, chunk_ids: np.ndarray, weights: np.ndarray):
+        self.file_hash = file_hash
+        self.name = name
+        self.texts = texts
+        self.pages = pages
+        self.tokens = tokens  # Prompt tokens per chunk
+        self.vocabulary = vocabulary
+        self.term_ids = {term: index for index, term in enumerate(vocabulary)}
+        self.term_ptr = term_ptr  # Postings of term t are [term_ptr[t], term_ptr[t + 1])
+        self.chunk_ids = chunk_ids
+        self.weights = weights
+
+    @classmethod
+    def build(cls, file_hash: str, name: str, pages: List[str]) -> "DocumentIndex":
+        texts, page_numbers = chunk_pages(pages)
+        term_ids = {}
+        terms, chunks = [], []
+        for chunk, text in enumerate(texts):
+            ids = [term_ids.setdefault(token, len(term_ids)) for token in tokenize(text)]
+            terms.extend(ids)
+            chunks.extend([chunk] * len(ids))
+        vocabulary = sorted(term_ids, key=term_ids.get)
+        n_chunks, n_terms = len(texts), len(vocabulary)
+
+        # Term frequency of each (term, chunk) pair, sorted by term: the postings
+        keys, tf = np.unique(np.array(terms, dtype=np.int64) * max(n_chunks, 1) + np.array(chunks, dtype=np.int64),
+                             return_counts=True)
+        term_of, chunk_ids = keys // max(n_chunks, 1), keys % max(n_chunks, 1)
+        df = np.bincount(term_of, minlength=n_terms)
+        term_ptr = np.concatenate([[0], np.cumsum(df)])
+        chunk_length = np.bincount(np.array(chunks, dtype=np.int64), minlength=n_chunks)
+        average_length = chunk_length.mean() if n_chunks else 1.0
+        idf = np.log1p((n_chunks - df + 0.5) / (df + 0.5))
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * chunk_length[chunk_ids] / max(average_length, 1.0))
+        weights = idf[term_of] * tf * (BM25_K1 + 1) / (tf + norm)
+
+        tokens = np.array([count_tokens(text) for text in texts], dtype=np.int32)
+        return cls(file_hash, name, texts, np.array(page_numbers, dtype=np.int32), tokens, vocabulary,
+                   term_ptr.astype(np.int64), chunk_ids.astype(np.int32), weights.astype(np.float32))
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every chunk for `query`."""
+        ids = sorted({self.term_ids[token] for token in tokenize(query) if token in self.term_ids})
+        if not ids:
+            return np.zeros(len(self.texts), dtype=np.float32)
+        slices = [slice(self.term_ptr[term], self.term_ptr[term + 1]) for term in ids]
+        return np.bincount(np.concatenate([self.chunk_ids[s] for s in slices]),
+                           weights=np.concatenate([self.weights[s] for s in slices]),
+                           minlength=len(self.texts))
+
+    def search(self, query: str, k: int = 5) -> list:
+        """Top `k` `(chunk, score)` pairs, best first, leaving out chunks that do not match."""
+        scores = self.scores(query)
+        k = min(k, len(scores))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(chunk), float(scores[chunk])) for chunk in top if scores[chunk] > 0]
+
+    def save(self, directory: str) -> None:
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, self.file_hash)
+        np.savez(base + ".npz", pages=self.pages, tokens=self.tokens, term_ptr=self.term_ptr,
+                 chunk_ids=self.chunk_ids, weights=self.weights)
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump({"name": self.name, "texts": self.texts, "vocabulary": self.vocabulary}, f)
+
+    @classmethod
+    def load(cls, directory: str, file_hash: str) -> Optional["DocumentIndex"]:
+        base = os.path.join(directory, file_hash)
+        if not (os.path.exists(base + ".npz") and os.path.exists(base + ".json")):
+            return None
+        with open(base + ".json", encoding="utf-8") as f:
+            meta = json.load(f)
+        with np.load(base + ".npz") as arrays:
+            return cls(file_hash, meta["name"], meta["texts"], arrays["pages"], arrays["tokens"],
+                       meta["vocabulary"], arrays["term_ptr"], arrays["chunk_ids"], arrays["weights"])
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def _remember(index: DocumentIndex) -> DocumentIndex:
+    with _indexes_lock:
+        _indexes[index.file_hash] = index
+        _indexes.move_to_end(index.file_hash)
+        while len(_indexes) > MEMORY_ENTRIES:
+            _indexes.popitem(last=False)
+    return index
+
+
+def load_document_index(file_hash: str) -> Optional[DocumentIndex]:
+    """An index built earlier, from memory or DOCUMENT_INDEX_DIR; None if it is gone."""
+    with _indexes_lock:
+        index = _indexes.get(file_hash)
+    if index is not None:
+        return index
+    if DOCUMENT_INDEX_DIR:
+        try:
+            index = DocumentIndex.load(DOCUMENT_INDEX_DIR, file_hash)
+        except (OSError, ValueError) as e:
+            print(f"[WARN] Could not load document index {file_hash[:12]}: {e}")
+            index = None
+        if index is not None:
+            return _remember(index)
+    return None
+
+
+def get_document_index(name: str, data: bytes) -> DocumentIndex:
+    """Index for an uploaded file, built once per distinct file content."""
+    file_hash = hashlib.sha256(data).hexdigest()
+    index = load_document_index(file_hash)
+    if index is not None:
+        return index
+    start_time = time.time()
+    pages = extract_pages(name, data)
+    extracted = time.time() - start_time
+    index = DocumentIndex.build(file_hash, name, pages)
+    print(f"[INFO] Indexed {name}: {len(pages)} pages, {len(index)} chunks, {len(index.vocabulary)} terms "
+          f"in {time.time() - start_time:.2f} seconds ({extracted:.2f}s extracting text).")
+    if DOCUMENT_INDEX_DIR:
+        try:
+            index.save(DOCUMENT_INDEX_DIR)
+        except OSError as e:
+            print(f"[WARN] Could not save document index for {name}: {e}")
+    return _remember(index)
+
+
+def select_excerpts(indexes: List[DocumentIndex], query: str, budget_tokens: int, k: int = 4) -> str:
+    """The best chunks across `indexes` for `query`, as many of the top `k` as fit in `budget_tokens`.
+
+    Each excerpt is labelled with its file and page; "" if nothing matches.
+    """
+    indexes = list({index.file_hash: index for index in indexes}.values())  # Same file uploaded twice
+    hits = [(score, index, chunk) for index in indexes for chunk, score in index.search(query, k)]
+    hits.sort(key=lambda hit: -hit[0])
+    excerpts, used = [], 0
+    for score, index, chunk in hits[:k]:
+        label = f"[{index.name}, p. {index.pages[chunk]}]"
+        cost = int(index.tokens[chunk]) + count_tokens(label) + 1
+        if used + cost > budget_tokens:
+            continue  # A shorter, lower-ranked chunk may still fit
+        excerpts.append(f"{label} {index.texts[chunk]}")
+        used += cost
+    return "\n\n".join(excerpts)
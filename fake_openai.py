@@ -0,0 +1,307 @@
+"""Local stand-in for `openai.ChatCompletion` so memo generation can run offline.
+
+Run `python fake_openai.py` to compare sequential and concurrent section
+generation against a simulated latency, or `python fake_openai.py --tail`
+to see what retries and hedging do to a backend with failures and a slow
+tail (see llm.stream_chat). `python fake_openai.py --pool --calls 200`
+serves the same answers over real HTTP from `stub_server` and reports how
+many connections concurrent calls open (see http_pool.py).
+"""
+import argparse
+import contextlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FAKE_SECTION_TEXT = (
+    "## Section\n\n"
+    "Placeholder analysis generated by the local fake backend.\n\n"
+    "| Shareholder | Stake (%) | Notes |\n"
+    "|---|---|---|\n"
+    "| Institutional Holders | ~61.2% | Index and active funds |\n"
+    "| Inside Holdings | ~0.1% | Executive & Board Holdings |\n"
+    "| Retail and Others | ~38.7% | Public float |\n"
+)
+
+
+def completion_response(model: str, text: str, messages=None) -> dict:
+    """A non-streamed `ChatCompletion` response carrying `text`."""
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion",
+        "model": model,
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {
+            "prompt_tokens": sum(len(m["content"]) // 4 for m in messages or []),
+            "completion_tokens": len(text) // 4,
+        },
+    }
+
+
+def stream_chunks(model: str, text: str, first_token_delay: float, per_token: float):
+    """Streamed `ChatCompletion` chunks for `text`, one word per chunk."""
+    time.sleep(first_token_delay)
+    for token in re.findall(r"\S+\s*|\s+", text):
+        yield {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion.chunk",
+            "model": model,
+            "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+        }
+        time.sleep(per_token)
+    yield {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion.chunk",
+        "model": model,
+        "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+    }
+
+
+class FakeChatCompletion:
+    """Mimics the response shape of `openai.ChatCompletion.create` (openai==0.28)."""
+
+    latency = 2.0   # Seconds per call
+    jitter = 0.0    # Extra random seconds per call
+    ttft = 0.25     # Share of the latency spent before the first streamed token
+    text = FAKE_SECTION_TEXT
+    error_rate = 0.0    # Share of calls failing with a 503
+    slow_rate = 0.0     # Share of calls in the slow tail
+    slow_factor = 10.0  # How much slower a tail call is
+
+    _lock = threading.Lock()
+    calls = 0
+
+    @classmethod
+    def create(cls, model=None, messages=None, temperature=None, max_tokens=None, stream=False, **kwargs):
+        with cls._lock:
+            cls.calls += 1
+        if random.random() < cls.error_rate:
+            import openai
+
+            time.sleep(cls.latency * cls.ttft)
+            raise openai.error.ServiceUnavailableError("The server is overloaded (fake).", http_status=503)
+        latency = cls.latency + random.uniform(0, cls.jitter)
+        if random.random() < cls.slow_rate:
+            latency *= cls.slow_factor
+        if stream:
+            tokens = max(len(re.findall(r"\S+\s*|\s+", cls.text)), 1)
+            return stream_chunks(model, cls.text, latency * cls.ttft, latency * (1 - cls.ttft) / tokens)
+        time.sleep(latency)
+        return completion_response(model, cls.text, messages)
+
+
+@contextlib.contextmanager
+def fake_openai(latency: float = 2.0, jitter: float = 0.0, text: str = FAKE_SECTION_TEXT,
+                error_rate: float = 0.0, slow_rate: float = 0.0, slow_factor: float = 10.0):
+    """Temporarily route `openai.ChatCompletion.create` to the fake backend."""
+    import openai
+
+    original = openai.ChatCompletion
+    FakeChatCompletion.latency = latency
+    FakeChatCompletion.jitter = jitter
+    FakeChatCompletion.text = text
+    FakeChatCompletion.error_rate = error_rate
+    FakeChatCompletion.slow_rate = slow_rate
+    FakeChatCompletion.slow_factor = slow_factor
+    FakeChatCompletion.calls = 0
+    openai.ChatCompletion = FakeChatCompletion
+    try:
+        yield FakeChatCompletion
+    finally:
+        openai.ChatCompletion = original
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real APIs
+    disable_nagle_algorithm = True  # Headers and body go out as separate writes
+
+    def setup(self) -> None:
+        super().setup()
+        self.server.connected()  # One handler per client connection
+
+    def _send(self, body: bytes, content_type: str) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self) -> None:
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        time.sleep(self.server.latency)
+        model = request.get("model", "stub")
+        if request.get("stream"):
+            chunks = stream_chunks(model, self.server.text, 0.0, 0.0)
+            body = "".join(f"data: {json.dumps(chunk)}\n\n" for chunk in chunks) + "data: [DONE]\n\n"
+            self._send(body.encode("utf-8"), "text/event-stream")
+        else:
+            response = completion_response(model, self.server.text, request.get("messages"))
+            self._send(json.dumps(response).encode("utf-8"), "application/json")
+
+    def do_GET(self) -> None:
+        time.sleep(self.server.latency)
+        self._send(json.dumps({"path": self.path}).encode("utf-8"), "application/json")
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    """Chat completions (POST) and a JSON echo (GET) on localhost, counting client connections."""
+
+    daemon_threads = True
+
+    def __init__(self, latency: float, text: str):
+        super().__init__(("127.0.0.1", 0), _StubHandler)
+        self.latency = latency
+        self.text = text
+        self.connections = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def connected(self) -> None:
+        with self._lock:
+            self.connections += 1
+
+
+@contextlib.contextmanager
+def stub_server(latency: float = 0.02, text: str = FAKE_SECTION_TEXT):
+    """Run a StubServer on a free port for the duration of the block."""
+    server = StubServer(latency, text)
+    thread = threading.Thread(target=server.serve_forever, daemon=True, name="stub-server")
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def _fake_call(system_prompt: str, user_prompt: str) -> str:
+    import openai
+
+    response = openai.ChatCompletion.create(
+        model="fake",
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ],
+    )
+    return response["choices"][0]["message"]["content"]
+
+
+def tail_demo(calls: int, latency: float, error_rate: float, slow_rate: float) -> None:
+    """p50/p99/max call time with and without hedging against a flaky, heavy-tailed backend."""
+    import numpy as np
+
+    import llm
+
+    for hedge in (False, True):
+        llm.HEDGE = hedge
+        llm._metrics = llm.LLMMetrics()
+        times = []
+        with fake_openai(latency=latency) as fake:
+            for i in range(llm.HEDGE_MIN_SAMPLES):  # Learn the typical first-token time
+                llm.stream_chat("system", f"warm-up {i}")
+            fake.error_rate, fake.slow_rate = error_rate, slow_rate
+            for i in range(calls):
+                start_time = time.perf_counter()
+                try:
+                    llm.stream_chat("system", f"call {i}", deadline=latency * 30)
+                except llm.LLMError as e:
+                    print(f"[WARN] Call {i} failed: {e}")
+                times.append(time.perf_counter() - start_time)
+        p50, p99 = np.percentile(times, [50, 99])
+        print(f"[INFO] Hedging {'on ' if hedge else 'off'}: p50 {p50:.2f}s, p99 {p99:.2f}s, max {max(times):.2f}s; "
+              f"{llm.llm_metrics().snapshot()}")
+
+
+def pool_demo(calls: int, concurrency: int, latency: float) -> None:
+    """Connections opened by concurrent GPT calls with openai's per-thread sessions and with the shared pool."""
+    import os
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+
+    # Keep the demo away from the real cache and rate limit state, and let it go fast
+    directory = tempfile.mkdtemp(prefix="pool-demo-")
+    os.environ["LLM_CACHE_PATH"] = os.path.join(directory, "llm_cache.sqlite3")
+    os.environ["RATE_LIMIT_STATE_PATH"] = os.path.join(directory, "rate_limits.sqlite3")
+    os.environ.setdefault("OPENAI_RATE", "1000")
+    os.environ.setdefault("OPENAI_BURST", "1000")
+    import openai
+
+    import llm
+    from http_pool import describe, get_http_session, pool_metrics
+
+    llm.HEDGE = False
+    shared = openai.requestssession
+    with stub_server(latency=latency) as server:
+        openai.api_base, openai.api_key = f"{server.url}/v1", "stub"
+        for label, session in (("Per-thread sessions", None), ("Shared pool", shared)):
+            openai.requestssession = session
+            opened = server.connections
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                list(pool.map(lambda i: llm.chat_completion("system", f"call {i}", use_cache=False),
+                              range(calls)))
+            opened = server.connections - opened
+            print(f"[INFO] {label}: {calls} GPT calls at concurrency {concurrency} opened {opened} "
+                  f"connections ({max(0.0, 1 - opened / calls):.0%} reused).")
+
+        yahoo = get_http_session("yahoo")
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(lambda i: yahoo.get(f"{server.url}/v7/finance/quote?symbols=T{i}").json(),
+                          range(calls)))
+    for pool in pool_metrics():
+        print(f"[INFO] {describe(pool)}")
+
+
+def main():
+    from orchestrator import DEFAULT_MAX_CONCURRENCY, run_sections
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sections", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=2.0)
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_MAX_CONCURRENCY)
+    parser.add_argument("--tail", action="store_true", help="Measure retries and hedging instead")
+    parser.add_argument("--calls", type=int, default=100)
+    parser.add_argument("--error-rate", type=float, default=0.02)
+    parser.add_argument("--slow-rate", type=float, default=0.02)
+    parser.add_argument("--pool", action="store_true", help="Measure connection reuse against a stub server")
+    args = parser.parse_args()
+
+    if args.pool:
+        pool_demo(args.calls, args.concurrency, latency=0.02)
+        return
+    if args.tail:
+        tail_demo(args.calls, args.latency, args.error_rate, args.slow_rate)
+        return
+
+    prompts = [f"Write section {i + 1}" for i in range(args.sections)]
+    with fake_openai(latency=args.latency):
+        start_time = time.time()
+        sequential = [_fake_call("system", p) for p in prompts]
+        sequential_elapsed = time.time() - start_time
+
+        start_time = time.time()
+        concurrent = run_sections(_fake_call, "system", prompts, max_concurrency=args.concurrency)
+        concurrent_elapsed = time.time() - start_time
+
+    assert concurrent == sequential
+    print(f"[INFO] Sequential: {sequential_elapsed:.2f}s, concurrent: {concurrent_elapsed:.2f}s "
+          f"({sequential_elapsed / concurrent_elapsed:.1f}x faster).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""Keep-alive HTTP sessions shared by every thread and Streamlit session in the process.
+
+    session = get_http_session("yahoo")   # requests.Session on a counted connection pool
+    pool_metrics()                        # Reuse rate, checkout wait and connect time per client
+
+Yahoo Finance (each `yf.Ticker`) and OpenAI (through `openai.requestssession`,
+set in llm.py) get one session each, so a TLS connection opened for one call
+is reused by the next call, thread or user instead of being set up again.
+By default openai keeps a session per thread, and every GPT attempt runs on
+a new thread, so nothing was reused.
+
+Pool size: HTTP_POOL_MAXSIZE idle connections kept per host (or e.g.
+OPENAI_POOL_MAXSIZE for one client). Pools do not block: a burst beyond the
+size opens extra connections, which are closed when returned to a full pool
+and show up as `discarded`; raise the size when that count keeps growing.
+
+`python fake_openai.py --pool` measures the reuse rate against a local stub
+server.
+"""
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "4"))  # Hosts kept per client
+POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "16"))  # Idle connections kept per host
+
+
+class PoolStats:
+    """Counters for one client, across all of its hosts."""
+
+    def __init__(self, name: str, maxsize: int):
+        self.name = name
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self.checkouts = 0  # Connections taken from the pool, i.e. requests sent
+        self.connects = 0  # New TCP (and TLS) connections, first ones and reconnects
+        self.discarded = 0  # Returned to a full pool and closed
+        self.checkout_seconds = 0.0
+        self.max_checkout = 0.0
+        self.connect_seconds = 0.0
+
+    def checked_out(self, seconds: float) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.checkout_seconds += seconds
+            self.max_checkout = max(self.max_checkout, seconds)
+
+    def connected(self, seconds: float) -> None:
+        with self._lock:
+            self.connects += 1
+            self.connect_seconds += seconds
+
+    def discard(self) -> None:
+        with self._lock:
+            self.discarded += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "name": self.name,
+                "maxsize": self.maxsize,
+                "requests": self.checkouts,
+                "connects": self.connects,
+                "reuse_rate": max(0.0, 1 - self.connects / self.checkouts) if self.checkouts else 0.0,
+                "discarded": self.discarded,
+                "avg_checkout_ms": self.checkout_seconds / self.checkouts * 1000 if self.checkouts else 0.0,
+                "max_checkout_ms": self.max_checkout * 1000,
+                "avg_connect_ms": self.connect_seconds / self.connects * 1000 if self.connects else 0.0,
+            }
+
+
+class _CountingPool:
+    """Mixed into urllib3's connection pools; `stats` is set per client."""
+
+    stats: PoolStats = None
+
+    def _get_conn(self, timeout=None):
+        start = time.perf_counter()
+        conn = super()._get_conn(timeout)
+        self.stats.checked_out(time.perf_counter() - start)
+        return conn
+
+    def _put_conn(self, conn) -> None:
+        if conn is not None and self.pool is not None and self.pool.full():
+            self.stats.discard()
+        super()._put_conn(conn)
+
+
+def _counting_pool(base: type, stats: PoolStats) -> type:
+    connection_cls = base.ConnectionCls
+
+    class CountingConnection(connection_cls):
+        def connect(self) -> None:
+            start = time.perf_counter()
+            super().connect()
+            stats.connected(time.perf_counter() - start)
+
+    return type(f"Counting{base.__name__}", (_CountingPool, base),
+                {"stats": stats, "ConnectionCls": CountingConnection})
+
+
+class CountingAdapter(HTTPAdapter):
+    """HTTPAdapter whose connection pools report to a PoolStats."""
+
+    def __init__(self, stats: PoolStats, **kwargs):
+        self.stats = stats  # Before super().__init__, which builds the pool manager
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _counting_pool(HTTPConnectionPool, self.stats),
+            "https": _counting_pool(HTTPSConnectionPool, self.stats),
+        }
+
+
+class SharedSession(requests.Session):
+    """A Session that outlives `close()`.
+
+    openai closes "its" session every few minutes; on a shared session that
+    would drop every pooled connection under all the other threads.
+    """
+
+    def close(self) -> None:
+        pass
+
+    def shutdown(self) -> None:
+        super().close()
+
+
+_sessions = {}
+_stats = {}
+_sessions_lock = threading.Lock()
+
+
+def get_http_session(name: str) -> SharedSession:
+    """Process-wide keep-alive session for `name` ("yahoo" or "openai")."""
+    with _sessions_lock:
+        if name not in _sessions:
+            maxsize = int(os.getenv(f"{name.upper()}_POOL_MAXSIZE", POOL_MAXSIZE))
+            stats = PoolStats(name, maxsize)
+            adapter = CountingAdapter(stats, pool_connections=POOL_CONNECTIONS, pool_maxsize=maxsize)
+            session = SharedSession()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[name], _stats[name] = session, stats
+        return _sessions[name]
+
+
+def pool_metrics() -> list:
+    with _sessions_lock:
+        stats = list(_stats.values())
+    return [pool.snapshot() for pool in stats]
+
+
+def describe(pool: dict) -> str:
+    """One line for logs and page captions."""
+    return (f"{pool['name']} connections: {pool['reuse_rate']:.0%} reused over {pool['requests']} requests "
+            f"({pool['connects']} opened, {pool['avg_connect_ms']:.0f} ms each; "
+            f"checkout wait avg {pool['avg_checkout_ms']:.2f} ms, max {pool['max_checkout_ms']:.1f} ms; "
+            f"{pool['discarded']} discarded).")
@@ -0,0 +1,270 @@
+"""Background jobs that outlive Streamlit reruns.
+
+A page submits work with `get_job_queue().submit(kind, runner, **params)`
+and keeps only the returned job ID (in `st.session_state` and the URL). The
+runner executes on a local thread pool as `runner(job, **params)`, reports
+progress through `job.set_section` / `job.note`, calls `job.check_cancelled()`
+between steps, and returns a JSON-serialisable dict (plus optional "pdf"
+bytes). Reruns, download clicks and reloads only poll the job, so a
+finished or running generation is never thrown away or started twice.
+
+Finished jobs are written to a SQLite job store, so results survive a
+server restart. Objects that cannot be stored (traces, stats, Ticker
+sessions) go in `job.live` and are only available in the process that ran
+the job. A finished job is dropped from memory once nobody has looked at it
+for JOB_MEMORY_SECONDS; `get` reloads it from the store, without `live`.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from typing import Callable, Optional
+
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", os.path.join(".cache", "jobs.sqlite3"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", str(7 * 24 * 3600)))
+# Seconds a finished job (PDF, trace, Ticker session) stays in memory after it was last read
+JOB_MEMORY_SECONDS = int(os.getenv("JOB_MEMORY_SECONDS", "3600"))
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED, INTERRUPTED = (
+    "queued", "running", "done", "failed", "cancelled", "interrupted"
+)
+FINISHED = {DONE, FAILED, CANCELLED, INTERRUPTED}
+
+
+class Job:
+    def __init__(self, kind: str, params: dict, sections: int = 0, job_id: Optional[str] = None):
+        self.job_id = job_id or uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.params = params
+        self.status = QUEUED
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.error = None
+        self.messages = []
+        # Per section: "queued" -> "writing" -> "done", with the text so far
+        self.sections = [{"status": QUEUED, "text": "", "chart": ""} for _ in range(sections)]
+        self.result = None
+        self.live = {}
+        self.cancel_event = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED
+
+    @property
+    def elapsed(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    def check_cancelled(self) -> None:
+        if self.cancel_event.is_set():
+            raise CancelledError()
+
+    def set_section(self, index: int, status: str, text: Optional[str] = None, chart: Optional[str] = None) -> None:
+        with self._lock:
+            section = self.sections[index]
+            section["status"] = status
+            if text is not None:
+                section["text"] = text
+            if chart is not None:
+                section["chart"] = chart
+
+    def note(self, message: str) -> None:
+        with self._lock:
+            self.messages.append(message)
+
+    def progress(self) -> list:
+        """Copy of the per-section progress, safe to read while the job runs."""
+        with self._lock:
+            return [dict(section) for section in self.sections]
+
+    def sections_done(self) -> int:
+        with self._lock:
+            return sum(section["status"] == DONE for section in self.sections)
+
+
+class JobStore:
+    """SQLite table of jobs: parameters, status and, once finished, the result and PDF."""
+
+    def __init__(self, path: str = JOB_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                params TEXT NOT NULL,
+                status TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                error TEXT,
+                messages TEXT,
+                result TEXT,
+                pdf BLOB
+            )
+            """
+        )
+        self._conn.commit()
+
+    def save(self, job: Job) -> None:
+        result = dict(job.result or {})
+        pdf = result.pop("pdf", None)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job.job_id, job.kind, json.dumps(job.params, default=str), job.status, job.created_at,
+                 job.started_at, job.finished_at, job.error, json.dumps(job.messages),
+                 json.dumps(result, default=str) if job.result is not None else None, pdf),
+            )
+            self._conn.commit()
+
+    def load(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT kind, params, status, created_at, started_at, finished_at, error, messages, result, pdf "
+                "FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        kind, params, status, created_at, started_at, finished_at, error, messages, result, pdf = row
+        job = Job(kind, json.loads(params), job_id=job_id)
+        job.status = status if status in FINISHED else INTERRUPTED  # Its process is gone
+        job.created_at, job.started_at, job.finished_at = created_at, started_at, finished_at
+        job.error = error
+        job.messages = json.loads(messages or "[]")
+        if result is not None:
+            job.result = json.loads(result)
+            if pdf is not None:
+                job.result["pdf"] = bytes(pdf)
+            job.sections = [{"status": DONE, "text": section.get("markdown", ""), "chart": section.get("chart", "")}
+                            for section in job.result.get("sections", [])]
+        return job
+
+    def prune(self, max_age: int = JOB_RETENTION_SECONDS) -> int:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM jobs WHERE created_at < ?", (time.time() - max_age,))
+            self._conn.commit()
+            return cursor.rowcount
+
+
+class JobQueue:
+    """Local worker pool plus the in-memory table of this process's jobs."""
+
+    def __init__(self, workers: int = JOB_WORKERS, store: Optional[JobStore] = None,
+                 memory_seconds: int = JOB_MEMORY_SECONDS):
+        self.store = store or JobStore()
+        self.memory_seconds = memory_seconds
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="memo-job")
+        self._jobs = {}
+        self._read_at = {}  # job_id -> when get() last returned it
+        self._lock = threading.Lock()
+        try:
+            removed = self.store.prune()
+            if removed:
+                print(f"[INFO] Removed {removed} old jobs from the job store.")
+        except sqlite3.Error as e:
+            print(f"[WARN] Could not prune the job store: {e}")
+
+    def submit(self, kind: str, runner: Callable, sections: int = 0, **params) -> str:
+        """Queue `runner(job, **params)` and return the job ID straight away."""
+        job = Job(kind, params, sections)
+        self._evict()
+        with self._lock:
+            self._jobs[job.job_id] = job
+        self._save(job)
+        self._pool.submit(self._run, job, runner)
+        print(f"[INFO] Job {job.job_id} ({kind}) queued.")
+        return job.job_id
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """The job from this process, or from the job store if it ran before a restart."""
+        self._evict()
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            job = self.store.load(job_id)
+            if job is not None:
+                with self._lock:
+                    job = self._jobs.setdefault(job_id, job)
+        if job is not None:
+            with self._lock:
+                self._read_at[job_id] = time.time()
+        return job
+
+    def _evict(self) -> None:
+        """Forget finished jobs not read for `memory_seconds`; they stay in the store."""
+        cutoff = time.time() - self.memory_seconds
+        with self._lock:
+            idle = [job_id for job_id, job in self._jobs.items()
+                    if job.finished and max(job.finished_at or 0.0, self._read_at.get(job_id, 0.0)) < cutoff]
+            for job_id in idle:
+                del self._jobs[job_id]
+                self._read_at.pop(job_id, None)
+
+    def cancel(self, job_id: str) -> bool:
+        """Ask a queued or running job to stop; returns False if it already finished."""
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return False
+        job.cancel_event.set()
+        return True
+
+    def update_result(self, job: Job, **changes) -> None:
+        """Change a finished job's result (e.g. after one section is rewritten) and store it."""
+        with job._lock:
+            job.result = {**(job.result or {}), **changes}
+        self._save(job)
+
+    def _save(self, job: Job) -> None:
+        try:
+            self.store.save(job)
+        except sqlite3.Error as e:
+            print(f"[WARN] Could not save job {job.job_id}: {e}")
+
+    def _run(self, job: Job, runner: Callable) -> None:
+        if job.cancel_event.is_set():
+            job.status, job.finished_at = CANCELLED, time.time()
+            self._save(job)
+            return
+        job.status, job.started_at = RUNNING, time.time()
+        self._save(job)
+        try:
+            result = runner(job, **job.params)
+            job.result = result
+            job.status = DONE
+        except CancelledError:
+            job.status = CANCELLED
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}"
+            job.status = FAILED
+            print(f"[ERROR] Job {job.job_id} ({job.kind}) failed: {job.error}")
+        job.finished_at = time.time()
+        self._save(job)
+        print(f"[INFO] Job {job.job_id} ({job.kind}) {job.status} after {job.elapsed:.1f} seconds.")
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """Process-wide job queue, shared by every Streamlit session."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue()
+        return _queue
@@ -0,0 +1,417 @@
+import contextvars
+import os
+import queue
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import numpy as np
+import openai
+import requests
+
+from http_pool import get_http_session
+from llm_cache import completion_key, get_cache
+from prompt_builder import count_tokens
+from rate_limit import RateLimitTimeout, backoff_delay, get_limiter, retry_after_seconds
+from tracing import span
+
+MODEL_NAME = "chatgpt-4o-latest"
+
+# Minimum seconds between on_text callbacks, so the UI is not redrawn per token
+STREAM_UPDATE_INTERVAL = 0.1
+# Attempts per call (first try included) for 429s, 5xx, timeouts and dropped connections
+MAX_ATTEMPTS = int(os.getenv("GPT_MAX_ATTEMPTS", "3"))
+# Default budget for one call, retries included; sections pass their own
+DEFAULT_DEADLINE = float(os.getenv("GPT_DEADLINE_SECONDS", "180"))
+CONNECT_TIMEOUT = 10.0
+# Longest silence between streamed chunks before the attempt counts as hung
+STALL_TIMEOUT = float(os.getenv("GPT_STALL_TIMEOUT_SECONDS", "60"))
+# Fire a second request when the first has no token by the p95 time to first token
+HEDGE = os.getenv("GPT_HEDGE", "1") == "1"
+HEDGE_PERCENTILE = 95
+HEDGE_MIN_SAMPLES = 20  # No hedging until this many first-token times are known
+LATENCY_WINDOW = 200
+
+# One keep-alive pool for every GPT call; openai would otherwise open a
+# session per thread, and each attempt runs on a thread of its own
+if openai.requestssession is None:
+    openai.requestssession = get_http_session("openai")
+
+
+class LLMError(Exception):
+    """A GPT call failed after its retries, or ran out of time."""
+
+
+class DeadlineExceeded(LLMError):
+    pass
+
+
+# Failures of the request itself; anything else (e.g. raised by on_text) is not retried
+API_ERRORS = (openai.error.OpenAIError, requests.exceptions.RequestException)
+RETRYABLE_ERRORS = (
+    openai.error.RateLimitError, openai.error.Timeout, openai.error.APIConnectionError,
+    openai.error.ServiceUnavailableError, openai.error.TryAgain,
+    requests.exceptions.RequestException,  # Connection dropped or stalled mid-stream
+)
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, openai.error.RateLimitError):
+        return "insufficient_quota" not in str(error)  # Out of credit; retrying will not help
+    if isinstance(error, RETRYABLE_ERRORS):
+        return True
+    if isinstance(error, openai.error.APIError):  # 5xx and malformed responses
+        return error.http_status is None or error.http_status >= 500
+    return False
+
+
+@dataclass
+class StreamStats:
+    """Latency figures for one streamed completion."""
+    ttft: Optional[float] = None  # Seconds until the first content token
+    elapsed: float = 0.0
+    tokens: int = 0               # Content chunks received (one token each)
+    cached: bool = False
+    prompt_tokens: int = 0        # From the API's usage block; streamed responses have none
+    attempts: int = 0             # Requests sent, hedges and retries included
+    hedged: bool = False
+    wasted_tokens: int = 0        # Tokens streamed by attempts that were thrown away
+
+    @property
+    def tokens_per_sec(self) -> float:
+        if self.ttft is None or self.elapsed <= self.ttft:
+            return 0.0
+        return self.tokens / (self.elapsed - self.ttft)
+
+
+class LLMMetrics:
+    """Process-wide counters for retries, hedges and wasted work, plus recent first-token times."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ttft = {}  # model -> deque of seconds
+        self.calls = 0
+        self.attempts = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.hedges_skipped = 0  # Hedges not sent because the rate limiter had no free slot
+        self.wasted_tokens = 0
+        self.deadline_exceeded = 0
+        self.failures = 0
+        self.errors = {}  # exception name -> count
+
+    def add(self, **counts) -> None:
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def error(self, error: Exception) -> None:
+        with self._lock:
+            name = type(error).__name__
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+    def observe_ttft(self, model: str, seconds: float) -> None:
+        with self._lock:
+            self._ttft.setdefault(model, deque(maxlen=LATENCY_WINDOW)).append(seconds)
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        """The p95 time to first token for `model`, or None while there are too few samples."""
+        with self._lock:
+            samples = list(self._ttft.get(model, ()))
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return float(np.percentile(samples, HEDGE_PERCENTILE))
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls, "attempts": self.attempts, "retries": self.retries,
+                "hedges": self.hedges, "hedge_wins": self.hedge_wins, "hedges_skipped": self.hedges_skipped,
+                "wasted_tokens": self.wasted_tokens,
+                "deadline_exceeded": self.deadline_exceeded, "failures": self.failures,
+                "errors": dict(self.errors),
+            }
+
+
+_metrics = LLMMetrics()
+
+
+def llm_metrics() -> LLMMetrics:
+    return _metrics
+
+
+class _Attempt:
+    """One streamed request on its own thread, reporting "sent"/"token"/"done" events to the caller."""
+
+    def __init__(self, request: dict, events: queue.Queue, read_timeout: float, acquired: bool = False):
+        self.request = request
+        self.acquired = acquired  # The caller already took a rate limiter slot
+        self.events = events
+        self.read_timeout = read_timeout
+        self.parts = []
+        self.error = None
+        self.ttft = None
+        self.first_token_at = None  # perf_counter() of the first content token
+        self.cancelled = threading.Event()
+        self.finished = False
+        self.start = None  # Set once the request leaves the rate limiter
+        context = contextvars.copy_context()
+        self.thread = threading.Thread(target=context.run, args=(self._run,), daemon=True, name="gpt-attempt")
+        self.thread.start()
+
+    @property
+    def tokens(self) -> int:
+        return len(self.parts)
+
+    def text(self) -> str:
+        return "".join(self.parts)
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+
+    def _run(self) -> None:
+        try:
+            if not self.acquired:
+                get_limiter("openai").acquire()
+            self.start = time.perf_counter()  # Time queued at the limiter does not count toward hedging
+            self.events.put((self, "sent"))
+            response = openai.ChatCompletion.create(**self.request, stream=True,
+                                                    request_timeout=(CONNECT_TIMEOUT, self.read_timeout))
+            for chunk in response:
+                if self.cancelled.is_set():
+                    close = getattr(response, "close", None)
+                    if close is not None:
+                        close()  # Drop the connection instead of reading the rest
+                    break
+                delta = chunk["choices"][0].get("delta", {}).get("content")
+                if not delta:
+                    continue
+                if self.ttft is None:
+                    self.first_token_at = time.perf_counter()
+                    self.ttft = self.first_token_at - self.start
+                self.parts.append(delta)
+                self.events.put((self, "token"))
+        except Exception as e:
+            self.error = e
+        finally:
+            self.finished = True
+            self.events.put((self, "done"))
+
+
+def _attempt_call(request: dict, model: str, on_text, deadline_at: float, stats: StreamStats) -> str:
+    """Send the request (and maybe a hedge), stream the winner into `on_text`, return its text.
+
+    Raises the winning attempt's error, or DeadlineExceeded if nothing
+    finished in time. Losing attempts are cancelled and their tokens counted
+    as wasted.
+
+    Time to first token is what the caller waited: from the first request's
+    send to the winner's first token. That is also the sample kept for the
+    hedge delay, so a slow request that gets hedged still counts (as at
+    least the hedge delay) instead of being replaced by the hedge's time.
+    """
+    events = queue.Queue()
+    remaining = deadline_at - time.perf_counter()
+    read_timeout = max(1.0, min(STALL_TIMEOUT, remaining))
+    attempts = [_Attempt(request, events, read_timeout)]
+    stats.attempts += 1
+    _metrics.add(attempts=1)
+    hedge_delay = _metrics.hedge_delay(model) if HEDGE else None
+    winner = None
+    last_update = 0.0
+    try:
+        while True:
+            now = time.perf_counter()
+            timeout = deadline_at - now
+            hedge_at = None
+            if hedge_delay is not None and len(attempts) == 1 and attempts[0].start is not None:
+                hedge_at = attempts[0].start + hedge_delay
+            if winner is None and hedge_at is not None:
+                timeout = min(timeout, hedge_at - now)
+            try:
+                attempt, kind = events.get(timeout=max(0.0, timeout))
+            except queue.Empty:
+                if time.perf_counter() >= deadline_at:
+                    raise DeadlineExceeded(f"No complete answer from {model} within the deadline.")
+                # Still no token at the p95 time: race a second request against the
+                # first, unless that means queueing at the limiter behind other calls
+                try:
+                    get_limiter("openai").acquire(max_wait=0)
+                except RateLimitTimeout:
+                    hedge_delay = None
+                    _metrics.add(hedges_skipped=1)
+                    continue
+                attempts.append(_Attempt(request, events, read_timeout, acquired=True))
+                stats.attempts += 1
+                stats.hedged = True
+                _metrics.add(attempts=1, hedges=1)
+                continue
+
+            if kind == "sent":
+                continue
+            if winner is None:
+                if kind == "token" or attempt.error is None:
+                    winner = attempt  # First to produce a token (or to finish cleanly) wins
+                    for other in attempts:
+                        if other is not winner:
+                            other.cancel()
+                    if winner is not attempts[0]:
+                        _metrics.add(hedge_wins=1)
+                elif all(other.finished for other in attempts):
+                    raise attempt.error
+                else:
+                    continue  # The other request may still answer
+            if attempt is not winner:
+                continue
+            if kind == "done":
+                if winner.error is not None:
+                    raise winner.error
+                stats.tokens = winner.tokens
+                return winner.text()
+            if on_text is not None and time.perf_counter() - last_update >= STREAM_UPDATE_INTERVAL:
+                last_update = time.perf_counter()
+                stats.ttft, stats.tokens = winner.first_token_at - attempts[0].start, winner.tokens
+                stats.elapsed = last_update - attempts[0].start
+                on_text(winner.text(), stats)
+    finally:
+        for attempt in attempts:
+            attempt.cancel()
+            if attempt is not winner or winner.error is not None or not winner.finished:
+                stats.wasted_tokens += attempt.tokens
+        if winner is not None and winner.first_token_at is not None:
+            stats.ttft = winner.first_token_at - attempts[0].start
+            _metrics.observe_ttft(model, stats.ttft)
+
+
+def stream_chat(
+    system_prompt: str,
+    user_prompt: str,
+    on_text: Optional[Callable[[str, StreamStats], None]] = None,
+    model: str = MODEL_NAME,
+    temperature: float = 0.7,
+    max_tokens: int = 6000,
+    deadline: float = DEFAULT_DEADLINE,
+):
+    """Stream a chat completion and return `(text, stats)`.
+
+    `on_text(text_so_far, stats)` is called as tokens arrive (throttled to
+    STREAM_UPDATE_INTERVAL) and once more with the complete text; after a
+    retry it starts again from the new attempt's text.
+
+    The whole call, retries included, must finish within `deadline` seconds.
+    Rate limits, 5xx, timeouts and dropped connections are retried up to
+    MAX_ATTEMPTS times with jittered backoff (a 429 pauses the shared
+    limiter instead). With HEDGE on, an attempt that has no token by the
+    model's recent p95 time to first token is raced by a duplicate request.
+    Raises LLMError (or DeadlineExceeded) once that budget is spent.
+    """
+    stats = StreamStats()
+    start_time = time.perf_counter()
+    deadline_at = start_time + deadline
+    request = {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ],
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+    }
+    _metrics.add(calls=1)
+    attempt = 0
+    while True:
+        try:
+            text = _attempt_call(request, model, on_text, deadline_at, stats)
+            break
+        except DeadlineExceeded:
+            _metrics.add(deadline_exceeded=1, failures=1, wasted_tokens=stats.wasted_tokens)
+            raise
+        except Exception as e:
+            if not isinstance(e, API_ERRORS):
+                _metrics.add(wasted_tokens=stats.wasted_tokens)
+                raise  # Not an API error (e.g. on_text cancelled the call)
+            _metrics.error(e)
+            attempt += 1
+            if isinstance(e, openai.error.RateLimitError):
+                delay = retry_after_seconds(e.headers) or backoff_delay(attempt - 1, base=2.0)
+            else:
+                delay = backoff_delay(attempt - 1, base=1.0)
+            if not is_retryable(e) or attempt >= MAX_ATTEMPTS or time.perf_counter() + delay >= deadline_at:
+                _metrics.add(failures=1, wasted_tokens=stats.wasted_tokens)
+                raise LLMError(f"GPT call failed after {stats.attempts} attempt(s): {type(e).__name__}: {e}") from e
+            print(f"[WARN] GPT attempt {attempt} failed ({type(e).__name__}: {e}); retrying in {delay:.1f}s.")
+            _metrics.add(retries=1)
+            if isinstance(e, openai.error.RateLimitError):
+                get_limiter("openai").pause(delay)  # Every caller waits, not just this one
+            else:
+                time.sleep(delay)
+
+    _metrics.add(wasted_tokens=stats.wasted_tokens)
+    stats.elapsed = time.perf_counter() - start_time
+    if on_text is not None:
+        on_text(text, stats)
+    ttft = stats.ttft if stats.ttft is not None else stats.elapsed
+    print(f"[INFO] GPT stream took {stats.elapsed:.2f} seconds "
+          f"(first token {ttft:.2f}s, {stats.tokens_per_sec:.1f} tokens/sec"
+          f"{', hedged' if stats.hedged else ''}{f', {stats.attempts} attempts' if stats.attempts > 1 else ''}).")
+    return text, stats
+
+
+def chat_completion(
+    system_prompt: str,
+    user_prompt: str,
+    on_text: Optional[Callable[[str, StreamStats], None]] = None,
+    model: str = MODEL_NAME,
+    temperature: float = 0.7,
+    max_tokens: int = 6000,
+    use_cache: bool = True,
+    deadline: float = DEFAULT_DEADLINE,
+):
+    """Cached chat completion returning `(text, stats)`.
+
+    Streams through `on_text` when it is given. A cache hit is delivered to
+    `on_text` in one piece. With `use_cache=False` the cache is not read, but
+    the fresh answer still replaces the stored one. Misses go through
+    stream_chat, so they get its deadline, retries and hedging, and raise
+    LLMError instead of returning partial or error text.
+    """
+    with span("gpt", model=model, max_tokens=max_tokens, deadline=deadline) as gpt_span:
+        text, stats = _chat_completion(system_prompt, user_prompt, on_text, model,
+                                       temperature, max_tokens, use_cache, deadline)
+        gpt_span.set(
+            attempts=stats.attempts,
+            hedged=stats.hedged,
+            wasted_tokens=stats.wasted_tokens,
+            cached=stats.cached,
+            prompt_tokens=stats.prompt_tokens or count_tokens(system_prompt) + count_tokens(user_prompt),
+            completion_tokens=stats.tokens or (count_tokens(text) if text else 0),
+            ttft=round(stats.ttft, 4) if stats.ttft is not None else None,
+            bytes=len(text.encode("utf-8")) if text else 0,
+        )
+    return text, stats
+
+
+def _chat_completion(system_prompt, user_prompt, on_text, model, temperature, max_tokens, use_cache, deadline):
+    cache = get_cache()
+    key = completion_key(model, system_prompt, user_prompt, temperature, max_tokens)
+    if use_cache:
+        start_time = time.perf_counter()
+        text = cache.get(key)
+        if text is not None:
+            elapsed = time.perf_counter() - start_time
+            stats = StreamStats(ttft=elapsed, elapsed=elapsed, cached=True)
+            if on_text is not None:
+                on_text(text, stats)
+            print(f"[INFO] GPT cache hit took {elapsed:.4f} seconds.")
+            return text, stats
+
+    # Always streamed, even without on_text: a stalled answer is noticed at
+    # the first silent chunk and a hedge can win as soon as it has a token
+    text, stats = stream_chat(system_prompt, user_prompt, on_text=on_text, model=model,
+                              temperature=temperature, max_tokens=max_tokens, deadline=deadline)
+    if text:
+        cache.put(key, text)
+    return text, stats
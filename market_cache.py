@@ -0,0 +1,181 @@
+"""On-disk fundamentals cache with stale-while-revalidate.
+
+Entries are keyed by ticker and the set of fields requested. A fresh entry
+is returned as is; an expired one is still returned immediately while a
+background thread refetches it; only a missing (or very old) entry makes
+the caller wait for Yahoo.
+
+    python market_cache.py warm tickers.txt    # one ticker per line
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Optional
+
+CACHE_PATH = os.getenv("MARKET_CACHE_PATH", os.path.join(".cache", "market_data.sqlite3"))
+FRESH_SECONDS = int(os.getenv("MARKET_CACHE_FRESH_SECONDS", "3600"))
+MAX_STALE_SECONDS = int(os.getenv("MARKET_CACHE_MAX_STALE_SECONDS", str(7 * 24 * 3600)))
+REFRESH_WORKERS = 2
+
+
+def cache_key(ticker_symbol: str, fields: Iterable[str]) -> str:
+    field_hash = hashlib.sha1(",".join(sorted(fields)).encode("utf-8")).hexdigest()[:12]
+    return f"{ticker_symbol.strip().upper()}:{field_hash}"
+
+
+class FundamentalsCache:
+    def __init__(self, path: str = CACHE_PATH, fresh_seconds: int = FRESH_SECONDS,
+                 max_stale_seconds: int = MAX_STALE_SECONDS):
+        self.fresh_seconds = fresh_seconds
+        self.max_stale_seconds = max_stale_seconds
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._refresh_pool = ThreadPoolExecutor(max_workers=REFRESH_WORKERS,
+                                                thread_name_prefix="market-refresh")
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS fundamentals (
+                key TEXT PRIMARY KEY,
+                ticker TEXT NOT NULL,
+                data TEXT NOT NULL,
+                fetched_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+    def _load(self, key: str):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, fetched_at FROM fundamentals WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None, None
+        return json.loads(row[0]), row[1]
+
+    def _store(self, key: str, ticker_symbol: str, data: dict) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO fundamentals (key, ticker, data, fetched_at) VALUES (?, ?, ?, ?)",
+                (key, ticker_symbol.strip().upper(), json.dumps(data, default=str), time.time()),
+            )
+            self._conn.commit()
+
+    def get(self, ticker_symbol: str, fields: Iterable[str], fetch: Callable[[], dict],
+            refresh: Optional[Callable[[], dict]] = None) -> dict:
+        """Cached `fetch()` result for this ticker and field set.
+
+        `refresh` replaces `fetch` for background refreshes, for callers whose
+        fetch reports progress to a UI that a background thread cannot reach.
+        """
+        fields = list(fields)
+        key = cache_key(ticker_symbol, fields)
+        data, fetched_at = self._load(key)
+        age = time.time() - fetched_at if fetched_at is not None else None
+
+        if age is not None and age < self.fresh_seconds:
+            self.hits += 1
+            return data
+        if age is not None and age < self.max_stale_seconds:
+            self.stale_hits += 1
+            self._refresh_later(key, ticker_symbol, refresh or fetch)
+            return data
+
+        self.misses += 1
+        data = fetch()
+        self._store(key, ticker_symbol, data)
+        return data
+
+    def _refresh_later(self, key: str, ticker_symbol: str, fetch: Callable[[], dict]) -> None:
+        with self._lock:
+            if key in self._refreshing:
+                return  # Someone already asked; one refetch per entry is enough
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self._store(key, ticker_symbol, fetch())
+                print(f"[INFO] Refreshed cached market data for {ticker_symbol}.")
+            except Exception as e:
+                print(f"[WARN] Background refresh for {ticker_symbol} failed: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        self._refresh_pool.submit(refresh)
+
+    def warm(self, tickers: Iterable[str], fields: Iterable[str], fetch: Callable[[str], dict],
+             concurrency: int = 4) -> dict:
+        """Fetch every ticker that is missing or expired; returns {ticker: error or None}."""
+        fields = list(fields)
+        results = {}
+
+        def warm_one(ticker_symbol: str) -> None:
+            key = cache_key(ticker_symbol, fields)
+            _, fetched_at = self._load(key)
+            if fetched_at is None or time.time() - fetched_at >= self.fresh_seconds:
+                self._store(key, ticker_symbol, fetch(ticker_symbol))
+
+        with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="market-warm") as pool:
+            futures = {pool.submit(warm_one, ticker): ticker for ticker in tickers}
+            for future, ticker in futures.items():
+                try:
+                    future.result()
+                    results[ticker] = None
+                except Exception as e:
+                    results[ticker] = str(e)
+        return results
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "stale_hits": self.stale_hits, "misses": self.misses}
+
+
+_cache: Optional[FundamentalsCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_market_cache() -> FundamentalsCache:
+    """Process-wide cache instance, shared by every Streamlit session."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = FundamentalsCache()
+        return _cache
+
+
+def main():
+    from pipeline import RELEVANT_KEYS, fetch_yfinance_data
+
+    parser = argparse.ArgumentParser(description="Fundamentals cache tools")
+    parser.add_argument("command", choices=["warm"])
+    parser.add_argument("ticker_file", help="Text file with one ticker per line")
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    with open(args.ticker_file, encoding="utf-8") as f:
+        tickers = [line.strip().upper() for line in f if line.strip() and not line.startswith("#")]
+    start_time = time.time()
+    results = get_market_cache().warm(tickers, RELEVANT_KEYS, fetch_yfinance_data,
+                                      concurrency=args.concurrency)
+    failed = {ticker: error for ticker, error in results.items() if error}
+    for ticker, error in failed.items():
+        print(f"[ERROR] {ticker}: {error}")
+    print(f"[INFO] Warmed {len(results) - len(failed)}/{len(results)} tickers "
+          f"in {time.time() - start_time:.1f} seconds.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Memo HTML built from per-section fragments.
+
+The markdown converter and the page template are built once at import.
+Each section is converted on its own and memoized by a hash of its
+markdown, so re-exporting a memo where one section changed only converts
+that section; the page is then assembled from the cached fragments.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List
+
+import markdown2
+
+FRAGMENT_CACHE_ENTRIES = 256
+MEMO_TITLE = "# Investment Memorandum"
+
+MEMO_CSS = """\
+<style>
+    @page {
+        margin: 1in;
+    }
+    body {
+        font-family: "Times New Roman", serif;
+        margin: 0;
+        padding: 0;
+        font-size: 11.5pt;
+        line-height: 1.5;
+        color: #000;
+    }
+    header {
+        text-align: center;
+        border-bottom: 1px solid #333;
+        margin-bottom: 20px;
+        padding-bottom: 8px;
+    }
+    header h1 {
+        font-family: "Times New Roman", serif;
+        font-size: 20pt;
+        margin: 0;
+    }
+    h1, h2, h3, h4, h5, h6 {
+        font-family: "Georgia", serif;
+        color: #333;
+        margin-top: 16pt;
+        margin-bottom: 8pt;
+        page-break-after: avoid;
+    }
+    h1 {
+        font-size: 18pt;
+        border-bottom: 2px solid #333;
+        padding-bottom: 4px;
+    }
+    h2 {
+        font-size: 16pt;
+        margin-top: 14pt;
+        margin-bottom: 6pt;
+    }
+    p {
+        margin: 0 0 12pt 0;
+        text-align: justify;
+    }
+    table {
+        width: 100%;
+        border-collapse: collapse;
+        margin: 15pt 0;
+        font-size: 11.5pt;
+    }
+    ul, ol {
+        margin: 0 0 12pt 20pt;
+        padding: 0;
+    }
+    ul ul, ol ul, ul ol, ol ol {
+        margin-left: 14pt;
+        margin-bottom: 0;
+        margin-top: 0;
+    }
+    li {
+        margin-bottom: 4pt;
+    }
+    th, td {
+        border: 1px solid #666;
+        padding: 5px;
+        text-align: left;
+    }
+    th {
+        background-color: #eaeaea;
+        font-weight: bold;
+    }
+    .page-break {
+        page-break-before: always;
+    }
+</style>
+"""
+
+HEADER_HTML = """\
+<header>
+    <h1>Investment Memorandum</h1>
+</header>
+"""
+
+PAGE_PREFIX = f"<!DOCTYPE html><html><head>{MEMO_CSS}</head><body>{HEADER_HTML}"
+PAGE_SUFFIX = "</body></html>"
+
+# markdown2.Markdown keeps per-conversion state on the instance, so one
+# converter is shared behind a lock (conversion holds the GIL anyway)
+_converter = markdown2.Markdown(extras=["tables"])
+_converter_lock = threading.Lock()
+
+_fragments = OrderedDict()  # sha256 of section markdown -> HTML, least recently used first
+_fragments_lock = threading.Lock()
+hits = 0
+misses = 0
+
+
+def section_key(section_markdown: str) -> str:
+    return hashlib.sha256(section_markdown.encode("utf-8")).hexdigest()
+
+
+def section_html(section_markdown: str):
+    """`(html, converted)` for one section; each distinct content is converted at most once."""
+    global hits, misses
+    key = section_key(section_markdown)
+    with _fragments_lock:
+        fragment = _fragments.get(key)
+        if fragment is not None:
+            _fragments.move_to_end(key)
+            hits += 1
+            return fragment, False
+        misses += 1
+    with _converter_lock:
+        fragment = _converter.convert(section_markdown)
+    with _fragments_lock:
+        _fragments[key] = fragment
+        while len(_fragments) > FRAGMENT_CACHE_ENTRIES:
+            _fragments.popitem(last=False)
+    return fragment, True
+
+
+def render_memo_html(sections_markdown: List[str]):
+    """`(page_html, sections_converted)` for a memo given as a list of section markdown."""
+    # Sections are stripped of the memo title, as assemble_markdown does
+    results = [section_html(section.replace(MEMO_TITLE, "")) for section in sections_markdown]
+    page = PAGE_PREFIX + "\n".join(fragment for fragment, _ in results) + PAGE_SUFFIX
+    return page, sum(converted for _, converted in results)
+
+
+def stats() -> dict:
+    with _fragments_lock:
+        return {"hits": hits, "misses": misses, "entries": len(_fragments)}
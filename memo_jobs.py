@@ -0,0 +1,146 @@
+"""Memo generation as background jobs (see jobs.py).
+
+`submit_memo` queues a whole memo; `submit_section` queues a rewrite of one
+section of a finished memo and stores the new text and PDF back on the memo
+job. Both stream internally, so per-section progress and cancellation work
+whether or not the page shows the partial text.
+"""
+from documents import load_document_index
+from jobs import DONE, Job, get_job_queue
+from pipeline import (
+    CONSISTENCY_REVIEW, SECTION_TITLES, analytics_result, build_comparables, check_consistency,
+    generate_sections, get_financial_data, peer_results, regenerate_section, render_pdf_async,
+    review_consistency, start_analytics, start_peer_fetch,
+)
+from ticker_session import TickerData
+from tracing import start_trace
+
+WRITING = "writing"
+
+
+def memo_sections(sections: list) -> list:
+    return [section["markdown"] + section["chart"] for section in sections]
+
+
+def _pdf_fields(pdf_result) -> dict:
+    return {
+        "pdf": pdf_result.data,
+        "pdf_stats": {"render_seconds": pdf_result.render_seconds, "peak_rss_mb": pdf_result.peak_rss_mb},
+    }
+
+
+def _consistency_fields(sections: list, financial_data: dict, use_cache: bool = True) -> dict:
+    """Local check of every section; GPT only sees the flagged passages, if any."""
+    report = check_consistency([section["markdown"] for section in sections], financial_data)
+    review = review_consistency(report, financial_data, use_cache) if CONSISTENCY_REVIEW else ""
+    return {"consistency": {**report.to_dict(), "review": review}}
+
+
+def _documents(job: Job, document_hashes) -> list:
+    """Indexes of the memo's uploaded documents; ones that are no longer cached are skipped."""
+    documents = []
+    for file_hash in document_hashes or []:
+        index = load_document_index(file_hash)
+        if index is None:
+            job.note(f"An uploaded document ({file_hash[:12]}) is no longer indexed and was left out.")
+        else:
+            documents.append(index)
+    return documents
+
+
+def run_memo_job(job: Job, company_name: str, ticker_symbol: str, details: str = "", use_cache: bool = True,
+                 document_hashes: list = None, peer_symbols: list = None) -> dict:
+    section_stats = [None] * len(SECTION_TITLES)
+    sections = [None] * len(SECTION_TITLES)
+    job.live["section_stats"] = section_stats
+
+    def on_delta(index: int, text: str, stats) -> None:
+        section_stats[index] = stats
+        job.set_section(index, WRITING, text)
+
+    def on_section(index: int, section_markdown: str, chart: str) -> None:
+        sections[index] = {"markdown": section_markdown, "chart": chart}
+        job.set_section(index, DONE, section_markdown, chart)
+
+    with start_trace("memo", ticker=ticker_symbol, company=company_name, source="job", job=job.job_id) as trace:
+        job.live["trace"] = trace
+        ticker_data = TickerData(ticker_symbol)  # One Yahoo Ticker for info and chart history
+        job.live["ticker_data"] = ticker_data
+        peer_futures = start_peer_fetch(peer_symbols or [])  # Overlaps with the company's own fetch
+        analytics_future = start_analytics(ticker_symbol, peer_symbols, ticker_data)
+        financial_data = get_financial_data(ticker_symbol, on_retry=job.note, ticker_data=ticker_data)
+        comparables = build_comparables(ticker_symbol, financial_data, peer_results(peer_futures, job.note))
+        analytics = analytics_result(analytics_future, job.note)
+        job.check_cancelled()
+        generate_sections(
+            company_name, ticker_symbol, details, financial_data, use_cache=use_cache, stream=True,
+            on_section=on_section, on_delta=on_delta, ticker_data=ticker_data, cancel_event=job.cancel_event,
+            documents=_documents(job, document_hashes), comparables=comparables, analytics=analytics
+        )
+        job.check_cancelled()
+        pdf_future = render_pdf_async(memo_sections(sections))  # Renders while the check runs
+        consistency = _consistency_fields(sections, financial_data, use_cache)
+        pdf_result = pdf_future.result()
+
+    return {
+        "company_name": company_name,
+        "ticker_symbol": ticker_symbol,
+        "details": details,
+        "financial_data": financial_data,
+        "comparables": comparables,
+        "analytics": analytics,
+        "sections": sections,
+        **consistency,
+        **_pdf_fields(pdf_result),
+    }
+
+
+def run_section_job(job: Job, memo_job_id: str, index: int) -> dict:
+    """Rewrite section `index` of a finished memo job, then re-render that memo's PDF."""
+    queue = get_job_queue()
+    memo_job = queue.get(memo_job_id)
+    if memo_job is None or memo_job.status != DONE:
+        raise ValueError(f"Memo job {memo_job_id} has no finished memo to update.")
+    memo = memo_job.result
+    ticker_data = memo_job.live.setdefault("ticker_data", TickerData(memo["ticker_symbol"]))
+
+    def on_text(text: str, stats) -> None:
+        job.check_cancelled()  # Raised inside the stream, so the response is abandoned
+        job.set_section(0, WRITING, text)
+
+    with start_trace("section", ticker=memo["ticker_symbol"], company=memo["company_name"],
+                     section=index + 1, source="job", job=job.job_id) as trace:
+        section_markdown, chart, stats = regenerate_section(
+            index, memo["company_name"], memo["ticker_symbol"], memo["details"], memo["financial_data"],
+            on_text=on_text, ticker_data=ticker_data,
+            documents=_documents(job, memo_job.params.get("document_hashes")),
+            comparables=memo.get("comparables", ""), analytics=memo.get("analytics")
+        )
+        job.set_section(0, DONE, section_markdown, chart)
+        sections = list(memo["sections"])
+        sections[index] = {"markdown": section_markdown, "chart": chart}
+        # Unchanged sections reuse their memoized HTML fragments
+        pdf_future = render_pdf_async(memo_sections(sections))
+        consistency = _consistency_fields(sections, memo["financial_data"])
+        pdf_result = pdf_future.result()
+
+    job.check_cancelled()
+    queue.update_result(memo_job, sections=sections, **consistency, **_pdf_fields(pdf_result))
+    memo_job.set_section(index, DONE, section_markdown, chart)
+    memo_job.live.setdefault("section_stats", [None] * len(SECTION_TITLES))[index] = stats
+    memo_job.live["trace"] = trace
+    return {"memo_job_id": memo_job_id, "index": index, "markdown": section_markdown, "chart": chart}
+
+
+def submit_memo(company_name: str, ticker_symbol: str, details: str = "", use_cache: bool = True,
+                document_hashes: list = None, peer_symbols: list = None) -> str:
+    """Queue a memo; `document_hashes` name uploads already indexed with documents.get_document_index."""
+    return get_job_queue().submit(
+        "memo", run_memo_job, sections=len(SECTION_TITLES),
+        company_name=company_name, ticker_symbol=ticker_symbol, details=details, use_cache=use_cache,
+        document_hashes=list(document_hashes or []), peer_symbols=list(peer_symbols or [])
+    )
+
+
+def submit_section(memo_job_id: str, index: int) -> str:
+    return get_job_queue().submit("section", run_section_job, sections=1, memo_job_id=memo_job_id, index=index)
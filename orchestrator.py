@@ -0,0 +1,107 @@
+import contextvars
+import os
+import queue
+import time
+import threading
+from concurrent.futures import FIRST_COMPLETED, CancelledError, ThreadPoolExecutor, wait
+from typing import Any, Callable, List, Optional
+
+from tracing import span
+
+# Upper bound on GPT requests in flight for a single memo.
+# Override with MEMO_MAX_CONCURRENCY if the OpenAI account has a low rate limit.
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("MEMO_MAX_CONCURRENCY", "5"))
+
+# How often the calling thread wakes up to forward streamed text
+POLL_INTERVAL = 0.05
+
+
+def run_sections(
+    call: Callable[..., str],
+    system_prompt: str,
+    user_prompts: List[str],
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    on_section: Optional[Callable[[int, str], str]] = None,
+    on_delta: Optional[Callable[[int, str, Any], None]] = None,
+    call_kwargs: Optional[List[dict]] = None,
+    cancel_event: Optional[threading.Event] = None,
+) -> List[str]:
+    """Send every section prompt at once and return the results in prompt order.
+
+    `on_section(index, text)` runs on the calling thread as soon as that
+    section's response arrives (in completion order, not prompt order) and
+    may return a modified text, e.g. with a chart appended.
+
+    When `on_delta` is given, `call` is invoked as
+    `call(system_prompt, user_prompt, on_text)` and each `on_text(text, meta)`
+    from a worker is forwarded as `on_delta(index, text, meta)`. Both hooks
+    run on the calling thread, so Streamlit and pyplot are never touched by
+    workers. `call_kwargs[index]`, if given, is passed to that section's call.
+    Each call is traced as a "section.N" span under the caller's current span.
+
+    Setting `cancel_event` raises CancelledError: sections not started yet
+    are dropped, streaming ones stop at their next chunk, and this returns
+    without waiting for calls that are still blocked on the network.
+    """
+    results: List[Optional[str]] = [None] * len(user_prompts)
+    if not user_prompts:
+        return []
+
+    events = queue.Queue()
+
+    def check_cancelled():
+        if cancel_event is not None and cancel_event.is_set():
+            raise CancelledError()
+
+    def on_text(index: int, text: str, meta=None):
+        check_cancelled()  # Raised inside the stream, so the response is abandoned
+        events.put((index, text, meta))
+
+    def run_one(index: int, prompt: str) -> str:
+        check_cancelled()
+        kwargs = call_kwargs[index] if call_kwargs else {}
+        with span(f"section.{index + 1}"):
+            if on_delta is None:
+                return call(system_prompt, prompt, **kwargs)
+            return call(system_prompt, prompt, lambda text, meta=None: on_text(index, text, meta), **kwargs)
+
+    def forward_deltas():
+        latest = {}
+        while True:
+            try:
+                index, text, meta = events.get_nowait()
+            except queue.Empty:
+                break
+            latest[index] = (text, meta)  # Only the newest text per section is worth drawing
+        for index, (text, meta) in latest.items():
+            on_delta(index, text, meta)
+
+    start_time = time.time()
+    workers = max(1, min(max_concurrency, len(user_prompts)))
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="memo-section")
+    try:
+        futures = {
+            # Each worker runs in a copy of this context, so it sees the current trace
+            pool.submit(contextvars.copy_context().run, run_one, index, prompt): index
+            for index, prompt in enumerate(user_prompts)
+        }
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=POLL_INTERVAL, return_when=FIRST_COMPLETED)
+            check_cancelled()
+            if on_delta is not None:
+                forward_deltas()
+            for future in done:
+                index = futures[future]
+                text = future.result()
+                if on_section is not None:
+                    text = on_section(index, text)
+                results[index] = text
+    except BaseException:
+        pool.shutdown(wait=False, cancel_futures=True)  # Don't sit out requests nobody will read
+        raise
+    pool.shutdown(wait=True)
+
+    elapsed = time.time() - start_time
+    print(f"[INFO] {len(user_prompts)} sections with concurrency {workers} took {elapsed:.2f} seconds.")
+    return results
@@ -0,0 +1,62 @@
+"""Per-process resources for the Streamlit pages.
+
+A page script is executed again on every rerun, so whatever it defines is
+rebuilt each time, and an `st.cache_resource` function defined in the page
+re-hashes its own source on every call. The resources here are defined once
+in an imported module and created once per server process.
+"""
+import base64
+import importlib
+import threading
+import time
+from io import BytesIO
+
+import streamlit as st
+
+
+def _shrink_png(data: bytes, max_width: int) -> bytes:
+    try:  # Pillow comes with matplotlib; without it the image is sent as is
+        from PIL import Image
+    except ImportError:
+        return data
+    with Image.open(BytesIO(data)) as image:
+        if image.width <= max_width:
+            return data
+        height = max(1, round(image.height * max_width / image.width))
+        buf = BytesIO()
+        image.resize((max_width, height), Image.LANCZOS).save(buf, format="PNG", optimize=True)
+    return buf.getvalue() if buf.tell() < len(data) else data
+
+
+@st.cache_resource(show_spinner=False)
+def load_image_as_base64(image_path: str, max_width: int = 0) -> str:
+    """Encodes the local PNG as a base64 string, read once per process.
+
+    The data URI goes out again with every rerun (every poll of a running
+    job), so with `max_width` a larger image is scaled down first.
+    """
+    with open(image_path, "rb") as img_file:
+        data = img_file.read()
+    if max_width:
+        data = _shrink_png(data, max_width)
+    return base64.b64encode(data).decode()
+
+
+@st.cache_resource(show_spinner=False)
+def warm_up(*module_names: str) -> threading.Thread:
+    """Import heavy modules once per process, off the script thread.
+
+    A page calls this after drawing its form, so the first paint does not
+    wait for the imports and they are usually done by the time the user
+    clicks Generate. Importing the same module from the page meanwhile is
+    safe; it waits for this thread's import to finish.
+    """
+    def load():
+        start_time = time.time()
+        for name in module_names:
+            importlib.import_module(name)
+        print(f"[INFO] Loaded {', '.join(module_names)} in {time.time() - start_time:.2f} seconds.")
+
+    thread = threading.Thread(target=load, name="warm-up", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,168 @@
+"""WeasyPrint rendering in a pool of pre-warmed worker processes.
+
+Each worker imports WeasyPrint and renders a warm-up document once at
+start, so font discovery and CSS setup are paid per worker rather than per
+memo, and several exports run in parallel instead of queueing on the
+Streamlit thread. `submit(html)` returns a Future of a PdfResult carrying
+the PDF bytes, render time and the worker's peak RSS during the job. If
+a worker dies (OOM kill, crash, failed warm-up), the pool is replaced and
+the job retried once.
+
+Images travel next to the HTML, not inside it: `submit(html, resources=...)`
+takes `{url: bytes}` (see charts.ChartService.resources) and the worker
+serves those URLs from a url_fetcher, so WeasyPrint decodes each distinct
+image once instead of parsing base64 out of the document. Fonts are
+subset and images re-compressed by default (PDF_OPTIONS).
+"""
+import os
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+
+from workers import current_rss_bytes, start_process_pool
+
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "2"))
+RSS_SAMPLE_INTERVAL = 0.01  # Seconds between RSS samples while a job renders
+
+# write_pdf defaults; keyword arguments to submit() override them
+PDF_OPTIONS = {
+    "optimize_images": os.getenv("PDF_OPTIMIZE_IMAGES", "1") == "1",  # Lossless recompression
+    "jpeg_quality": int(os.getenv("PDF_JPEG_QUALITY", "85")),
+    "full_fonts": False,  # Embed only the glyphs the memo uses
+    "hinting": False,  # Hinting tables only matter for low-resolution screens
+}
+if int(os.getenv("PDF_IMAGE_DPI", "0")):  # Downsample images above this resolution
+    PDF_OPTIONS["dpi"] = int(os.getenv("PDF_IMAGE_DPI"))
+
+WARMUP_HTML = """<!DOCTYPE html><html><head><style>
+body { font-family: "Times New Roman", serif; } h1, h2 { font-family: "Georgia", serif; }
+table { border-collapse: collapse; } th, td { border: 1px solid #666; }
+</style></head><body><h1>Warm-up</h1><p>Investment Memorandum</p>
+<table><tr><th>A</th><td>1</td></tr></table></body></html>"""
+
+
+@dataclass
+class PdfResult:
+    data: bytes
+    render_seconds: float
+    peak_rss_mb: float
+    worker_pid: int
+
+
+def _warm_worker(warmup_html: str) -> None:
+    import weasyprint
+
+    start_time = time.time()
+    weasyprint.HTML(string=warmup_html).write_pdf(**PDF_OPTIONS)
+    print(f"[INFO] PDF worker {os.getpid()} warmed up in {time.time() - start_time:.2f} seconds.")
+
+
+def _url_fetcher(resources: dict):
+    import weasyprint
+
+    def fetch(url: str, *args, **kwargs) -> dict:
+        if url in resources:
+            mime_type = "image/svg+xml" if url.endswith(".svg") else "image/png"
+            return {"string": resources[url], "mime_type": mime_type, "redirected_url": url}
+        return weasyprint.default_url_fetcher(url, *args, **kwargs)
+
+    return fetch
+
+
+def _render(html: str, pdf_options: dict, resources: dict = None) -> PdfResult:
+    import weasyprint
+
+    peak = [current_rss_bytes()]
+    done = threading.Event()
+
+    def sample_rss():
+        while not done.wait(RSS_SAMPLE_INTERVAL):
+            peak[0] = max(peak[0], current_rss_bytes())
+
+    sampler = threading.Thread(target=sample_rss, daemon=True)
+    sampler.start()
+    start_time = time.time()
+    try:
+        document = weasyprint.HTML(string=html, url_fetcher=_url_fetcher(resources or {}))
+        data = document.write_pdf(**pdf_options)
+    finally:
+        done.set()
+        sampler.join()
+    peak[0] = max(peak[0], current_rss_bytes())
+    return PdfResult(data, time.time() - start_time, peak[0] / (1024 * 1024), os.getpid())
+
+
+class PdfService:
+    def __init__(self, workers: int = PDF_WORKERS, warmup_html: str = WARMUP_HTML):
+        self.workers = workers
+        self.warmup_html = warmup_html
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = start_process_pool(self.workers, _warm_worker, (self.warmup_html,))
+            return self._pool
+
+    def _discard_pool(self, pool) -> None:
+        """Drop a broken pool so the next submit starts fresh workers."""
+        with self._lock:
+            if self._pool is pool:  # Another caller may have replaced it already
+                self._pool = None
+        pool.shutdown(wait=False)
+
+    def warm(self) -> None:
+        """Start (and warm up) every worker now instead of on the first export."""
+        self._get_pool()
+
+    def submit(self, html: str, resources: dict = None, **pdf_options) -> Future:
+        """Render `html` in a worker, serving its `{url: bytes}` resources.
+
+        `pdf_options` go to `write_pdf`, on top of PDF_OPTIONS.
+        """
+        args = (html, {**PDF_OPTIONS, **pdf_options}, resources)
+        future = Future()
+
+        def attempt(retries: int) -> None:
+            pool = self._get_pool()
+            try:
+                pool.submit(_render, *args).add_done_callback(lambda done: finish(done, pool, retries))
+            except BrokenProcessPool as e:
+                crashed(pool, retries, e)
+
+        def crashed(pool, retries: int, error: BrokenProcessPool) -> None:
+            # A worker died (OOM kill, segfault, failed warm-up); without this every later export fails too
+            self._discard_pool(pool)
+            if retries > 0:
+                print(f"[WARN] PDF worker crashed ({error}); restarting the pool and retrying.")
+                attempt(retries - 1)
+            else:
+                future.set_exception(RuntimeError(f"The PDF renderer crashed twice in a row: {error}"))
+
+        def finish(done: Future, pool, retries: int) -> None:
+            error = done.exception()
+            if isinstance(error, BrokenProcessPool):
+                crashed(pool, retries, error)
+            elif error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(done.result())
+
+        attempt(1)
+        return future
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_pdf_service() -> PdfService:
+    """Process-wide PDF service, shared by every Streamlit session."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = PdfService()
+        return _service
@@ -0,0 +1,711 @@
+"""Memo generation pipeline without any Streamlit dependency.
+
+fetch -> prompts -> GPT sections -> charts -> markdown -> HTML -> PDF, shared
+by the Streamlit page in dummy.py and the batch CLI in batch.py.
+"""
+import contextvars
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+
+import requests
+
+from analytics import (
+    close_matrix, margin_markdown, price_markdown, price_metrics, statement_dict,
+)
+from charts import CHART_FORMAT, get_chart_service, image_html
+from comparables import comparables_markdown
+from consistency import ConsistencyReport, check_memo, review_prompt
+from documents import select_excerpts
+from llm import DEFAULT_DEADLINE, MODEL_NAME, chat_completion
+from market_cache import get_market_cache
+from md_tables import extract_tables, parse_numbers
+from memo_html import render_memo_html
+from orchestrator import DEFAULT_MAX_CONCURRENCY, run_sections
+from pdf_service import get_pdf_service
+from prompt_builder import (
+    DETAILS_MAX_TOKENS, SECTION_DEADLINE, SECTION_INPUT_BUDGET, SECTION_KEYS, SECTION_OUTPUT_BUDGET,
+    count_tokens, fit_prompt, truncate_tokens,
+)
+from rate_limit import backoff_delay, get_limiter, retry_after_seconds
+from ticker_session import TickerData
+from tracing import current_span, current_trace, span, start_trace
+
+RELEVANT_KEYS = [
+    "longBusinessSummary", "marketCap", "enterpriseValue", "trailingPE",
+    "forwardPE", "priceToSalesTrailing12Months", "profitMargins", "operatingMargins",
+    "grossMargins", "earningsGrowth", "revenueGrowth", "beta",
+    "sharesOutstanding", "floatShares", "heldPercentInsiders", "heldPercentInstitutions",
+    "totalRevenue", "ebitda", "freeCashflow", "operatingCashflow", "netIncomeToCommon",
+    "dividendRate", "dividendYield", "payoutRatio", "recommendationMean",
+    "recommendationKey", "numberOfAnalystOpinions", "currentRatio",
+    "quickRatio", "debtToEquity", "address1", "city", "state", "zip",
+    "country", "phone", "website", "companyOfficers", "industry", "sector"
+]
+
+SYSTEM_STYLE = (
+    "You are a seasoned financial analyst at a major investment bank. "
+    "Produce one section of an Investment Memorandum that is data-driven, thorough, "
+    "and spans at least 2-3 pages in typical PDF format. "
+    "Integrate available numeric data from the Yahoo Finance details. "
+    "Write in an engaging yet confident tone. "
+    "Use modern phrasing, domain expertise, and a touch of humor. "
+    "Avoid adverbs. "
+    "Use headings, bullet points, tables, and bold formatting for clarity. "
+    "Return only the requested section in valid Markdown."
+)
+
+# Send passages flagged by the local consistency check to GPT for a short review
+CONSISTENCY_REVIEW = os.getenv("CONSISTENCY_REVIEW", "1") == "1"
+REVIEW_MAX_TOKENS = 800
+
+SECTION_TITLES = [
+    "Executive Summary & Company Overview",
+    "Market Opportunity",
+    "Business Model & Revenue Drivers",
+    "Financial Performance & Projections + Investment Thesis",
+    "Risk Factors, Transaction Terms & Appendices",
+]
+
+# What each section looks for in uploaded documents, and how much of them it may use
+SECTION_QUERIES = [
+    "company overview business history milestones management executive officers ownership shareholders strategy",
+    "market industry competition competitors market share addressable growth trends customers demand",
+    "products services customers segments pricing sales marketing distribution channels partners",
+    "revenue net income ebitda operating margin cash flow results guidance outlook fiscal year growth",
+    "risk factors litigation regulation debt liquidity uncertainty supply chain dilution terms",
+]
+DOCUMENT_CONTEXT_BUDGET = 600  # Tokens of excerpts per section prompt
+DOCUMENT_TOP_K = 4
+
+# Peers are fetched side by side; the shared "yfinance" limiter still paces them
+MAX_PEERS = 10
+PEER_WORKERS = int(os.getenv("PEER_WORKERS", str(MAX_PEERS)))
+_peer_pool = ThreadPoolExecutor(max_workers=PEER_WORKERS, thread_name_prefix="peer-fetch")
+
+# Return, risk and margin tables computed for the company, its peers and an index (see analytics.py)
+ANALYTICS_BENCHMARK = os.getenv("ANALYTICS_BENCHMARK", "^GSPC")
+# Loaded from the price store, which already holds 10y: a "5y" slice starts just
+# after the 5Y CAGR's base date. Drawdown and rolling returns stay on the last 5 years
+ANALYTICS_PERIOD = "10y"
+ANALYTICS_WINDOW_YEARS = 5
+PERFORMANCE_COLUMNS = ["return_3m", "return_1y", "cagr_3y", "cagr_5y", "rolling_1y_median"]
+RISK_COLUMNS = ["volatility", "max_drawdown", "beta", "rolling_1y_worst"]
+ANALYTICS_SECTIONS = {3: ["performance", "margins"], 4: ["risk"]}  # Section index -> tables its prompt gets
+# Its own pool: the analytics task waits on statement fetches running in _peer_pool
+_analytics_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="analytics")
+
+class DataFetchError(Exception):
+    """Yahoo Finance data could not be fetched for a ticker."""
+
+
+def fetch_yfinance_data(ticker_symbol: str, on_retry=None, ticker_data: TickerData = None) -> dict:
+    """Return the RELEVANT_KEYS subset of `Ticker.info`, retrying on HTTP 429.
+
+    Requests go through the shared "yfinance" limiter; a 429 pauses that
+    limiter for every caller (Retry-After if Yahoo sends one, jittered
+    backoff otherwise) instead of sleeping on this thread alone.
+    `on_retry(message)` is called before each retry. Raises DataFetchError
+    once the retries are used up or on other HTTP errors. Pass the memo's
+    `ticker_data` so the chart reuses the same Ticker and connection.
+    """
+    retries = 3  # Number of retry attempts
+    limiter = get_limiter("yfinance")
+    ticker_data = ticker_data or TickerData(ticker_symbol)
+    for attempt in range(retries):
+        try:
+            start_time = time.time()
+            with span("fetch.yahoo", ticker=ticker_symbol, attempt=attempt + 1):
+                raw_info = ticker_data.info()  # This is where the request is made
+            memo_data = {key: raw_info.get(key, None) for key in RELEVANT_KEYS}
+            elapsed = time.time() - start_time
+            print(f"[INFO] Data fetch from yfinance took {elapsed:.2f} seconds.")
+            return memo_data
+        except requests.exceptions.HTTPError as e:
+            if e.response is not None and e.response.status_code == 429:
+                delay = retry_after_seconds(e.response.headers) or backoff_delay(attempt, base=5.0)
+                limiter.pause(delay)
+                if on_retry is not None:
+                    on_retry("Rate limit exceeded. Retrying after a short delay...")
+            else:
+                raise DataFetchError(f"HTTP error: {e}") from e
+    raise DataFetchError("Failed to fetch data due to rate limiting. Please try again later.")
+
+
+def get_financial_data(ticker_symbol: str, on_retry=None, ticker_data: TickerData = None) -> dict:
+    """fetch_yfinance_data through the shared on-disk cache (stale-while-revalidate)."""
+    fetched = []
+
+    def fetch():
+        fetched.append(True)
+        return fetch_yfinance_data(ticker_symbol, on_retry=on_retry, ticker_data=ticker_data)
+
+    with span("fetch", ticker=ticker_symbol) as fetch_span:
+        data = get_market_cache().get(
+            ticker_symbol, RELEVANT_KEYS, fetch=fetch,
+            refresh=lambda: fetch_yfinance_data(ticker_symbol),
+        )
+        fetch_span.set(cache_hit=not fetched, fields=sum(value is not None for value in data.values()))
+    return data
+
+
+def parse_peer_symbols(text: str, ticker_symbol: str = "") -> list:
+    """Upper-cased tickers from a comma or space separated list, without repeats or the company itself."""
+    symbols = []
+    for symbol in text.replace(",", " ").split():
+        symbol = symbol.strip().upper()
+        if symbol and symbol != ticker_symbol.upper() and symbol not in symbols:
+            symbols.append(symbol)
+    return symbols[:MAX_PEERS]
+
+
+def start_peer_fetch(peer_symbols: list) -> dict:
+    """Start get_financial_data for every peer at once; returns `{symbol: Future}`.
+
+    Peers share the company's path: the on-disk market cache, the "yfinance"
+    limiter and the 429 retries. Start this before fetching the company
+    itself so all the requests overlap.
+    """
+    return {symbol: _peer_pool.submit(contextvars.copy_context().run, get_financial_data, symbol)
+            for symbol in peer_symbols}
+
+
+def peer_results(futures: dict, on_error=None) -> dict:
+    """`{symbol: financial_data}` for the peers that could be fetched."""
+    peer_data = {}
+    with span("fetch.peers", peers=len(futures)) as peers_span:
+        for symbol, future in futures.items():
+            try:
+                peer_data[symbol] = future.result()
+            except DataFetchError as e:
+                print(f"[WARN] Peer {symbol} left out: {e}")
+                if on_error is not None:
+                    on_error(f"Peer {symbol} was left out: {e}")
+        peers_span.set(fetched=len(peer_data))
+    return peer_data
+
+
+def get_income_statement(ticker_symbol: str, ticker_data: TickerData = None) -> dict:
+    """Annual revenue, gross profit, operating and net income (analytics.statement_dict), cached."""
+    ticker_data = ticker_data or TickerData(ticker_symbol)
+    with span("fetch.statement", ticker=ticker_symbol):
+        return get_market_cache().get(
+            ticker_symbol, ["income_stmt"],
+            fetch=lambda: statement_dict(ticker_data.income_statement()),
+        )
+
+
+def compute_analytics(ticker_symbol: str, peer_symbols: list = None, ticker_data: TickerData = None) -> dict:
+    """Markdown tables of computed metrics: `{"performance", "risk", "margins"}` ("" when unavailable).
+
+    Price histories come from the local price store and income statements
+    from the market cache, all fetched side by side; the metrics for every
+    ticker are then computed in one vectorized pass. Tickers that fail to
+    load are left out.
+    """
+    peer_symbols = peer_symbols or []
+    ticker_data = ticker_data or TickerData(ticker_symbol)
+    with span("analytics", peers=len(peer_symbols)) as analytics_span:
+        tickers = {ticker_symbol: ticker_data,
+                   **{symbol: TickerData(symbol) for symbol in [*peer_symbols, ANALYTICS_BENCHMARK]}}
+        for data in tickers.values():
+            data.prefetch_history(ANALYTICS_PERIOD)
+        context = contextvars.copy_context
+        statement_futures = {symbol: _peer_pool.submit(context().run, get_income_statement, symbol, tickers[symbol])
+                             for symbol in [ticker_symbol, *peer_symbols]}
+
+        histories, statements = {}, {}
+        for symbol, data in tickers.items():
+            try:
+                histories[symbol] = data.history(ANALYTICS_PERIOD)
+            except Exception as e:
+                print(f"[WARN] No price history for {symbol} in analytics: {e}")
+        for symbol, future in statement_futures.items():
+            try:
+                statements[symbol] = future.result()
+            except Exception as e:
+                print(f"[WARN] No income statement for {symbol} in analytics: {e}")
+
+        start_time = time.perf_counter()
+        dates, symbols, closes = close_matrix(histories)
+        metrics = price_metrics(dates, symbols, closes, ANALYTICS_BENCHMARK, ANALYTICS_WINDOW_YEARS)
+        tables = {
+            "performance": price_markdown(metrics, ticker_symbol, ANALYTICS_BENCHMARK, PERFORMANCE_COLUMNS),
+            "risk": price_markdown(metrics, ticker_symbol, ANALYTICS_BENCHMARK, RISK_COLUMNS),
+            "margins": margin_markdown(statements, ticker_symbol),
+        }
+        analytics_span.set(tickers=len(symbols), days=len(dates), statements=len(statements),
+                           compute_seconds=round(time.perf_counter() - start_time, 4))
+    return tables
+
+
+def start_analytics(ticker_symbol: str, peer_symbols: list = None, ticker_data: TickerData = None) -> Future:
+    """compute_analytics in the background, so it overlaps with the fundamentals and peer fetches."""
+    return _analytics_pool.submit(contextvars.copy_context().run, compute_analytics,
+                                  ticker_symbol, peer_symbols, ticker_data)
+
+
+def analytics_result(future: Future, on_error=None) -> dict:
+    """The tables from start_analytics, or {} if computing them failed (the memo goes on without)."""
+    try:
+        return future.result()
+    except Exception as e:
+        print(f"[WARN] Computed metrics left out: {e}")
+        if on_error is not None:
+            on_error(f"Computed metrics were left out: {e}")
+        return {}
+
+
+def build_comparables(ticker_symbol: str, financial_data: dict, peer_data: dict) -> str:
+    """Markdown comparables table for Section 2 ("" without peers)."""
+    if not peer_data:
+        return ""
+    with span("comparables", peers=len(peer_data)):
+        return comparables_markdown(ticker_symbol, financial_data, peer_data)
+
+
+def create_stock_price_chart(ticker_symbol: str, period: str = "1y", ticker_data: TickerData = None) -> str:
+    # Historical data for the given period (already downloaded if it was prefetched)
+    df = (ticker_data or TickerData(ticker_symbol)).history(period)
+    if df.empty:
+        return "<p>No stock price data available.</p>"
+
+    # Rendered in the chart process pool, or served from the chart cache
+    with span("chart.price", ticker=ticker_symbol, period=period, points=len(df)) as chart_span:
+        future = get_chart_service().price_chart(ticker_symbol, period, df)
+        chart_span.set(cache_hit=future.done())
+        image = future.result()
+        chart_span.set(bytes=len(image))
+    return image_html(image, CHART_FORMAT, f"{ticker_symbol} Stock Price Chart")
+
+
+def call_gpt(system_prompt: str, user_prompt: str, tokens=6000, use_cache=True,
+             deadline=DEFAULT_DEADLINE) -> str:
+    start_time = time.time()
+    text, _ = chat_completion(system_prompt, user_prompt, model=MODEL_NAME,
+                              temperature=0.7, max_tokens=tokens, use_cache=use_cache, deadline=deadline)
+    elapsed = time.time() - start_time
+    print(f"[INFO] GPT generation took {elapsed:.2f} seconds.")
+    return text
+
+def call_gpt_stream(system_prompt: str, user_prompt: str, on_text=None, tokens=6000, use_cache=True,
+                    deadline=DEFAULT_DEADLINE) -> str:
+    text, _ = chat_completion(system_prompt, user_prompt, on_text=on_text, model=MODEL_NAME,
+                              temperature=0.7, max_tokens=tokens, use_cache=use_cache, deadline=deadline)
+    return text
+
+
+def markdown_to_html_with_tables(memo) -> str:
+    """Styled memo HTML from a list of section markdown, or from one markdown string.
+
+    Sections are converted separately and memoized (see memo_html.py), so
+    an export after changing one section only reconverts that section.
+    """
+    sections = [memo] if isinstance(memo, str) else list(memo)
+    with span("markdown_to_html", sections=len(sections),
+              input_bytes=sum(len(section.encode("utf-8")) for section in sections)) as html_span:
+        full_html, converted = render_memo_html(sections)
+        html_span.set(output_bytes=len(full_html.encode("utf-8")), converted=converted)
+    return full_html
+
+VALID_HOLDERS = {
+    "Institutional Holders",
+    "Inside Holdings",
+    "Retail and Others",
+    "Shares Outstanding"
+}
+
+def parse_ownership_table(table_markdown: str):
+    """(holder, stake %) pairs from the first table in the markdown listing VALID_HOLDERS."""
+    with span("parse_table", input_bytes=len(table_markdown)) as parse_span:
+        tables = extract_tables(table_markdown, typed=False)
+        ownership_data = []
+        for df in tables:
+            if df.shape[1] < 2:
+                continue
+            holders = df.iloc[:, 0].str.strip()
+            stakes = parse_numbers(df.iloc[:, 1])  # e.g. "~8.1%" -> 8.1
+            # Stakes only: "15.2B" in the Shares Outstanding row is a count, not a share
+            is_stake = (stakes["unit"] == "%") | (stakes["unit"].isna() & stakes["value"].between(0, 100))
+            rows = holders.isin(VALID_HOLDERS) & stakes["value"].notna() & is_stake
+            if rows.any():
+                ownership_data = list(zip(holders[rows], stakes["value"][rows].astype(float)))
+                break
+        parse_span.set(tables=len(tables), rows=len(ownership_data))
+    return ownership_data
+
+def create_ownership_pie(ownership_data):
+  
+    if not ownership_data:
+        return "<p>No valid ownership percentage data found.</p>"
+    
+    labels = [item[0] for item in ownership_data]
+    values = [item[1] for item in ownership_data]
+
+    with span("chart.ownership", slices=len(labels)) as chart_span:
+        future = get_chart_service().ownership_pie(labels, values)
+        chart_span.set(cache_hit=future.done())
+        image = future.result()
+        chart_span.set(bytes=len(image))
+    return image_html(image, CHART_FORMAT, "Ownership Pie Chart")
+
+
+def document_excerpts(index: int, documents: list) -> str:
+    """The uploaded-document chunks most relevant to section `index`, within DOCUMENT_CONTEXT_BUDGET."""
+    if not documents:
+        return ""
+    with span("retrieve", section=index + 1, documents=len(documents)) as retrieve_span:
+        excerpts = select_excerpts(documents, f"{SECTION_TITLES[index]} {SECTION_QUERIES[index]}",
+                                   DOCUMENT_CONTEXT_BUDGET, k=DOCUMENT_TOP_K)
+        retrieve_span.set(tokens=count_tokens(excerpts) if excerpts else 0)
+    return excerpts
+
+
+def build_section_prompts(company_name: str, ticker_symbol: str, details: str, financial_data: dict,
+                          documents: list = None, comparables: str = "", analytics: dict = None) -> list:
+    """Section prompts, each carrying only its own Yahoo fields and trimmed to its input budget.
+
+    With `documents` (DocumentIndex objects from documents.py), each prompt
+    also gets the excerpts most relevant to its section; the budget grows by
+    their size so they never push out Yahoo data. `comparables` (from
+    build_comparables) goes to Section 2 in place of invented peer figures.
+    `analytics` (from compute_analytics) gives Section 4 computed returns and
+    margin history and Section 5 computed risk figures.
+    """
+    analytics = analytics or {}
+    details = truncate_tokens(details, DETAILS_MAX_TOKENS)
+
+    # --- Section 1: Executive Summary & Company Overview ---
+    def user_prompt_1(finance_summary: str) -> str:
+        return f"""
+Company Name: {company_name}
+Ticker: {ticker_symbol}
+Additional User Details: {details}
+
+Yahoo Finance Data (key metrics):
+{finance_summary}
+
+Write **Section 1**: 'Executive Summary & Company Overview' with the following content:
+1. Opportunity Overview: Summarize the company's core growth angle, recent strategic moves, and headline financial metrics (revenue, EBITDA, margins).
+2. Key Investment Highlights: List at least 4-5 bullet points with strong data references.
+3. Transaction Summary: Describe the nature of the transaction or investment round, approximate valuation range, and potential use of proceeds.
+4. Business Description: Provide a thorough summary of products/services, revenue sources, and geographic reach. Include references to trailing P/E, forward P/E, and total revenue if available.
+5. History & Milestones: Highlight founding date, pivotal expansions, acquisitions, or major product launches.
+6. Management Team: Include roles, relevant backgrounds, and any notable credentials.
+7. Ownership Structure: Provide a Markdown table with columns: Shareholder, Stake (%), and optionally Notes. Only list these rows exactly: Institutional Holders, Inside Holdings, Retail and Others, and Shares Outstanding.
+
+Emphasize data and detail. Ensure this section alone would fill around 2-3 pages in a typical PDF.
+Use tables or bullet points for clarity.
+"""
+
+    # --- Section 2: Market Opportunity ---
+    def user_prompt_2(finance_summary: str) -> str:
+        return f"""
+Company Name: {company_name}
+Ticker: {ticker_symbol}
+Additional User Details: {details}
+
+Yahoo Finance Data (key metrics):
+{finance_summary}
+
+Write **Section 2**: 'Market Opportunity' covering:
+1. Industry Overview: Outline total available market size, recent growth rates, and industry trends.
+2. Competitive Landscape: Compare the company with 2-3 direct competitors, noting market caps, valuations, or margin profiles.
+3. Addressable Market (TAM, SAM, SOM): Break down the broader market, the target segment, and realistic market share.
+
+Provide enough granularity and numeric depth to span 2-3 pages.
+Use headings, bullet points, and tables.
+"""
+
+    # --- Section 3: Business Model & Revenue Drivers ---
+    def user_prompt_3(finance_summary: str) -> str:
+        return f"""
+Company Name: {company_name}
+Ticker: {ticker_symbol}
+Additional User Details: {details}
+
+Yahoo Finance Data (key metrics):
+{finance_summary}
+
+Write **Section 3**: 'Business Model & Revenue Drivers' covering:
+1. Products/Services: Explain the key offerings, pricing tiers, and unique selling points.
+2. Customer Segments: Discuss B2B vs. B2C splits or major client types.
+3. Pricing Strategy: Describe how the company sets prices, potential for upselling, and market alignment.
+4. Sales & Marketing Strategy: Detail distribution channels, digital marketing, and brand partnerships.
+
+Aim for 2-3 pages of analysis. Use subheadings, bullet points, and tables.
+"""
+
+    # --- Section 4: Financial Performance & Projections + Investment Thesis ---
+    def user_prompt_4(finance_summary: str) -> str:
+        return f"""
+Company Name: {company_name}
+Ticker: {ticker_symbol}
+Additional User Details: {details}
+
+Yahoo Finance Data (key metrics):
+{finance_summary}
+
+Write **Section 4**: 'Financial Performance & Projections + Investment Thesis' with:
+1. Historical Financials: Show multi-year revenue trends, net income, EBITDA, and margins (include a table if possible).
+2. Key Performance Indicators (KPIs): Highlight 3-4 relevant metrics.
+3. Financial Projections (3-5 years): Forecast revenue, EBITDA, and FCF with growth assumptions.
+4. Break-even Analysis: Provide numeric examples.
+5. Why Now?: Tie in market conditions and company readiness.
+6. Scalability Potential and Exit Strategy: Outline growth paths and potential exit scenarios.
+
+Ensure this section fills 2-3 pages. Use bullet points and tables for numeric data.
+"""
+
+    # --- Section 5: Risk Factors, Transaction Terms & Appendices ---
+    def user_prompt_5(finance_summary: str) -> str:
+        return f"""
+Company Name: {company_name}
+Ticker: {ticker_symbol}
+Additional User Details: {details}
+
+Yahoo Finance Data (key metrics):
+{finance_summary}
+
+Write **Section 5**: 'Risk Factors & Mitigation, Transaction Structure & Terms, Appendices' covering:
+1. Risk Factors & Mitigation: Identify at least 5 major risks and recommended mitigation steps.
+2. Transaction Structure & Terms: Describe the investment round, valuation, investor rights, and board composition.
+3. Appendices: Reference financial statements, legal documents, and market data.
+4. Final Concluding Statement: Provide a confident conclusion and call to action.
+
+Ensure this section spans 2-3 pages and uses bullet points, tables, and clear headings.
+"""
+
+    def with_excerpts(render, block: str):
+        return lambda finance_summary: render(finance_summary) + block
+
+    renders = [user_prompt_1, user_prompt_2, user_prompt_3, user_prompt_4, user_prompt_5]
+    prompts = []
+    for index, render in enumerate(renders):
+        excerpts = document_excerpts(index, documents)
+        budget = SECTION_INPUT_BUDGET[index]
+        if excerpts:
+            block = f"\nExcerpts from documents provided by the user (use them where relevant):\n{excerpts}\n"
+            budget += count_tokens(block)
+            render = with_excerpts(render, block)
+        if index == 1 and comparables:
+            block = (
+                "\nPeer comparables computed from Yahoo Finance. This exact table is inserted after your "
+                "section, so do not repeat it or invent other figures for these peers; refer to it in the "
+                f"Competitive Landscape instead:\n{comparables}\n"
+            )
+            budget += count_tokens(block)
+            render = with_excerpts(render, block)
+        tables = [analytics.get(name) for name in ANALYTICS_SECTIONS.get(index, [])]
+        tables = [table for table in tables if table]
+        if tables:
+            block = (
+                "\nMetrics computed from Yahoo Finance price history and income statements. Quote these "
+                "figures as given instead of estimating them, and build the related tables and "
+                "commentary on them:\n" + "\n\n".join(tables) + "\n"
+            )
+            budget += count_tokens(block)
+            render = with_excerpts(render, block)
+        prompts.append(fit_prompt(render, financial_data, SECTION_KEYS[index], budget))
+    return prompts
+
+
+def clean_section(section_markdown: str) -> str:
+    return section_markdown.replace("```markdown", "").replace("```", "")
+
+
+def section_chart(index: int, section_markdown: str, ticker_symbol: str,
+                  ticker_data: TickerData = None, comparables: str = "") -> str:
+    """Markdown for the chart (or comparables table) that belongs to this section, or "" if it has none."""
+    if index == 0:
+        ownership_data = parse_ownership_table(section_markdown)
+        if ownership_data:
+            pie_html = create_ownership_pie(ownership_data)
+            return "\n\n## Ownership Breakdown (Pie Chart)\n\n" + pie_html
+    elif index == 1 and comparables:
+        return "\n\n## Peer Comparables\n\n" + comparables + "\n"
+    elif index == 3:
+        stock_chart_html = create_stock_price_chart(ticker_symbol, period="1y", ticker_data=ticker_data)
+        return "\n\n## Stock Price Chart\n\n" + stock_chart_html
+    return ""
+
+
+def postprocess_section(index: int, section_markdown: str, ticker_symbol: str,
+                        ticker_data: TickerData = None, comparables: str = "") -> str:
+    """Strip code fences and attach the chart that belongs to this section."""
+    section_markdown = clean_section(section_markdown)
+    return section_markdown + section_chart(index, section_markdown, ticker_symbol, ticker_data, comparables)
+
+
+def regenerate_section(index: int, company_name: str, ticker_symbol: str, details: str,
+                       financial_data: dict, on_text=None, ticker_data: TickerData = None,
+                       documents: list = None, comparables: str = "", analytics: dict = None):
+    """Write one section again, bypassing the GPT cache, and return `(markdown, chart, stats)`.
+
+    Only this section's prompt is sent. The chart is rebuilt from the new
+    text for the ownership pie; the price chart comes from the chart cache.
+    """
+    user_prompt = build_section_prompts(company_name, ticker_symbol, details, financial_data, documents,
+                                        comparables, analytics)[index]
+    with span(f"section.{index + 1}", regenerated=True):
+        text, stats = chat_completion(SYSTEM_STYLE, user_prompt, on_text=on_text, model=MODEL_NAME,
+                                      temperature=0.7, max_tokens=SECTION_OUTPUT_BUDGET[index],
+                                      use_cache=False, deadline=SECTION_DEADLINE[index])
+    section_markdown = clean_section(text)
+    chart = section_chart(index, section_markdown, ticker_symbol, ticker_data, comparables)
+    return section_markdown, chart, stats
+
+
+def generate_sections(company_name: str, ticker_symbol: str, details: str, financial_data: dict,
+                      use_cache: bool = True, stream: bool = False, on_section=None, on_delta=None,
+                      max_concurrency: int = DEFAULT_MAX_CONCURRENCY, ticker_data: TickerData = None,
+                      cancel_event=None, documents: list = None, comparables: str = "",
+                      analytics: dict = None) -> list:
+    """Write all five sections concurrently and return their post-processed markdown.
+
+    The chart's price history is downloaded while the sections are written.
+
+    `on_section(index, markdown, chart)` sees each finished section and its
+    chart markdown ("" if it has none) and `on_delta(index, text, stats)`
+    sees streamed text when `stream` is set. Both run on the calling thread.
+    Setting `cancel_event` (a threading.Event) stops generation with
+    concurrent.futures.CancelledError. `documents` are uploaded-document
+    indexes to draw excerpts from, `comparables` the peer table for
+    Section 2 and `analytics` the computed metric tables for Sections 4
+    and 5 (see build_section_prompts).
+    """
+    ticker_data = ticker_data or TickerData(ticker_symbol)
+    ticker_data.prefetch_history("1y")
+    user_prompts = build_section_prompts(company_name, ticker_symbol, details, financial_data, documents,
+                                         comparables, analytics)
+    section_kwargs = [{"tokens": budget, "deadline": deadline}
+                      for budget, deadline in zip(SECTION_OUTPUT_BUDGET, SECTION_DEADLINE)]
+
+    def finish_section(index: int, section_markdown: str) -> str:
+        section_markdown = clean_section(section_markdown)
+        chart = section_chart(index, section_markdown, ticker_symbol, ticker_data, comparables)
+        if on_section is not None:
+            on_section(index, section_markdown, chart)
+        return section_markdown + chart
+
+    if stream:
+        call = partial(call_gpt_stream, use_cache=use_cache)
+    else:
+        call = partial(call_gpt, use_cache=use_cache)
+        on_delta = None
+    return run_sections(
+        call, SYSTEM_STYLE, user_prompts, max_concurrency=max_concurrency,
+        on_section=finish_section, on_delta=on_delta, call_kwargs=section_kwargs, cancel_event=cancel_event
+    )
+
+
+def assemble_markdown(sections_markdown: list) -> str:
+    # Combine all sections into final_markdown
+    final_markdown = (
+        "# Investment Memorandum\n\n" +
+        "\n\n".join(sections_markdown)
+    )
+
+    return final_markdown.replace("# Investment Memorandum", "")
+
+
+def check_consistency(sections_markdown: list, financial_data: dict) -> ConsistencyReport:
+    """Numeric claims across the sections, checked locally against `financial_data`."""
+    with span("consistency", sections=len(sections_markdown)) as check_span:
+        report = check_memo(sections_markdown, financial_data)
+        check_span.set(claims=len(report.claims), findings=len(report.findings))
+    for finding in report.findings:
+        print(f"[WARN] Consistency: {finding.message}")
+    return report
+
+
+def review_consistency(report: ConsistencyReport, financial_data: dict, use_cache: bool = True) -> str:
+    """GPT's take on the flagged passages only; "" when nothing was flagged."""
+    if not report.findings:
+        return ""
+    prompt = review_prompt(report, financial_data)
+    with span("review", findings=len(report.findings)):
+        text, _ = chat_completion("You are a meticulous fact checker for investment memoranda.", prompt,
+                                  model=MODEL_NAME, temperature=0.0, max_tokens=REVIEW_MAX_TOKENS,
+                                  use_cache=use_cache)
+    return text
+
+
+def render_pdf_async(memo, **pdf_options) -> Future:
+    """Future of a PdfResult rendered by the warmed WeasyPrint worker pool.
+
+    `memo` is the list of section markdown (preferred: unchanged sections
+    reuse their HTML) or the assembled markdown.
+
+    The render is recorded as a "pdf" span in the current trace when the
+    worker finishes, with its time spent queued separated out.
+
+    Chart images go to the worker as resources next to the HTML, one copy
+    per distinct image.
+    """
+    pdf_html = markdown_to_html_with_tables(memo)
+    resources = get_chart_service().resources(pdf_html)
+    trace, parent = current_trace(), current_span()
+    submitted = time.perf_counter()
+    future = get_pdf_service().submit(pdf_html, resources=resources, **pdf_options)
+    if trace is None:
+        return future
+
+    traced = Future()  # Resolved only after the span is recorded, so waiters never miss it
+
+    def record_span(done: Future):
+        finished = time.perf_counter()
+        attrs = {"html_bytes": len(pdf_html), "images": len(resources),
+                 "image_bytes": sum(len(image) for image in resources.values())}
+        error = done.exception()
+        if error is not None:
+            attrs["error"] = str(error)
+        else:
+            result = done.result()
+            attrs.update(bytes=len(result.data), render_seconds=round(result.render_seconds, 4),
+                         queue_seconds=round(max(0.0, finished - submitted - result.render_seconds), 4),
+                         peak_rss_mb=round(result.peak_rss_mb, 1))
+        trace.record("pdf", submitted, finished, parent.span_id if parent is not None else None, **attrs)
+        if error is not None:
+            traced.set_exception(error)
+        else:
+            traced.set_result(done.result())
+
+    future.add_done_callback(record_span)
+    return traced
+
+
+def render_pdf(memo) -> bytes:
+    result = render_pdf_async(memo).result()
+    print(f"[INFO] PDF render took {result.render_seconds:.2f} seconds "
+          f"(peak RSS {result.peak_rss_mb:.0f} MB, {len(result.data) / 1024:.0f} KB).")
+    return result.data
+
+
+def generate_memo(company_name: str, ticker_symbol: str, details: str = "", use_cache: bool = True,
+                  max_concurrency: int = DEFAULT_MAX_CONCURRENCY, documents: list = None,
+                  peer_symbols: list = None):
+    """Run the whole pipeline headlessly and return `(final_markdown, pdf_bytes)`.
+
+    The run is traced and appended to the trace log (see tracing.py), and
+    figures that disagree with Yahoo or between sections are logged.
+    """
+    with start_trace("memo", ticker=ticker_symbol, company=company_name, source="batch"):
+        ticker_data = TickerData(ticker_symbol)
+        peer_futures = start_peer_fetch(peer_symbols or [])
+        analytics_future = start_analytics(ticker_symbol, peer_symbols, ticker_data)
+        financial_data = get_financial_data(ticker_symbol, ticker_data=ticker_data)
+        comparables = build_comparables(ticker_symbol, financial_data, peer_results(peer_futures))
+        analytics = analytics_result(analytics_future)
+        texts = [""] * len(SECTION_TITLES)  # Section text without the chart images
+
+        def keep_text(index: int, section_markdown: str, chart: str) -> None:
+            texts[index] = section_markdown
+
+        sections = generate_sections(company_name, ticker_symbol, details, financial_data,
+                                     use_cache=use_cache, on_section=keep_text,
+                                     max_concurrency=max_concurrency, ticker_data=ticker_data,
+                                     documents=documents, comparables=comparables, analytics=analytics)
+        check_consistency(texts, financial_data)
+        return assemble_markdown(sections), render_pdf(sections)
@@ -0,0 +1,304 @@
+"""Local daily OHLCV history, one set of columnar files per ticker.
+
+    history = get_price_store().history("AAPL", "5y", fetch=ticker.history)
+    history.close          # read-only view into a memory-mapped file
+    history.frame()        # DataFrame over the same memory
+
+Each ticker has a directory in PRICE_STORE_DIR with one raw little-endian
+file per column (dates as int64 nanoseconds, prices and volume as float64)
+and a meta.json saying how many rows are valid. The first fetch backfills
+BACKFILL_PERIOD; after that only bars from the last stored day onward are
+downloaded and written in place, so a chart costs a few rows of network
+traffic a day and any period up to the backfill is a slice of what is on
+disk. Slices are views of `np.memmap`s, never copies.
+
+Yahoo adjusts past prices for splits and dividends, so a download whose
+first (overlapping) bar no longer matches the stored one rewrites the whole
+history into a new generation of files instead of appending to a series on
+the old basis. Files are only ever grown or replaced, never shrunk, so a
+view handed out earlier stays mapped and its dates keep their rows. Its
+last two bars are not frozen, though: an update rewrites them in place (the
+last one may have been stored mid-session), so a view may see them revised.
+
+The Streamlit server, batch.py and `market_cache.py warm` can share one
+PRICE_STORE_DIR, so an update holds a lock file in the ticker's directory
+(flock; on Windows updates are serialized only within a process).
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+PRICE_STORE_DIR = os.getenv("PRICE_STORE_DIR", os.path.join(".cache", "prices"))
+# Seconds before a ticker's stored history is checked for new bars
+FRESH_SECONDS = int(os.getenv("PRICE_STORE_FRESH_SECONDS", "3600"))
+BACKFILL_PERIOD = os.getenv("PRICE_STORE_BACKFILL", "10y")
+
+COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+# Yahoo period -> how far back it reaches; "ytd" and "max" are handled separately
+PERIODS = {
+    "1d": pd.DateOffset(days=1), "5d": pd.DateOffset(days=5), "1mo": pd.DateOffset(months=1),
+    "3mo": pd.DateOffset(months=3), "6mo": pd.DateOffset(months=6), "1y": pd.DateOffset(years=1),
+    "2y": pd.DateOffset(years=2), "5y": pd.DateOffset(years=5), "10y": pd.DateOffset(years=10),
+}
+PERIOD_ORDER = list(PERIODS) + ["max"]
+MATCH_TOLERANCE = 1e-6  # Relative change in an old close that means Yahoo re-adjusted the series
+
+
+def period_start(period: str, today: Optional[pd.Timestamp] = None) -> Optional[np.datetime64]:
+    """First date covered by a Yahoo `period`; None for "max"."""
+    today = today or pd.Timestamp.today().normalize()
+    if period == "max":
+        return None
+    if period == "ytd":
+        return np.datetime64(pd.Timestamp(year=today.year, month=1, day=1), "ns")
+    if period not in PERIODS:
+        raise ValueError(f"Unsupported history period {period!r}; use one of {', '.join(PERIOD_ORDER)} or ytd.")
+    return np.datetime64(today - PERIODS[period], "ns")
+
+
+def _reach(period: str) -> int:
+    """Rank of how far back `period` goes ("ytd" never goes further than "1y")."""
+    return PERIOD_ORDER.index("1y" if period == "ytd" else period)
+
+
+def _covers(stored: str, period: str) -> bool:
+    """Whether a backfill of `stored` reaches at least as far back as `period`."""
+    return _reach(stored) >= _reach(period)
+
+
+@dataclass
+class PriceHistory:
+    """Daily bars as read-only column views; dates are exchange-local, without a time zone."""
+    ticker_symbol: str
+    dates: np.ndarray  # datetime64[ns]
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    volume: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    @property
+    def empty(self) -> bool:
+        return len(self.dates) == 0
+
+    def frame(self) -> pd.DataFrame:
+        """A yfinance-shaped DataFrame sharing this history's memory."""
+        return pd.DataFrame(
+            dict(zip(COLUMNS, (self.open, self.high, self.low, self.close, self.volume))),
+            index=pd.DatetimeIndex(self.dates, name="Date"), copy=False,
+        )
+
+
+def _empty(ticker_symbol: str) -> PriceHistory:
+    return PriceHistory(ticker_symbol, np.empty(0, dtype="datetime64[ns]"),
+                        *(np.empty(0, dtype=np.float64) for _ in COLUMNS))
+
+
+def _columns(df: pd.DataFrame):
+    """`(dates, {column: values})` from a yfinance history frame, dates made tz-naive."""
+    index = df.index
+    if getattr(index, "tz", None) is not None:
+        index = index.tz_localize(None)  # Keep exchange-local dates, drop the tz object
+    dates = pd.DatetimeIndex(index).normalize().to_numpy(dtype="datetime64[ns]")
+    values = {column: (df[column].to_numpy(dtype=np.float64) if column in df else
+                       np.full(len(df), np.nan)) for column in COLUMNS}
+    return dates, values
+
+
+class PriceStore:
+    def __init__(self, directory: str = PRICE_STORE_DIR, fresh_seconds: int = FRESH_SECONDS,
+                 backfill_period: str = BACKFILL_PERIOD):
+        self.directory = directory
+        self.fresh_seconds = fresh_seconds
+        self.backfill_period = backfill_period
+        self.rows_fetched = 0  # Bars downloaded, for comparing with a full re-download
+        self.full_fetches = 0
+        self.incremental_fetches = 0
+        self.local_reads = 0
+        self._lock = threading.Lock()
+        self._ticker_locks = {}
+        self._maps = {}  # (ticker, generation, column) -> memmap over the whole file
+
+    def _ticker_lock(self, ticker_symbol: str) -> threading.Lock:
+        with self._lock:
+            return self._ticker_locks.setdefault(ticker_symbol, threading.Lock())
+
+    def _path(self, ticker_symbol: str, name: str = "") -> str:
+        return os.path.join(self.directory, ticker_symbol, name)
+
+    @contextmanager
+    def _file_lock(self, ticker_symbol: str):
+        """Hold the ticker's lock file, so only one process updates its files at a time."""
+        os.makedirs(self._path(ticker_symbol), exist_ok=True)
+        with open(self._path(ticker_symbol, ".lock"), "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)  # Released when the file is closed
+            yield
+
+    def _stale(self, meta: Optional[dict], period: str) -> bool:
+        return (meta is None or not _covers(meta["period"], period)
+                or time.time() - meta["fetched_at"] >= self.fresh_seconds)
+
+    def _meta(self, ticker_symbol: str) -> Optional[dict]:
+        try:
+            with open(self._path(ticker_symbol, "meta.json"), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, ticker_symbol: str, meta: dict) -> None:
+        path = self._path(ticker_symbol, "meta.json")
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(path + ".tmp", path)  # Readers see the old row count or the new one, never half
+
+    def _column_path(self, ticker_symbol: str, generation: int, column: str) -> str:
+        return self._path(ticker_symbol, f"{generation}.{column.lower()}")
+
+    def _write_columns(self, ticker_symbol: str, generation: int, offset: int, dates, values) -> None:
+        """Write rows starting at row `offset`, growing the files if needed (never shrinking them)."""
+        for column, data in [("date", dates.view(np.int64)), *values.items()]:
+            path = self._column_path(ticker_symbol, generation, column)
+            with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+                f.seek(offset * 8)
+                f.write(np.ascontiguousarray(data, dtype="<i8" if column == "date" else "<f8").tobytes())
+
+    def _view(self, ticker_symbol: str, meta: dict, column: str) -> np.ndarray:
+        generation, rows = meta["generation"], meta["rows"]
+        key = (ticker_symbol, generation, column)
+        with self._lock:
+            mapped = self._maps.get(key)
+        if mapped is None or len(mapped) < rows:
+            path = self._column_path(ticker_symbol, generation, column)
+            size = os.path.getsize(path) // 8
+            mapped = np.memmap(path, dtype="<i8" if column == "date" else "<f8", mode="r", shape=(size,))
+            with self._lock:
+                for old in [k for k in self._maps if k[0] == ticker_symbol and k[1] != generation]:
+                    del self._maps[old]  # Files of a replaced generation
+                self._maps[key] = mapped
+        view = mapped[:rows]
+        return view.view("datetime64[ns]") if column == "date" else view
+
+    def _replace(self, ticker_symbol: str, meta: Optional[dict], period: str, dates, values) -> dict:
+        """Start a new generation holding exactly these rows."""
+        generation = meta["generation"] + 1 if meta else 0
+        os.makedirs(self._path(ticker_symbol), exist_ok=True)
+        for column in ["date", *COLUMNS]:
+            path = self._column_path(ticker_symbol, generation, column)
+            if os.path.exists(path):
+                os.remove(path)  # Left over from a crashed rewrite, not referenced by meta.json
+        self._write_columns(ticker_symbol, generation, 0, dates, values)
+        new_meta = {"generation": generation, "rows": len(dates), "period": period, "fetched_at": time.time()}
+        self._write_meta(ticker_symbol, new_meta)
+        if meta is not None:
+            for column in ["date", *COLUMNS]:
+                try:
+                    os.remove(self._column_path(ticker_symbol, meta["generation"], column))
+                except OSError:
+                    pass  # Still mapped elsewhere (Windows); removed by the next rewrite
+        return new_meta
+
+    def _update(self, ticker_symbol: str, period: str, meta: Optional[dict], fetch: Callable) -> dict:
+        """Bring the stored history up to date and make it cover `period`."""
+        if meta is None or meta["rows"] < 2 or not _covers(meta["period"], period):
+            # One download deep enough for this and every shorter period later on
+            reaches = [self.backfill_period, period] + ([meta["period"]] if meta else [])
+            backfill = PERIOD_ORDER[max(_reach(item) for item in reaches)]
+            dates, values = _columns(fetch(period=backfill))
+            self.rows_fetched += len(dates)
+            self.full_fetches += 1
+            return self._replace(ticker_symbol, meta, backfill, dates, values)
+
+        # Refetch from the second-to-last stored bar: it is a finished day to compare
+        # against, and the last one may have been stored mid-session
+        stored_dates = self._view(ticker_symbol, meta, "date")
+        stored_close = self._view(ticker_symbol, meta, "Close")
+        overlap = meta["rows"] - 2
+        start = pd.Timestamp(stored_dates[overlap])
+        dates, values = _columns(fetch(start=start.strftime("%Y-%m-%d")))
+        keep = dates >= stored_dates[overlap]  # Some sources ignore `start`
+        dates, values = dates[keep], {column: data[keep] for column, data in values.items()}
+        self.rows_fetched += len(dates)
+        self.incremental_fetches += 1
+        if len(dates) == 0:
+            meta = {**meta, "fetched_at": time.time()}
+            self._write_meta(ticker_symbol, meta)
+            return meta
+        old, new = float(stored_close[overlap]), float(values["Close"][0])
+        if dates[0] != stored_dates[overlap] or not np.isclose(new, old, rtol=MATCH_TOLERANCE, equal_nan=True):
+            print(f"[INFO] {ticker_symbol} prices were re-adjusted (split or dividend); re-downloading "
+                  f"{meta['period']} of history.")
+            dates, values = _columns(fetch(period=meta["period"]))
+            self.rows_fetched += len(dates)
+            self.full_fetches += 1
+            return self._replace(ticker_symbol, meta, meta["period"], dates, values)
+
+        self._write_columns(ticker_symbol, meta["generation"], overlap, dates, values)
+        meta = {**meta, "rows": overlap + len(dates), "fetched_at": time.time()}
+        self._write_meta(ticker_symbol, meta)
+        return meta
+
+    def history(self, ticker_symbol: str, period: str = "1y", fetch: Callable = None) -> PriceHistory:
+        """Bars for `period`, updated through `fetch` first if the stored copy is stale.
+
+        `fetch(period=...)` or `fetch(start="YYYY-MM-DD")` must return a
+        yfinance history DataFrame, e.g. `yf.Ticker(symbol).history`.
+        Without `fetch`, only what is already stored is returned.
+        """
+        ticker_symbol = ticker_symbol.strip().upper()
+        with self._ticker_lock(ticker_symbol):
+            meta = self._meta(ticker_symbol)
+            if self._stale(meta, period) and fetch is not None:
+                with self._file_lock(ticker_symbol):
+                    meta = self._meta(ticker_symbol)  # Another process may have just updated it
+                    if self._stale(meta, period):
+                        meta = self._update(ticker_symbol, period, meta, fetch)
+                    else:
+                        self.local_reads += 1
+            else:
+                self.local_reads += 1
+        return self.slice(ticker_symbol, period, meta)
+
+    def slice(self, ticker_symbol: str, period: str = "1y", meta: dict = None) -> PriceHistory:
+        """Stored bars for `period` as views into the column files, without any download."""
+        ticker_symbol = ticker_symbol.strip().upper()
+        meta = meta or self._meta(ticker_symbol)
+        if meta is None or meta["rows"] == 0:
+            return _empty(ticker_symbol)
+        dates = self._view(ticker_symbol, meta, "date")
+        start = period_start(period)
+        first = 0 if start is None else int(np.searchsorted(dates, start, side="left"))
+        return PriceHistory(ticker_symbol, dates[first:],
+                            *(self._view(ticker_symbol, meta, column)[first:] for column in COLUMNS))
+
+    def stats(self) -> dict:
+        return {"full_fetches": self.full_fetches, "incremental_fetches": self.incremental_fetches,
+                "local_reads": self.local_reads, "rows_fetched": self.rows_fetched}
+
+
+_store: Optional[PriceStore] = None
+_store_lock = threading.Lock()
+
+
+def get_price_store() -> PriceStore:
+    """Process-wide price store, shared by every Streamlit session."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = PriceStore()
+        return _store
@@ -0,0 +1,148 @@
+import math
+import re
+from typing import Dict, Iterable, List, Optional
+
+try:  # Exact counts when tiktoken is installed; the estimate below is close enough otherwise
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("o200k_base")
+except Exception:
+    _ENCODING = None
+
+# Yahoo fields that hold ratios (0.234 means 23.4%)
+PERCENT_KEYS = {
+    "profitMargins", "operatingMargins", "grossMargins", "earningsGrowth", "revenueGrowth",
+    "heldPercentInsiders", "heldPercentInstitutions", "payoutRatio",
+}
+# Fields Yahoo already reports in percent (0.44 means 0.44%)
+PERCENT_POINT_KEYS = {"dividendYield"}
+# Currency amounts and share counts worth abbreviating (2.9T, 391.0B)
+LARGE_NUMBER_KEYS = {
+    "marketCap", "enterpriseValue", "sharesOutstanding", "floatShares", "totalRevenue",
+    "ebitda", "freeCashflow", "operatingCashflow", "netIncomeToCommon",
+}
+
+SUMMARY_MAX_CHARS = 600
+MAX_OFFICERS = 5
+DETAILS_MAX_TOKENS = 400
+
+# Data each section needs, most important first. Lower entries are dropped
+# first when a prompt runs over its input budget.
+SECTION_KEYS = [
+    # 1: Executive Summary & Company Overview
+    ["longBusinessSummary", "sector", "industry", "marketCap", "enterpriseValue", "totalRevenue",
+     "ebitda", "profitMargins", "operatingMargins", "trailingPE", "forwardPE", "companyOfficers",
+     "heldPercentInstitutions", "heldPercentInsiders", "sharesOutstanding", "floatShares",
+     "city", "state", "country", "website"],
+    # 2: Market Opportunity
+    ["sector", "industry", "marketCap", "enterpriseValue", "totalRevenue", "revenueGrowth",
+     "grossMargins", "operatingMargins", "trailingPE", "forwardPE", "priceToSalesTrailing12Months",
+     "country"],
+    # 3: Business Model & Revenue Drivers
+    ["longBusinessSummary", "sector", "industry", "totalRevenue", "revenueGrowth", "grossMargins",
+     "operatingMargins", "website"],
+    # 4: Financial Performance & Projections + Investment Thesis
+    ["totalRevenue", "revenueGrowth", "ebitda", "netIncomeToCommon", "earningsGrowth",
+     "grossMargins", "operatingMargins", "profitMargins", "freeCashflow", "operatingCashflow",
+     "marketCap", "enterpriseValue", "trailingPE", "forwardPE", "priceToSalesTrailing12Months",
+     "beta", "recommendationKey", "recommendationMean", "numberOfAnalystOpinions",
+     "dividendRate", "dividendYield", "payoutRatio"],
+    # 5: Risk Factors, Transaction Terms & Appendices
+    ["marketCap", "enterpriseValue", "beta", "debtToEquity", "currentRatio", "quickRatio",
+     "freeCashflow", "profitMargins", "recommendationKey", "heldPercentInsiders",
+     "heldPercentInstitutions"],
+]
+
+# Per-section limits: tokens for the whole user prompt, and max_tokens for the reply
+SECTION_INPUT_BUDGET = [1400, 900, 1000, 1100, 900]
+SECTION_OUTPUT_BUDGET = [4000, 3500, 3000, 4000, 3500]
+# Seconds each section's GPT call may take, retries included (see llm.stream_chat)
+SECTION_DEADLINE = [150, 120, 120, 150, 120]
+
+
+def count_tokens(text: str) -> int:
+    """Count (or, without tiktoken, estimate) the tokens in `text`."""
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    # Roughly one token per word or punctuation mark, and never fewer than chars/4
+    pieces = len(re.findall(r"\w+|[^\w\s]", text))
+    return max(pieces, math.ceil(len(text) / 4))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Cut `text` at a word boundary so it stays within `max_tokens`."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    words = text.split()
+    low, high = 0, len(words)
+    while low < high:  # Longest word prefix that fits
+        middle = (low + high + 1) // 2
+        if count_tokens(" ".join(words[:middle])) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return " ".join(words[:low]) + " ..."
+
+
+def format_compact_number(value: float) -> str:
+    for threshold, suffix in ((1e12, "T"), (1e9, "B"), (1e6, "M"), (1e3, "K")):
+        if abs(value) >= threshold:
+            return f"{value / threshold:.1f}{suffix}"
+    return f"{value:,.2f}".rstrip("0").rstrip(".")
+
+
+def format_value(key: str, value) -> Optional[str]:
+    """Render one Yahoo field compactly, or None if it carries no information."""
+    if value is None or value == "" or value == []:
+        return None
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if key == "companyOfficers":
+        officers = []
+        for officer in value[:MAX_OFFICERS]:
+            name = officer.get("name")
+            if name:
+                title = officer.get("title")
+                officers.append(f"{name} ({title})" if title else name)
+        return "; ".join(officers) or None
+    if key == "longBusinessSummary":
+        text = " ".join(str(value).split())
+        if len(text) > SUMMARY_MAX_CHARS:
+            text = text[:SUMMARY_MAX_CHARS].rsplit(" ", 1)[0] + "..."
+        return text
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return str(value)
+    if key in PERCENT_KEYS:
+        return f"{value * 100:.1f}%"
+    if key in PERCENT_POINT_KEYS:
+        return f"{value:.2f}%"
+    if key in LARGE_NUMBER_KEYS:
+        return format_compact_number(value)
+    if isinstance(value, float):
+        return f"{value:.2f}"
+    return str(value)
+
+
+def build_finance_summary(financial_data: Dict, keys: Optional[Iterable[str]] = None) -> str:
+    """One `- key: value` line per non-empty field, in `keys` order."""
+    keys = financial_data.keys() if keys is None else keys
+    lines = []
+    for key in keys:
+        formatted = format_value(key, financial_data.get(key))
+        if formatted is not None:
+            lines.append(f"- {key}: {formatted}")
+    return "\n".join(lines)
+
+
+def fit_prompt(render, financial_data: Dict, keys: List[str], budget: int) -> str:
+    """Render `render(finance_summary)` with as many of `keys` as fit in `budget` tokens.
+
+    Keys are dropped from the end of the list, so callers order them by
+    importance. If the prompt is still too long with no data at all, it is
+    returned as is; the fixed instructions are never cut.
+    """
+    keys = [key for key in keys if format_value(key, financial_data.get(key)) is not None]
+    while True:
+        prompt = render(build_finance_summary(financial_data, keys))
+        if not keys or count_tokens(prompt) <= budget:
+            return prompt
+        keys = keys[:-1]
@@ -0,0 +1,188 @@
+"""Token-bucket rate limiters shared by every session, thread and process.
+
+Each limiter hands out send times (GCRA, i.e. a token bucket expressed as
+a "theoretical arrival time"). The state lives in a small SQLite file, so
+the Streamlit server and batch jobs on the same machine draw from the
+same budget. A 429 pauses the whole bucket for its Retry-After, and
+callers sleep outside any lock until their own slot comes up.
+"""
+import email.utils
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+STATE_PATH = os.getenv("RATE_LIMIT_STATE_PATH", os.path.join(".cache", "rate_limits.sqlite3"))
+
+# name -> (requests per second, burst size); override with e.g. YFINANCE_RATE=1 YFINANCE_BURST=3
+DEFAULT_LIMITS = {
+    "yfinance": (2.0, 12),  # Burst covers a memo plus ten peers fetched at once
+    "openai": (5.0, 10),
+}
+
+
+class RateLimitTimeout(Exception):
+    """The wait for a slot would exceed the caller's max_wait."""
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    """Full-jitter exponential backoff, so retries from many callers spread out."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def retry_after_seconds(headers) -> Optional[float]:
+    """Parse a Retry-After header (seconds or HTTP date) from a headers mapping."""
+    if not headers:
+        return None
+    value = headers.get("Retry-After") or headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    def __init__(self, name: str, rate: float, burst: int = 1, state_path: Optional[str] = STATE_PATH):
+        self.name = name
+        self.interval = 1.0 / rate
+        self.burst = max(1, burst)
+        self.state_path = state_path
+        self._lock = threading.Lock()
+        # In-process state, used when state_path is None
+        self._tat = 0.0
+        self._paused_until = 0.0
+        # Metrics for this process
+        self.waiting = 0
+        self.acquired = 0
+        self.throttled = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        if state_path:
+            directory = os.path.dirname(state_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(state_path, check_same_thread=False, timeout=30,
+                                         isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tat REAL, paused_until REAL)"
+            )
+            self._conn.execute("INSERT OR IGNORE INTO buckets VALUES (?, 0, 0)", (name,))
+
+    def _reserve(self, now: float, max_wait: Optional[float]) -> float:
+        """Book the next send slot and return it (wall-clock seconds)."""
+        tolerance = (self.burst - 1) * self.interval
+        with self._lock:
+            if self.state_path:
+                self._conn.execute("BEGIN IMMEDIATE")  # Serializes against other processes
+                try:
+                    tat, paused_until = self._conn.execute(
+                        "SELECT tat, paused_until FROM buckets WHERE name = ?", (self.name,)
+                    ).fetchone()
+                    slot = max(now, tat - tolerance, paused_until)
+                    if max_wait is not None and slot - now > max_wait:
+                        raise RateLimitTimeout(f"{self.name}: next slot in {slot - now:.1f}s")
+                    self._conn.execute("UPDATE buckets SET tat = ? WHERE name = ?",
+                                       (max(tat, slot) + self.interval, self.name))
+                    self._conn.execute("COMMIT")
+                except BaseException:
+                    self._conn.execute("ROLLBACK")
+                    raise
+            else:
+                slot = max(now, self._tat - tolerance, self._paused_until)
+                if max_wait is not None and slot - now > max_wait:
+                    raise RateLimitTimeout(f"{self.name}: next slot in {slot - now:.1f}s")
+                self._tat = max(self._tat, slot) + self.interval
+        return slot
+
+    def _paused(self) -> float:
+        with self._lock:
+            if not self.state_path:
+                return self._paused_until
+            return self._conn.execute(
+                "SELECT paused_until FROM buckets WHERE name = ?", (self.name,)
+            ).fetchone()[0]
+
+    def acquire(self, max_wait: Optional[float] = None) -> float:
+        """Wait for a send slot and return the seconds waited.
+
+        With `max_wait`, raises RateLimitTimeout instead of queueing when the
+        slot is further away, so an interactive caller can give up early.
+        """
+        start = time.time()
+        slot = self._reserve(start, max_wait)
+        with self._lock:
+            self.waiting += 1
+        try:
+            while True:
+                delay = slot - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                # A 429 seen by someone else after we booked: queue up again
+                # behind the pause, spaced out rather than all at once
+                now = time.time()
+                if self._paused() <= now:
+                    break
+                slot = self._reserve(now, None)
+        finally:
+            waited = time.time() - start
+            with self._lock:
+                self.waiting -= 1
+                self.acquired += 1
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+        return waited
+
+    def pause(self, seconds: float) -> None:
+        """Hold every caller of this bucket back, e.g. for a 429's Retry-After."""
+        until = time.time() + seconds
+        with self._lock:
+            self.throttled += 1
+            if self.state_path:
+                self._conn.execute(
+                    "UPDATE buckets SET paused_until = MAX(paused_until, ?) WHERE name = ?",
+                    (until, self.name),
+                )
+            else:
+                self._paused_until = max(self._paused_until, until)
+        print(f"[INFO] {self.name} rate limited; pausing for {seconds:.1f} seconds.")
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "name": self.name,
+                "queue_depth": self.waiting,
+                "acquired": self.acquired,
+                "throttled": self.throttled,
+                "avg_wait": self.total_wait / self.acquired if self.acquired else 0.0,
+                "max_wait": self.max_wait,
+            }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(name: str) -> TokenBucket:
+    """Process-wide limiter for `name` ("yfinance" or "openai")."""
+    with _limiters_lock:
+        if name not in _limiters:
+            rate, burst = DEFAULT_LIMITS.get(name, (1.0, 1))
+            rate = float(os.getenv(f"{name.upper()}_RATE", rate))
+            burst = int(os.getenv(f"{name.upper()}_BURST", burst))
+            _limiters[name] = TokenBucket(name, rate, burst)
+        return _limiters[name]
+
+
+def all_metrics() -> list:
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return [limiter.metrics() for limiter in limiters]
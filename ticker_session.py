@@ -0,0 +1,89 @@
+import contextvars
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+import yfinance as yf
+
+from http_pool import get_http_session
+from price_store import PriceHistory, get_price_store
+from rate_limit import get_limiter
+from tracing import span
+
+PREFETCH_WORKERS = 4
+
+_prefetch_pool = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="ticker-prefetch")
+
+
+class TickerData:
+    """One `yf.Ticker` per memo: `.info` and each history period are fetched at most once.
+
+    The Ticker rides on the shared keep-alive session from http_pool.py, and
+    history can be prefetched in the background while the GPT sections are
+    being written.
+    History comes from the local price store (price_store.py), which only
+    downloads the bars it does not have yet.
+    """
+
+    def __init__(self, ticker_symbol: str, session: requests.Session = None):
+        self.ticker_symbol = ticker_symbol
+        self.ticker = yf.Ticker(ticker_symbol, session=session or get_http_session("yahoo"))
+        self._lock = threading.Lock()
+        self._info = None
+        self._income_stmt = None
+        self._history = {}  # period -> Future[PriceHistory]
+
+    def info(self) -> dict:
+        """Raw `Ticker.info`; HTTP errors propagate so callers can handle 429s."""
+        with self._lock:
+            if self._info is not None:
+                return self._info
+        get_limiter("yfinance").acquire()
+        info = self.ticker.info
+        with self._lock:
+            self._info = info
+        return info
+
+    def income_statement(self):
+        """Raw annual `Ticker.income_stmt` (line items x fiscal years)."""
+        with self._lock:
+            if self._income_stmt is not None:
+                return self._income_stmt
+        get_limiter("yfinance").acquire()
+        income_stmt = self.ticker.income_stmt
+        with self._lock:
+            self._income_stmt = income_stmt
+        return income_stmt
+
+    def _history_future(self, period: str) -> Future:
+        with self._lock:
+            future = self._history.get(period)
+            if future is None:
+                future = _prefetch_pool.submit(contextvars.copy_context().run, self._fetch_history, period)
+                self._history[period] = future
+            return future
+
+    def _download(self, **kwargs):
+        """`Ticker.history(**kwargs)` behind the Yahoo rate limiter; called only for bars not stored yet."""
+        get_limiter("yfinance").acquire()
+        with span("fetch.history.download", ticker=self.ticker_symbol, **kwargs) as download_span:
+            df = self.ticker.history(**kwargs)
+            download_span.set(rows=len(df))
+        return df
+
+    def _fetch_history(self, period: str) -> PriceHistory:
+        with span("fetch.history", ticker=self.ticker_symbol, period=period) as history_span:
+            start_time = time.time()
+            history = get_price_store().history(self.ticker_symbol, period, fetch=self._download)
+            history_span.set(rows=len(history))
+        print(f"[INFO] Price history ({period}) for {self.ticker_symbol} took {time.time() - start_time:.2f} seconds.")
+        return history
+
+    def prefetch_history(self, period: str = "1y") -> None:
+        """Start downloading price history without waiting for it."""
+        self._history_future(period)
+
+    def history(self, period: str = "1y") -> PriceHistory:
+        """Price history for `period`, reusing a prefetch or earlier call."""
+        return self._history_future(period).result()
@@ -0,0 +1,216 @@
+"""Per-stage spans for the memo pipeline, exported as JSONL.
+
+    with start_trace("memo", ticker="AAPL") as trace:
+        with span("fetch", ticker="AAPL") as s:
+            ...
+            s.set(cache_hit=True, bytes=1234)
+
+The current trace and span live in context variables, so nested spans get
+their parent automatically. Worker threads do not inherit them: submit work
+with `contextvars.copy_context().run` (as the orchestrator does) or pass the
+trace along and use `Trace.record`. Finished traces are appended to
+TRACE_PATH, one JSON object per memo.
+"""
+import contextvars
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Optional
+
+TRACE_PATH = os.getenv("MEMO_TRACE_PATH", os.path.join(".cache", "traces.jsonl"))
+
+_current_trace = contextvars.ContextVar("memo_trace", default=None)
+_current_span = contextvars.ContextVar("memo_span", default=None)
+_export_lock = threading.Lock()
+
+
+class Span:
+    def __init__(self, trace: "Trace", span_id: int, name: str, parent: Optional[int], attrs: dict):
+        self.trace = trace
+        self.span_id = span_id
+        self.name = name
+        self.parent = parent
+        self.attrs = attrs
+        self.thread = threading.current_thread().name
+        self.start = time.perf_counter()
+        self.end = None
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.span_id,
+            "parent": self.parent,
+            "name": self.name,
+            "start": round(self.start - self.trace.start, 6),
+            "duration": round(self.duration, 6),
+            "thread": self.thread,
+            "attrs": self.attrs,
+        }
+
+
+class Trace:
+    def __init__(self, name: str, **attrs):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attrs = attrs
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.end = None
+        self.spans = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def open_span(self, name: str, parent: Optional[int] = None, **attrs) -> Span:
+        new_span = Span(self, next(self._ids), name, parent, attrs)
+        with self._lock:
+            self.spans.append(new_span)
+        return new_span
+
+    def record(self, name: str, start: float, end: float, parent: Optional[int] = None, **attrs) -> Span:
+        """Add an already finished span; `start`/`end` are `time.perf_counter()` values."""
+        new_span = self.open_span(name, parent, **attrs)
+        new_span.start, new_span.end = start, end
+        return new_span
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def stage_totals(self) -> dict:
+        """Seconds per stage (the span name up to the first dot), summed over spans.
+
+        A span nested in a span of the same stage is not counted twice.
+        """
+        with self._lock:
+            spans = list(self.spans)
+        stages = {item.span_id: item.name.split(".", 1)[0] for item in spans}
+        totals = {}
+        for item in spans:
+            stage = stages[item.span_id]
+            if item.parent is not None and stages.get(item.parent) == stage:
+                continue
+            totals[stage] = totals.get(stage, 0.0) + item.duration
+        return totals
+
+    def rows(self) -> list:
+        """Spans as dicts in start order, for tables and waterfall charts."""
+        with self._lock:
+            spans = list(self.spans)
+        return sorted((item.to_dict() for item in spans), key=lambda row: row["start"])
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started_at)),
+            "duration": round(self.duration, 6),
+            "attrs": self.attrs,
+            "stages": {stage: round(seconds, 6) for stage, seconds in self.stage_totals().items()},
+            "spans": self.rows(),
+        }
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Time the block as a child of the current span; a no-op outside a trace."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield Span(Trace(name), 0, name, None, attrs)  # Detached, so `.set()` still works
+        return
+    parent = _current_span.get()
+    new_span = trace.open_span(name, parent.span_id if parent is not None else None, **attrs)
+    token = _current_span.set(new_span)
+    try:
+        yield new_span
+    except BaseException as e:
+        new_span.set(error=f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        new_span.end = time.perf_counter()
+        _current_span.reset(token)
+
+
+def export_trace(trace: Trace, path: str = TRACE_PATH) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    line = json.dumps(trace.to_dict(), default=str)
+    with _export_lock, open(path, "a", encoding="utf-8") as f:
+        f.write(line + "\n")
+
+
+@contextmanager
+def start_trace(name: str, export: bool = True, **attrs):
+    """Make a new Trace current for the block and append it to TRACE_PATH afterwards."""
+    trace = Trace(name, **attrs)
+    trace_token = _current_trace.set(trace)
+    span_token = _current_span.set(None)
+    try:
+        yield trace
+    except BaseException as e:
+        trace.attrs["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        trace.end = time.perf_counter()
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+        if export:
+            try:
+                export_trace(trace)
+            except OSError as e:
+                print(f"[WARN] Could not write trace: {e}")
+
+
+def load_traces(path: str = TRACE_PATH) -> list:
+    """Every exported trace, oldest first."""
+    if not os.path.exists(path):
+        return []
+    traces = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                traces.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue  # Half-written line from a killed run
+    return traces
+
+
+def waterfall_chart(trace: Trace):
+    """Altair Gantt-style chart of the trace's spans, one bar per span in start order."""
+    import altair as alt
+    import pandas as pd
+
+    rows = trace.rows()
+    for order, row in enumerate(rows):
+        row["label"] = f"{order + 1:02d} {row['name']}"
+        row["end"] = row["start"] + row["duration"]
+        row["stage"] = row["name"].split(".", 1)[0]
+        row["details"] = ", ".join(f"{key}={value}" for key, value in row.pop("attrs").items())
+    df = pd.DataFrame(rows)
+    if df.empty:
+        return alt.Chart(pd.DataFrame({"start": []})).mark_bar()
+    return alt.Chart(df).mark_bar().encode(
+        x=alt.X("start:Q", title="Seconds since start"),
+        x2="end:Q",
+        y=alt.Y("label:N", sort=None, title=None),
+        color=alt.Color("stage:N", title="Stage"),
+        tooltip=["name", alt.Tooltip("duration:Q", format=".3f"), "thread", "details"],
+    ).properties(height=max(120, 22 * len(df)))
@@ -0,0 +1,55 @@
+"""Process pools for CPU-heavy rendering that do not re-run the page script.
+
+spawn-started children re-import `__main__` from its file before running
+any task. Under Streamlit that module is the page script itself (yahoo.py
+would redraw its whole UI in every worker), and under batch.py it drags in
+the full pipeline. The workers here only run functions from importable
+modules, so `__main__` is hidden while they start, and all of them are
+started up front so none is spawned later outside that window.
+"""
+import contextlib
+import multiprocessing
+import os
+import resource
+import sys
+import threading
+import types
+from concurrent.futures import ProcessPoolExecutor
+
+_main_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def _hidden_main():
+    with _main_lock:
+        main = sys.modules.get("__main__")
+        sys.modules["__main__"] = types.ModuleType("__main__")
+        try:
+            yield
+        finally:
+            sys.modules["__main__"] = main
+
+
+def current_rss_bytes() -> int:
+    """Resident set size of this process right now."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # No /proc: fall back to the lifetime peak (KB on Linux)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def start_process_pool(workers: int, initializer=None, initargs=()) -> ProcessPoolExecutor:
+    # spawn, not fork: forking a process full of threads can deadlock the child
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=initializer,
+        initargs=initargs,
+    )
+    with _hidden_main():
+        # Each submit spawns a worker while none is idle yet, so this starts all of them
+        for _ in range(workers):
+            pool.submit(os.getpid)
+    return pool
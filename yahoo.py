@@ -1,11 +1,16 @@
 import streamlit as st
-import requests
-import openai
-import base64
-import weasyprint
-import markdown2
-import yfinance as yf
 import time  # <-- For measuring timing
+from jobs import DONE, FAILED, get_job_queue
+from llm_cache import get_cache
+from market_cache import get_market_cache
+from page_resources import load_image_as_base64, warm_up
+from pdf_service import get_pdf_service
+from prompt_builder import build_finance_summary
+from tracing import span, start_trace, waterfall_chart
+
+# Imported inside the job functions (openai, yfinance and pandas), so drawing
+# the form never waits for them; warm_up loads them once the form is up
+JOB_MODULES = ["llm", "ticker_session", "markdown2"]
 
 ## put in peer companies 
 # Optional: Set page config
@@ -15,13 +20,6 @@ st.set_page_config(
     initial_sidebar_state="auto"
 )
 
-# ----- FUNCTION TO CONVERT LOCAL IMAGE TO BASE64 -----
-def load_image_as_base64(image_path: str) -> str:
-    """Encodes the local image as a base64 string."""
-    with open(image_path, "rb") as img_file:
-        encoded_string = base64.b64encode(img_file.read()).decode()
-    return encoded_string
-
 st.markdown(
     """
     <style>
@@ -62,7 +60,7 @@ st.markdown(
     unsafe_allow_html=True
 )
 
-logo_base64 = load_image_as_base64("uncharted_logo.png")
+logo_base64 = load_image_as_base64("uncharted_logo.png", max_width=120)  # Shown 60px wide
 
 st.markdown(f"""
 <div class="logo-container">
@@ -81,6 +79,8 @@ st.markdown(f"""
 company_name = st.text_input("Company Name (e.g. Apple Inc.)", "")
 ticker_symbol = st.text_input("Ticker Symbol (e.g. AAPL, TSLA)", "")
 details = st.text_area("Additional Details", "")
+stream_output = st.checkbox("Stream the memo as it is written", value=True)
+bypass_cache = st.checkbox("Bypass cache (always call GPT)", value=False)
 
 # Relevant keys for our memo
 RELEVANT_KEYS = [
@@ -97,9 +97,24 @@ RELEVANT_KEYS = [
 
 def fetch_yfinance_data(ticker_symbol):
     """Fetch key financial info via yfinance and return a dict with relevant data."""
+    # Served from the shared on-disk cache; expired entries refresh in the background
+    fetched = []
+
+    def fetch():
+        fetched.append(True)
+        return fetch_yfinance_data_uncached(ticker_symbol)
+
+    with span("fetch", ticker=ticker_symbol) as fetch_span:
+        data = get_market_cache().get(ticker_symbol, RELEVANT_KEYS, fetch)
+        fetch_span.set(cache_hit=not fetched)
+    return data
+
+def fetch_yfinance_data_uncached(ticker_symbol):
+    from ticker_session import TickerData
+
     start_time = time.time()
-    ticker_data = yf.Ticker(ticker_symbol)
-    raw_info = ticker_data.info
+    ticker_data = TickerData(ticker_symbol)  # Pooled connection, shared rate limit
+    raw_info = ticker_data.info()
     # Extract only the fields we care about
     memo_data = { key: raw_info.get(key, None) for key in RELEVANT_KEYS }
     # End time for data fetch
@@ -115,12 +130,8 @@ def create_investment_memorandum_prompt(company_name, user_details, financial_da
         "Stay direct and confident. Do not use adverbs."
     )
 
-    # Convert the financial_data dict into a bullet-list or short summary for GPT
-    finance_bullets = []
-    for k, v in financial_data.items():
-        finance_bullets.append(f"- **{k}**: {v}")
-
-    finance_summary = "\n".join(finance_bullets)
+    # Convert the financial_data dict into a compact bullet list for GPT (empty fields dropped)
+    finance_summary = build_finance_summary(financial_data)
 
     base_outline = f"""
 You are a domain expert tasked with writing an investment memorandum for '{company_name}'.
@@ -190,57 +201,62 @@ Return a cohesive, final investment memorandum in one response, entirely in Mark
 """
     return base_outline
 
-def ask_gpt4(prompt_text):
+# Seconds the whole-memo GPT call may take, retries included
+GPT_DEADLINE = 300
+
+ASK_GPT4_SYSTEM_PROMPT = (
+    "You are a seasoned financial analyst and domain expert. "
+    "Write a thorough investment memorandum following the user's outline, style instructions, "
+    "and the provided financial data."
+)
+
+def ask_gpt4(prompt_text, on_text=None, use_cache=True):
+    """Return the memo markdown; streams into `on_text(text_so_far, stats)` when given.
+
+    Raises llm.LLMError when GPT fails after its retries or misses
+    GPT_DEADLINE, so an error message never ends up in the PDF.
+    """
+    from llm import chat_completion
+
     start_time = time.time()
-    try:
-        response = openai.ChatCompletion.create(
-            model="chatgpt-4o-latest",
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        "You are a seasoned financial analyst and domain expert. "
-                        "Write a thorough investment memorandum following the user's outline, style instructions, "
-                        "and the provided financial data."
-                    )
-                },
-                {
-                    "role": "user",
-                    "content": prompt_text
-                }
-            ],
-            temperature=0.7,
-            max_tokens=6000
-        )
-        gpt_content = response["choices"][0]["message"]["content"]
-    except Exception as e:
-        gpt_content = f"Error: {e}"
+    gpt_content, _ = chat_completion(
+        ASK_GPT4_SYSTEM_PROMPT, prompt_text, on_text=on_text,
+        model="chatgpt-4o-latest", temperature=0.7, max_tokens=6000, use_cache=use_cache,
+        deadline=GPT_DEADLINE
+    )
 
     elapsed = time.time() - start_time
     print(f"[INFO] GPT generation took {elapsed:.2f} seconds.")
     return gpt_content
 
-# ----- BUTTON -----
-if st.button("Generate"):
-    if not company_name.strip():
-        st.warning("Please provide the Company Name.")
-    elif not ticker_symbol.strip():
-        st.warning("Please provide a Ticker Symbol.")
-    else:
+# ----- BACKGROUND JOB -----
+def run_yahoo_job(job, company_name, ticker_symbol, details, use_cache=True):
+    """Fetch, write and render one memo off the page thread; the page only polls the job."""
+    import markdown2
+
+    with start_trace("memo", ticker=ticker_symbol, company=company_name, source="yahoo", job=job.job_id) as trace:
+        job.live["trace"] = trace
         # 1. Fetch data from yfinance
         financial_data = fetch_yfinance_data(ticker_symbol)
+        job.check_cancelled()
 
         # 2. Build the GPT prompt (including the yfinance data)
         prompt = create_investment_memorandum_prompt(company_name, details, financial_data, ticker_symbol)
 
-        # 3. Call GPT
-        gpt_markdown = ask_gpt4(prompt)
+        # 3. Call GPT, keeping the text so far on the job for the page to draw
+        def on_text(text, stats):
+            job.check_cancelled()
+            job.live["stats"] = stats
+            job.set_section(0, "writing", text)
 
-        # 4. Display in Streamlit
-        st.markdown(gpt_markdown)
+        gpt_markdown = ask_gpt4(prompt, on_text=on_text, use_cache=use_cache)
+        job.check_cancelled()
+        job.set_section(0, DONE, gpt_markdown)
 
-        # 5. Convert Markdown to HTML
-        html_content = markdown2.markdown(gpt_markdown)
+        # 4. Convert Markdown to HTML
+        with span("markdown_to_html", input_bytes=len(gpt_markdown.encode("utf-8"))) as html_span:
+            html_content = markdown2.markdown(gpt_markdown)
+            html_span.set(output_bytes=len(html_content.encode("utf-8")))
 
         # OPTIONAL: add extra CSS to style PDF
         custom_css = """
@@ -257,13 +273,68 @@ if st.button("Generate"):
 
         full_html = f"<!DOCTYPE html><html><head>{custom_css}</head><body>{html_content}</body></html>"
 
-        # 6. Convert HTML -> PDF (WeasyPrint)
-        pdf_data = weasyprint.HTML(string=full_html).write_pdf()
+        # 5. Convert HTML -> PDF (WeasyPrint, in the warmed worker pool)
+        with span("pdf", html_bytes=len(full_html)) as pdf_span:
+            pdf_result = get_pdf_service().submit(full_html).result()
+            pdf_span.set(bytes=len(pdf_result.data), render_seconds=round(pdf_result.render_seconds, 4),
+                         peak_rss_mb=round(pdf_result.peak_rss_mb, 1))
+        print(f"[INFO] PDF render took {pdf_result.render_seconds:.2f} seconds "
+              f"(peak RSS {pdf_result.peak_rss_mb:.0f} MB).")
+
+    return {"markdown": gpt_markdown, "pdf": pdf_result.data}
 
-        # 7. Provide download button for the PDF
-        st.download_button(
-            label="Download PDF",
-            data=pdf_data,
-            file_name="investment_memorandum.pdf",
-            mime="application/pdf"
+# ----- BUTTON -----
+warm_up(*JOB_MODULES)
+job_queue = get_job_queue()
+if st.button("Generate"):
+    if not company_name.strip():
+        st.warning("Please provide the Company Name.")
+    elif not ticker_symbol.strip():
+        st.warning("Please provide a Ticker Symbol.")
+    else:
+        # Runs in the background; reruns (e.g. the download click) only poll it
+        st.session_state["job_id"] = job_queue.submit(
+            "yahoo", run_yahoo_job, sections=1, company_name=company_name,
+            ticker_symbol=ticker_symbol, details=details, use_cache=not bypass_cache
+        )
+
+job = job_queue.get(st.session_state["job_id"]) if st.session_state.get("job_id") else None
+if job is not None and not job.finished:
+    partial = job.progress()[0]["text"]
+    if stream_output and partial:
+        st.markdown(partial)
+    else:
+        st.caption(f"Writing the memo ({job.elapsed:.0f}s)...")
+    if st.button("Cancel"):
+        job_queue.cancel(job.job_id)
+    time.sleep(0.5)
+    st.rerun()
+elif job is not None and job.status == DONE:
+    gpt_markdown = job.result["markdown"]
+    st.markdown(gpt_markdown)
+    stats = job.live.get("stats")
+    if stats is not None:
+        st.caption(
+            f"First token after {stats.ttft or 0.0:.2f}s, "
+            f"{stats.tokens_per_sec:.1f} tokens/sec, {stats.elapsed:.2f}s total."
         )
+    cache_stats = get_cache().stats()
+    st.caption(f"GPT cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses.")
+
+    # Provide download button for the PDF
+    st.download_button(
+        label="Download PDF",
+        data=job.result["pdf"],
+        file_name="investment_memorandum.pdf",
+        mime="application/pdf"
+    )
+
+    trace = job.live.get("trace")
+    if trace is not None:
+        with st.expander("Pipeline trace"):
+            st.altair_chart(waterfall_chart(trace), use_container_width=True)
+            st.caption(f"Total {trace.duration:.1f}s; trace {trace.trace_id} saved to the trace log.")
+elif job is not None and job.status == FAILED:
+    st.error(job.error)
+elif job is not None:
+    st.info(f"Generation {job.status}.")